@@ -0,0 +1,129 @@
+"""
+آزمون بار ثبت‌نام همزمان: روش قبلی (شمارش و سپس درج، دو commit) در برابر رزرو اتمیک صندلی
+
+۵۰۰ ثبت‌نام همزمان از کاربران متفاوت روی یک رویداد با ظرفیت محدود اجرا می‌شود و
+تعداد ثبت‌نام‌های بیش از ظرفیت و نرخ درخواست در ثانیه گزارش می‌شود.
+روی همان دیتابیس MySQL برنامه اجرا می‌شود و داده‌های آزمایشی در پایان حذف می‌شوند:
+    python benchmarks/registration_load.py
+"""
+import os
+import sys
+import time
+import uuid
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from fastapi import HTTPException  # noqa: E402
+
+CONCURRENT_REGISTRATIONS = int(os.getenv("BENCH_REGISTRATIONS", "500"))
+EVENT_CAPACITY = int(os.getenv("BENCH_CAPACITY", "100"))
+WORKERS = int(os.getenv("BENCH_WORKERS", "64"))
+
+def register_legacy(db, event_id: int, user) -> bool:
+    """روش قبلی: COUNT روی شرکت‌کنندگان، درج و نوتیفیکیشن با دو commit جدا"""
+    event = db.query(main.Event).filter(main.Event.id == event_id).first()
+    existing = db.query(main.EventParticipant).filter(
+        main.EventParticipant.event_id == event_id,
+        main.EventParticipant.user_id == user.id
+    ).first()
+    if existing:
+        return False
+    current_participants = db.query(main.EventParticipant).filter(main.EventParticipant.event_id == event_id).count()
+    if current_participants >= event.capacity:
+        return False
+    registration = main.EventParticipant(event_id=event_id, user_id=user.id)
+    db.add(registration)
+    db.commit()
+    db.refresh(registration)
+    db.add(main.Notification(user_id=user.id, title="ثبت‌نام موفق", message=event.title, type="success"))
+    db.commit()
+    return True
+
+def register_atomic(db, event_id: int, user) -> bool:
+    """روش جدید: همان endpoint برنامه"""
+    try:
+        result = asyncio.run(main.register_for_event(event_id, current_user=user, db=db))
+        # پاسخ 202 یعنی ورود به لیست انتظار
+        return not isinstance(result, main.JSONResponse)
+    except HTTPException:
+        return False
+
+def create_fixture(count: int):
+    db = main.SessionLocal()
+    try:
+        tag = uuid.uuid4().hex[:8]
+        users = [
+            main.User(
+                first_name="بار", last_name=str(i), email=f"load-{tag}-{i}@example.com",
+                phone_number=f"9{tag[:4]}{i:05d}"[:15], password="-", country="iran",
+                province="تهران", city="تهران", gender="male"
+            )
+            for i in range(count)
+        ]
+        db.add_all(users)
+        db.flush()
+        event = main.Event(
+            title=f"آزمون بار {tag}", time=main.datetime.utcnow(), location="تهران",
+            latitude=35.6892, longitude=51.3890, host="بنچمارک", creator=users[0].id,
+            capacity=EVENT_CAPACITY
+        )
+        db.add(event)
+        db.commit()
+        return event.id, [user.id for user in users]
+    finally:
+        db.close()
+
+def drop_fixture(event_id: int, user_ids):
+    db = main.SessionLocal()
+    try:
+        db.query(main.Notification).filter(main.Notification.user_id.in_(user_ids)).delete(synchronize_session=False)
+        db.query(main.EventParticipant).filter(main.EventParticipant.event_id == event_id).delete(synchronize_session=False)
+        db.query(main.EventWaitlist).filter(main.EventWaitlist.event_id == event_id).delete(synchronize_session=False)
+        db.query(main.EventStats).filter(main.EventStats.event_id == event_id).delete(synchronize_session=False)
+        db.query(main.Event).filter(main.Event.id == event_id).delete(synchronize_session=False)
+        db.query(main.User).filter(main.User.id.in_(user_ids)).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+def run_method(method):
+    event_id, user_ids = create_fixture(CONCURRENT_REGISTRATIONS)
+    try:
+        def attempt(user_id: int) -> bool:
+            db = main.SessionLocal()
+            try:
+                user = db.query(main.User).filter(main.User.id == user_id).first()
+                return method(db, event_id, user)
+            except Exception:
+                db.rollback()
+                return False
+            finally:
+                db.close()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+            accepted = sum(pool.map(attempt, user_ids))
+        elapsed = time.perf_counter() - start
+
+        db = main.SessionLocal()
+        try:
+            stored = db.query(main.EventParticipant).filter(main.EventParticipant.event_id == event_id).count()
+        finally:
+            db.close()
+        return accepted, stored, CONCURRENT_REGISTRATIONS / elapsed
+    finally:
+        drop_fixture(event_id, user_ids)
+
+def run():
+    print(f"{CONCURRENT_REGISTRATIONS} ثبت‌نام همزمان، ظرفیت {EVENT_CAPACITY}، {WORKERS} نخ")
+    print(f"{'method':>8} {'accepted':>9} {'stored':>7} {'oversold':>9} {'req/s':>8}")
+    for name, method in (("legacy", register_legacy), ("atomic", register_atomic)):
+        accepted, stored, rate = run_method(method)
+        oversold = max(stored - EVENT_CAPACITY, 0)
+        print(f"{name:>8} {accepted:>9} {stored:>7} {oversold:>9} {rate:>8.1f}")
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,95 @@
+"""
+بنچمارک ساخت نوبت‌های سری تکراری: درج تک‌به‌تک با ORM در برابر INSERT چندردیفی
+
+اجرا روی همان دیتابیس MySQL برنامه (همه تغییرات در پایان rollback می‌شوند):
+    python benchmarks/series_insert.py
+"""
+import os
+import sys
+import json
+import time
+
+os.environ.setdefault("MANAREH_MAX_SERIES_OCCURRENCES", "1000")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+OCCURRENCE_COUNTS = [52, 365, 1000]
+
+def make_series(db, creator_id: int, count: int) -> main.EventSeries:
+    template = {
+        "title": "بنچمارک سری",
+        "location": "تهران",
+        "latitude": 35.6892,
+        "longitude": 51.3890,
+        "host": "بنچمارک",
+        "creator": creator_id,
+        "type": "religious",
+        "category": "مذهبی",
+        "subcategory": "",
+        "city": "تهران",
+        "province": "تهران",
+        "country": "iran",
+        "capacity": 100,
+        "is_free": True,
+        "price": 0.0
+    }
+    series = main.EventSeries(
+        creator=creator_id,
+        template=json.dumps(template, ensure_ascii=False),
+        freq="daily",
+        repeat_interval=1,
+        dtstart=main.datetime.utcnow(),
+        occurrence_count=count
+    )
+    db.add(series)
+    db.flush()
+    return series
+
+def insert_per_row(db, series: main.EventSeries) -> int:
+    """روش قبلی: add + flush برای هر نوبت و سپس refresh همه ردیف‌ها"""
+    template = json.loads(series.template)
+    created = []
+    for occurrence in main.iter_series_occurrences(series):
+        event_obj = main.build_event_row(template, occurrence, series.id)
+        db.add(event_obj)
+        db.flush()
+        created.append(event_obj)
+    for event_obj in created:
+        db.refresh(event_obj)
+    return len(created)
+
+def insert_bulk(db, series: main.EventSeries) -> int:
+    """روش جدید: یک INSERT چندردیفی"""
+    return main.materialize_series(db, series, main.SERIES_END_OF_TIME)
+
+def run():
+    db = main.SessionLocal()
+    try:
+        creator = db.query(main.User.id).first()
+    finally:
+        db.close()
+
+    if not creator:
+        print("برای اجرای بنچمارک حداقل یک کاربر در دیتابیس لازم است")
+        return
+
+    print(f"{'occurrences':>12} {'per-row (s)':>12} {'bulk (s)':>10} {'speedup':>8}")
+    for count in OCCURRENCE_COUNTS:
+        timings = {}
+        for name, method in (("per_row", insert_per_row), ("bulk", insert_bulk)):
+            db = main.SessionLocal()
+            try:
+                series = make_series(db, creator.id, count)
+                start = time.perf_counter()
+                created = method(db, series)
+                timings[name] = time.perf_counter() - start
+                assert created == count, f"{name}: {created} != {count}"
+            finally:
+                db.rollback()
+                db.close()
+        speedup = timings["per_row"] / timings["bulk"] if timings["bulk"] else 0
+        print(f"{count:>12} {timings['per_row']:>12.3f} {timings['bulk']:>10.3f} {speedup:>7.1f}x")
+
+if __name__ == "__main__":
+    run()
@@ -1,29 +1,49 @@
-from fastapi import HTTPException, FastAPI, Depends, status, Query, BackgroundTasks, Request
-from fastapi.responses import FileResponse, JSONResponse, RedirectResponse, HTMLResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import HTTPException, FastAPI, Depends, status, Query, BackgroundTasks, Request, Response
+from fastapi.responses import JSONResponse, RedirectResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
 
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float, ForeignKey, text, inspect, Boolean, func, Table, Index
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, Date, Float, ForeignKey, text, inspect, Boolean, func, Table, Index, or_, and_, insert, select, literal, case
+from sqlalchemy import event as sa_event
 from sqlalchemy.orm import sessionmaker, declarative_base, Session, relationship
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy.exc import IntegrityError, DisconnectionError
+from sqlalchemy.sql.dml import Insert, Update, Delete
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.dialects.mysql import TEXT
+from sqlalchemy.dialects.mysql import insert as mysql_insert
 
 from jose import JWTError, jwt
-from datetime import datetime, timedelta
+from datetime import datetime, date, timedelta, timezone
 from typing import List, Optional, Dict, Any
 from pydantic import BaseModel
 import re
+import csv
+import io
+import gzip
+import mimetypes
+import calendar
 import hashlib
 import base64
 import os
+import sys
 import random
 import logging
 import json
+import time
+import threading
+import itertools
+import asyncio
 import requests
 from contextlib import contextmanager
 
+# فشرده‌سازی brotli اختیاری است؛ بدون آن فقط نسخه gzip ساخته می‌شود
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 # فقط این دوتا از کاوه‌نگار
 import requests
 from contextlib import contextmanager
@@ -45,13 +65,142 @@ app = FastAPI()
 # GZip Middleware برای فشرده‌سازی پاسخ‌ها
 app.add_middleware(GZipMiddleware, minimum_size=1000)
 
-# mount استاتیک
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# ===================== فایل‌های استاتیک از پیش فشرده =====================
+# محتوای static یک بار (startup یا python main.py build-static) فشرده می‌شود و
+# پاسخ‌ها با Content-Encoding آماده ارسال می‌شوند؛ GZipMiddleware این پاسخ‌ها را دوباره فشرده نمی‌کند
+STATIC_DIR = "static"
+# هر فایل با ETag اعتبارسنجی می‌شود و بازدید تکراری فقط 304 می‌گیرد
+STATIC_REVALIDATE_CACHE = "no-cache"
+STATIC_COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "application/xml", "image/svg+xml")
+STATIC_MIN_COMPRESS_SIZE = 1000
+# ترتیب ترجیح کدگذاری‌ها در پاسخ
+STATIC_ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+STATIC_ENCODERS = {"gzip": lambda content: gzip.compress(content, compresslevel=9, mtime=0)}
+if brotli is not None:
+    STATIC_ENCODERS["br"] = lambda content: brotli.compress(content, quality=11)
+
+class StaticAsset:
+    """محتوای یک فایل استاتیک به همراه نسخه‌های فشرده"""
+
+    def __init__(self, name: str, content: bytes, media_type: str, precompressed: Optional[Dict[str, bytes]] = None):
+        self.name = name
+        self.media_type = media_type
+        self.digest = hashlib.sha256(content).hexdigest()
+        self.bodies = {"identity": content}
+        
+        if len(content) >= STATIC_MIN_COMPRESS_SIZE and media_type.startswith(STATIC_COMPRESSIBLE_TYPES):
+            precompressed = precompressed or {}
+            for encoding in STATIC_ENCODING_SUFFIXES:
+                body = precompressed.get(encoding)
+                if body is None and encoding in STATIC_ENCODERS:
+                    body = STATIC_ENCODERS[encoding](content)
+                if body is not None:
+                    self.bodies[encoding] = body
+
+    def etag(self, encoding: str) -> str:
+        # هر کدگذاری یک نمایش جداست و ETag خودش را دارد
+        suffix = "" if encoding == "identity" else f"-{encoding}"
+        return f'"{self.digest[:32]}{suffix}"'
+
+def read_precompressed(path: str) -> Dict[str, bytes]:
+    """نسخه‌های ساخته‌شده با build-static، فقط اگر از فایل اصلی قدیمی‌تر نباشند"""
+    result = {}
+    for encoding, suffix in STATIC_ENCODING_SUFFIXES.items():
+        compressed_path = path + suffix
+        if os.path.exists(compressed_path) and os.path.getmtime(compressed_path) >= os.path.getmtime(path):
+            with open(compressed_path, "rb") as f:
+                result[encoding] = f.read()
+    return result
+
+def load_static_assets(directory: str = STATIC_DIR) -> Dict[str, StaticAsset]:
+    """خواندن همه فایل‌های static با مسیر نسبی به عنوان کلید"""
+    assets = {}
+    for root, _, files in os.walk(directory):
+        for filename in files:
+            if filename.endswith(tuple(STATIC_ENCODING_SUFFIXES.values())):
+                continue
+            path = os.path.join(root, filename)
+            with open(path, "rb") as f:
+                content = f.read()
+            name = os.path.relpath(path, directory).replace(os.sep, "/")
+            media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+            assets[name] = StaticAsset(name, content, media_type, read_precompressed(path))
+    return assets
+
+static_assets: Optional[Dict[str, StaticAsset]] = None
+static_assets_lock = threading.Lock()
+
+def get_static_assets() -> Dict[str, StaticAsset]:
+    """فایل‌های static در اولین استفاده (یا startup) بارگذاری می‌شوند؛ تغییر فایل‌ها نیاز به restart دارد"""
+    global static_assets
+    if static_assets is None:
+        with static_assets_lock:
+            if static_assets is None:
+                static_assets = load_static_assets()
+    return static_assets
+
+def accepted_encodings(request: Request) -> set:
+    """کدگذاری‌های مجاز در Accept-Encoding (q=0 یعنی غیرمجاز)"""
+    accepted = set()
+    for part in request.headers.get("accept-encoding", "").split(","):
+        token, _, params = part.partition(";")
+        token = token.strip().lower()
+        quality = params.strip().lower().replace(" ", "")
+        if token and quality not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(token)
+    return accepted
+
+def static_asset_response(request: Request, asset: StaticAsset) -> Response:
+    """ارسال نسخه فشرده مناسب مرورگر با ETag؛ در صورت تطابق If-None-Match فقط 304"""
+    accepted = accepted_encodings(request)
+    encoding = next(
+        (name for name in STATIC_ENCODING_SUFFIXES if name in asset.bodies and (name in accepted or "*" in accepted)),
+        "identity"
+    )
+    headers = {
+        "ETag": asset.etag(encoding),
+        "Cache-Control": STATIC_REVALIDATE_CACHE,
+        "Vary": "Accept-Encoding"
+    }
+    if etag_matches(request, asset.etag(encoding)):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    if request.method == "HEAD":
+        headers["Content-Length"] = str(len(asset.bodies[encoding]))
+        return Response(media_type=asset.media_type, headers=headers)
+    return Response(content=asset.bodies[encoding], media_type=asset.media_type, headers=headers)
+
+@app.api_route("/static/{path:path}", methods=["GET", "HEAD"])
+def serve_static(path: str, request: Request):
+    asset = get_static_assets().get(path)
+    if asset is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="فایل یافت نشد"
+        )
+    return static_asset_response(request, asset)
+
+def build_static_cli(directory: str = STATIC_DIR) -> int:
+    """
+    ساخت فایل‌های .gz و .br کنار فایل‌های static (مرحله build):
+        python main.py build-static
+    """
+    written = 0
+    for name, asset in load_static_assets(directory).items():
+        for encoding, suffix in STATIC_ENCODING_SUFFIXES.items():
+            body = asset.bodies.get(encoding)
+            if body is None:
+                continue
+            with open(os.path.join(directory, name) + suffix, "wb") as f:
+                f.write(body)
+            written += 1
+    return written
 
 # صفحه اصلی
 @app.get("/")
-def home():
-    return FileResponse("static/index.html")
+def home(request: Request):
+    return static_asset_response(request, get_static_assets()["index.html"])
 
 # تست اتصال به دیتابیس
 def test_database_connection():
@@ -66,10 +215,14 @@ def test_database_connection():
             try:
                 logger.info(f"تست اتصال به: {db_url}")
                 engine = create_engine(db_url)
-                with engine.connect() as conn:
-                    result = conn.execute(text("SELECT 1"))
-                    logger.info(f"اتصال موفق به: {db_url}")
-                    return db_url
+                try:
+                    with engine.connect() as conn:
+                        result = conn.execute(text("SELECT 1"))
+                        logger.info(f"اتصال موفق به: {db_url}")
+                        return db_url
+                finally:
+                    # engine آزمایشی نباید اتصال باز در pool نگه دارد
+                    engine.dispose()
             except Exception as e:
                 logger.error(f"خطا در اتصال به {db_url}: {e}")
                 continue
@@ -90,12 +243,379 @@ if not DATABASE_URL:
 
 logger.info(f"اتصال نهایی: {DATABASE_URL}")
 
-engine = create_engine(DATABASE_URL, 
-                      pool_pre_ping=True,
-                      pool_recycle=300)
+# تنظیمات Connection Pool - استفاده از متغیرهای محیطی
+DB_POOL_SIZE = int(os.getenv("MANAREH_DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("MANAREH_DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("MANAREH_DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("MANAREH_DB_POOL_RECYCLE", "300"))
+# always: پینگ در هر checkout | idle: فقط اتصال‌هایی که مدتی بیکار بوده‌اند | never: بدون پینگ
+DB_PRE_PING = os.getenv("MANAREH_DB_PRE_PING", "idle").lower()
+DB_PING_IDLE_SECONDS = float(os.getenv("MANAREH_DB_PING_IDLE_SECONDS", "30"))
+DB_POOL_WARMUP = int(os.getenv("MANAREH_DB_POOL_WARMUP", str(DB_POOL_SIZE)))
+
+class PoolStats:
+    """آمار زنده Connection Pool برای /health و /metrics"""
+    LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, name: str):
+        self.name = name
+        self.pool = None
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.pings = 0
+        self.ping_failures = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.latency_buckets = [0] * (len(self.LATENCY_BUCKETS) + 1)
+
+    def record_checkout(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+            for i, bound in enumerate(self.LATENCY_BUCKETS):
+                if seconds <= bound:
+                    self.latency_buckets[i] += 1
+                    break
+            else:
+                self.latency_buckets[-1] += 1
+
+    def record_ping(self, ok: bool):
+        with self._lock:
+            self.pings += 1
+            if not ok:
+                self.ping_failures += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            histogram = {}
+            cumulative = 0
+            for bound, count in zip(self.LATENCY_BUCKETS, self.latency_buckets):
+                cumulative += count
+                histogram[f"le_{bound}"] = cumulative
+            histogram["le_inf"] = cumulative + self.latency_buckets[-1]
+            total = self.checkouts + self.timeouts
+            return {
+                "name": self.name,
+                "size": self.pool.size() if self.pool else 0,
+                "checked_out": self.pool.checkedout() if self.pool else 0,
+                "checked_in": self.pool.checkedin() if self.pool else 0,
+                "overflow": self.pool.overflow() if self.pool else 0,
+                "max_overflow": DB_MAX_OVERFLOW,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "pings": self.pings,
+                "ping_failures": self.ping_failures,
+                "wait_seconds_total": round(self.wait_seconds_total, 6),
+                "wait_seconds_avg": round(self.wait_seconds_total / total, 6) if total else 0.0,
+                "wait_seconds_max": round(self.wait_seconds_max, 6),
+                "checkout_latency_histogram": histogram,
+            }
+
+POOL_STATS: Dict[str, PoolStats] = {}
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool که زمان انتظار هر checkout را در PoolStats ثبت می‌کند"""
+    stats: PoolStats = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.stats.record_checkout(time.perf_counter() - start, timed_out=True)
+            raise
+        self.stats.record_checkout(time.perf_counter() - start)
+        return connection
+
+def create_pooled_engine(database_url: str, name: str):
+    """ساخت engine با تنظیمات pool، پینگ و آمار"""
+    stats = PoolStats(name)
+    # کلاس اختصاصی تا بعد از recreate شدن pool هم آمار حفظ شود
+    pool_class = type(f"InstrumentedQueuePool_{name}", (InstrumentedQueuePool,), {"stats": stats})
+    new_engine = create_engine(
+        database_url,
+        poolclass=pool_class,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=(DB_PRE_PING == "always")
+    )
+
+    if DB_PRE_PING == "idle":
+        @sa_event.listens_for(new_engine, "checkin")
+        def _on_checkin(dbapi_connection, connection_record):
+            connection_record.info["last_checkin"] = time.monotonic()
+
+        @sa_event.listens_for(new_engine, "checkout")
+        def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+            last_checkin = connection_record.info.get("last_checkin")
+            if last_checkin is None or time.monotonic() - last_checkin < DB_PING_IDLE_SECONDS:
+                return
+            try:
+                if hasattr(dbapi_connection, "ping"):
+                    dbapi_connection.ping(False)
+                else:
+                    cursor = dbapi_connection.cursor()
+                    cursor.execute("SELECT 1")
+                    cursor.close()
+                stats.record_ping(True)
+            except Exception:
+                stats.record_ping(False)
+                # pool اتصال را دور می‌اندازد و اتصال جدید می‌سازد
+                raise DisconnectionError()
+
+    @sa_event.listens_for(new_engine, "engine_disposed")
+    def _on_disposed(disposed_engine):
+        stats.pool = disposed_engine.pool
+
+    stats.pool = new_engine.pool
+    POOL_STATS[name] = stats
+    return new_engine
+
+def warm_up_pool(target_engine, count: int) -> int:
+    """باز کردن چند اتصال در startup تا درخواست‌های اول منتظر اتصال نمانند"""
+    connections = []
+    try:
+        for _ in range(max(0, min(count, DB_POOL_SIZE))):
+            connections.append(target_engine.connect())
+    except Exception as e:
+        logger.error(f"خطا در گرم کردن connection pool: {e}")
+    finally:
+        opened = len(connections)
+        for connection in connections:
+            connection.close()
+    return opened
+
+engine = create_pooled_engine(DATABASE_URL, "primary")
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Read Replica ها - آدرس‌ها با کاما جدا می‌شوند
+DB_REPLICA_URLS = [url.strip() for url in os.getenv("MANAREH_DB_REPLICA_URLS", "").split(",") if url.strip()]
+# مدت زمانی که بعد از نوشتن، خواندن‌های همان کاربر از primary انجام می‌شود
+DB_STICKY_SECONDS = float(os.getenv("MANAREH_DB_STICKY_SECONDS", "5"))
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv("MANAREH_DB_REPLICA_CHECK_INTERVAL", "10"))
+
+class ReplicaSet:
+    """مدیریت replica ها با health check و بازگشت خودکار به primary"""
+
+    def __init__(self, urls: List[str]):
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+        self.replicas = []
+        for index, url in enumerate(urls, start=1):
+            name = f"replica{index}"
+            replica_engine = create_pooled_engine(url, name)
+            replica = {"name": name, "engine": replica_engine, "healthy": True, "last_error": None, "checked_at": None}
+            self._watch_errors(replica)
+            self.replicas.append(replica)
+
+    def _watch_errors(self, replica: Dict[str, Any]):
+        @sa_event.listens_for(replica["engine"], "handle_error")
+        def _on_error(context):
+            # قطع اتصال replica تا health check بعدی آن را از چرخه خارج می‌کند
+            if context.is_disconnect:
+                self.mark_unhealthy(replica, context.original_exception)
+
+    def mark_unhealthy(self, replica: Dict[str, Any], error: Exception):
+        with self._lock:
+            if replica["healthy"]:
+                logger.error(f"replica {replica['name']} از دسترس خارج شد: {error}")
+            replica["healthy"] = False
+            replica["last_error"] = str(error)
+
+    def choose(self):
+        """انتخاب round-robin بین replica های سالم؛ None یعنی استفاده از primary"""
+        with self._lock:
+            healthy = [replica for replica in self.replicas if replica["healthy"]]
+            if not healthy:
+                return None
+            return healthy[next(self._counter) % len(healthy)]["engine"]
+
+    def check_health(self):
+        for replica in self.replicas:
+            try:
+                with replica["engine"].connect() as conn:
+                    conn.execute(text("SELECT 1"))
+                with self._lock:
+                    if not replica["healthy"]:
+                        logger.info(f"replica {replica['name']} دوباره در دسترس است")
+                    replica["healthy"] = True
+                    replica["last_error"] = None
+            except Exception as e:
+                self.mark_unhealthy(replica, e)
+            finally:
+                replica["checked_at"] = datetime.utcnow()
+
+    def status(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                {
+                    "name": replica["name"],
+                    "healthy": replica["healthy"],
+                    "last_error": replica["last_error"],
+                    "checked_at": replica["checked_at"]
+                }
+                for replica in self.replicas
+            ]
+
+class WriteStickiness:
+    """نگهداری کاربرانی که اخیراً نوشته‌اند تا خواندن بعدی آنها از primary باشد"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self._lock = threading.Lock()
+        self._until: Dict[str, float] = {}
+
+    def mark(self, key: Optional[str]):
+        if not key or self.seconds <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._until[key] = now + self.seconds
+            if len(self._until) > 10000:
+                self._until = {k: v for k, v in self._until.items() if v > now}
+
+    def is_sticky(self, key: Optional[str]) -> bool:
+        if not key:
+            return False
+        with self._lock:
+            until = self._until.get(key)
+        return until is not None and until > time.monotonic()
+
+replica_set = ReplicaSet(DB_REPLICA_URLS)
+write_stickiness = WriteStickiness(DB_STICKY_SECONDS)
+
+def get_sticky_key(request: Request) -> Optional[str]:
+    """کلید چسبندگی: توکن کاربر و در غیر این صورت IP کلاینت"""
+    authorization = request.headers.get("authorization")
+    if authorization:
+        return hashlib.sha1(authorization.encode("utf-8")).hexdigest()
+    return request.client.host if request.client else None
+
+class RoutingSession(Session):
+    """Session که خواندن‌ها را به replica و نوشتن‌ها را به primary می‌فرستد"""
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        replica = self.info.get("replica")
+        if replica is None or self._flushing or isinstance(clause, (Insert, Update, Delete)):
+            return engine
+        return replica
+
+RoutingSessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False)
+
+# کش ساده درون‌حافظه‌ای برای پاسخ‌های پرتکرار
+class TTLCache:
+    """کش key/value با زمان انقضا - هر worker کش مستقل خودش را دارد"""
+
+    def __init__(self, ttl_seconds: float, max_entries: int = 1024):
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._data: Dict[Any, Any] = {}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            if len(self._data) >= self.max_entries:
+                now = time.monotonic()
+                self._data = {k: v for k, v in self._data.items() if v[0] >= now}
+                if len(self._data) >= self.max_entries:
+                    self._data.pop(next(iter(self._data)))
+            self._data[key] = (time.monotonic() + self.ttl, value)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+# کش فید عمومی رویدادها - تعداد شرکت‌کننده/امتیاز حداکثر به اندازه TTL قدیمی می‌ماند
+FEED_CACHE_TTL = float(os.getenv("MANAREH_FEED_CACHE_TTL", "30"))
+feed_cache = TTLCache(FEED_CACHE_TTL)
+
+# کش آمار پروفایل کاربران - پس از هر تغییر شمارنده در همین worker پاک می‌شود
+USER_STATS_CACHE_TTL = float(os.getenv("MANAREH_USER_STATS_CACHE_TTL", "15"))
+user_stats_cache = TTLCache(USER_STATS_CACHE_TTL, max_entries=10000)
+
+def adjust_user_summary(db: Session, user_id: int, **deltas: int):
+    """تغییر افزایشی شمارنده‌های کاربر با یک upsert (commit با فراخواننده)"""
+    deltas = {column: delta for column, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    stmt = mysql_insert(UserSummary).values(user_id=user_id, **{column: max(delta, 0) for column, delta in deltas.items()})
+    db.execute(stmt.on_duplicate_key_update(**{
+        column: func.greatest(getattr(UserSummary, column) + delta, 0) for column, delta in deltas.items()
+    }))
+    invalidate_user_stats(db, [user_id])
+
+def invalidate_user_stats(db: Session, user_ids: List[int]):
+    """
+    پاک کردن کش آمار کاربران پس از commit؛ پاک کردن زودتر اجازه می‌دهد خواندن همزمان
+    مقدار قدیمی را دوباره برای کل TTL در کش بگذارد
+    """
+    db.info.setdefault("user_stats_invalidate", set()).update(user_ids)
+
+@sa_event.listens_for(Session, "after_commit")
+def clear_committed_user_stats(session):
+    for user_id in session.info.pop("user_stats_invalidate", ()):
+        user_stats_cache.delete(user_id)
+
+@sa_event.listens_for(Session, "after_rollback")
+def discard_rolled_back_user_stats(session):
+    session.info.pop("user_stats_invalidate", None)
+
+# کش جدول ماهانه تقویم (شامل تعداد رویدادهای هر روز) - با هر تغییر رویداد پاک می‌شود
+CALENDAR_CACHE_TTL = float(os.getenv("MANAREH_CALENDAR_CACHE_TTL", "300"))
+calendar_cache = TTLCache(CALENDAR_CACHE_TTL)
+
+# کش نقشه حرارتی تعداد رویداد روزانه به ازای (بازه، فیلترها)
+HEATMAP_CACHE_TTL = float(os.getenv("MANAREH_HEATMAP_CACHE_TTL", "300"))
+HEATMAP_MAX_DAYS = int(os.getenv("MANAREH_HEATMAP_MAX_DAYS", "400"))
+heatmap_cache = TTLCache(HEATMAP_CACHE_TTL, max_entries=2048)
+
+def invalidate_event_caches():
+    """پاک کردن کش‌های وابسته به جدول events پس از تغییر رویدادها"""
+    feed_cache.clear()
+    calendar_cache.clear()
+    heatmap_cache.clear()
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """بررسی هدر If-None-Match برای پاسخ 304"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag in [tag.strip().removeprefix("W/") for tag in header.split(",")]
+
+def cached_json_response(request: Request, body: bytes, etag: str, cache_control: str = "public, max-age=0, must-revalidate") -> Response:
+    """ارسال بدنه JSON آماده با ETag - در صورت تطابق فقط 304 برمی‌گردد"""
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 # Dependency Injection برای دیتابیس
 def get_db():
     db = SessionLocal()
@@ -104,10 +624,25 @@ def get_db():
     finally:
         db.close()
 
+# Dependency برای endpoint های فقط-خواندنی (GET)
+def get_read_db(request: Request):
+    replica = None
+    if request.method in ("GET", "HEAD") and not write_stickiness.is_sticky(get_sticky_key(request)):
+        replica = replica_set.choose()
+    db = RoutingSessionLocal()
+    db.info["replica"] = replica
+    try:
+        yield db
+    finally:
+        db.close()
+
 # تنظیمات JWT - استفاده از متغیرهای محیطی
 SECRET_KEY = os.getenv("MANAREH_SECRET_KEY", "manareh-secret-key-2024-very-secure-key-here-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# توکن کوتاه‌مدت مخصوص اتصال SSE - در URL قرار می‌گیرد پس فقط برای همین کار و چند ثانیه معتبر است
+NOTIFICATION_STREAM_SCOPE = "notification_stream"
+STREAM_TOKEN_EXPIRE_SECONDS = int(os.getenv("MANAREH_STREAM_TOKEN_EXPIRE_SECONDS", "60"))
 
 # تنظیمات کاوه‌نگار - استفاده از متغیرهای محیطی
 KAVENEGAR_API_KEY = os.getenv("KAVENEGAR_API_KEY", "6A6F54654839584E356A6633743272783851717A6C7663667477615357533163595267372B68446636426B3D")
@@ -157,6 +692,7 @@ class Occasion(Base):
     
     __table_args__ = (
         Index('idx_occasion_date', 'jmonth', 'jday'),
+        Index('uq_occasions_date_title', 'jmonth', 'jday', 'title', unique=True),
     )
 
 class Event(Base):
@@ -180,6 +716,14 @@ class Event(Base):
     active = Column(Integer, default=1)
     is_free = Column(Boolean, default=True)
     price = Column(Float, default=0.0)
+    series_id = Column(Integer, nullable=True)  # شناسه سری برای رویدادهای تکراری
+    occurrence_time = Column(DateTime, nullable=True)  # زمان اصلی این نوبت طبق قانون تکرار
+    
+    __table_args__ = (
+        Index('idx_events_active_time', 'active', 'time'),
+        Index('idx_events_creator', 'creator'),
+        Index('idx_events_series', 'series_id', 'occurrence_time'),
+    )
 
 class Comment(Base):
     __tablename__ = "comments"
@@ -189,6 +733,11 @@ class Comment(Base):
     comment = Column(String(500), nullable=False)
     rating = Column(Integer, default=5)
     created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('idx_comments_event_created', 'event_id', 'created_at'),
+        Index('uq_comments_event_user', 'event_id', 'user_id', unique=True),
+    )
 
 class EventParticipant(Base):
     __tablename__ = "event_participants"
@@ -197,6 +746,11 @@ class EventParticipant(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     registered_at = Column(DateTime, default=datetime.utcnow)
     attended = Column(Boolean, default=False)
+    attended_at = Column(DateTime, nullable=True)  # زمان حضور؛ در همگام‌سازی آفلاین زودترین زمان می‌ماند
+    
+    __table_args__ = (
+        Index('uq_event_participants_event_user', 'event_id', 'user_id', unique=True),
+    )
 
 class Notification(Base):
     __tablename__ = "notifications"
@@ -207,6 +761,86 @@ class Notification(Base):
     type = Column(String(50), default="info")
     read = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('idx_notifications_user_read_created', 'user_id', 'read', 'created_at'),
+        Index('idx_notifications_user_created', 'user_id', 'created_at'),
+        Index('idx_notifications_read_created', 'read', 'created_at'),
+    )
+
+# نوتیفیکیشن‌های خوانده‌شده قدیمی - جدول اصلی برای خواندن سریع هر کاربر کوچک می‌ماند
+class NotificationArchive(Base):
+    __tablename__ = "notifications_archive"
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    user_id = Column(Integer, nullable=False)
+    title = Column(String(200), nullable=False)
+    message = Column(String(500), nullable=False)
+    type = Column(String(50), default="info")
+    read = Column(Boolean, default=True)
+    created_at = Column(DateTime)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('idx_notifications_archive_user_created', 'user_id', 'created_at'),
+    )
+
+# شمارنده‌های هر کاربر - آمار پروفایل و نشان خوانده‌نشده‌ها با یک جستجوی کلید اصلی
+class UserSummary(Base):
+    __tablename__ = "user_summary"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    unread_notifications = Column(Integer, nullable=False, default=0, server_default="0")
+    notifications_total = Column(Integer, nullable=False, default=0, server_default="0")
+    events_created = Column(Integer, nullable=False, default=0, server_default="0")
+    favorites = Column(Integer, nullable=False, default=0, server_default="0")
+    registrations = Column(Integer, nullable=False, default=0, server_default="0")
+
+# آمار روزانه فعالیت به تفکیک ابعاد رویداد - فقط ردیف‌های جدیدتر از watermark پردازش می‌شوند
+class DailyEventRollup(Base):
+    __tablename__ = "daily_event_rollups"
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    day = Column(Date, nullable=False)
+    province = Column(String(50), nullable=False, default="")
+    city = Column(String(50), nullable=False, default="")
+    category = Column(String(50), nullable=False, default="")
+    type = Column(String(20), nullable=False, default="")
+    events_created = Column(Integer, nullable=False, default=0, server_default="0")
+    registrations = Column(Integer, nullable=False, default=0, server_default="0")
+    comments = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_sum = Column(Integer, nullable=False, default=0, server_default="0")
+    
+    __table_args__ = (
+        Index('uq_daily_event_rollups_dims', 'day', 'province', 'city', 'category', 'type', unique=True),
+    )
+
+class RollupWatermark(Base):
+    __tablename__ = "rollup_watermarks"
+    source = Column(String(50), primary_key=True)
+    last_id = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+# کارهای ارسال گروهی نوتیفیکیشن - پیشرفت با last_user_id قابل ادامه است
+class NotificationJob(Base):
+    __tablename__ = "notification_jobs"
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=False)
+    audience = Column(String(20), nullable=False)  # event, province
+    audience_key = Column(String(100), nullable=False)
+    title = Column(String(200), nullable=False)
+    message = Column(String(500), nullable=False)
+    type = Column(String(50), default="info")
+    status = Column(String(20), nullable=False, default="pending")  # pending, running, completed, failed
+    total = Column(Integer, nullable=False, default=0)
+    sent = Column(Integer, nullable=False, default=0)
+    last_user_id = Column(Integer, nullable=False, default=0)
+    error = Column(String(500), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        Index('idx_notification_jobs_status', 'status', 'id'),
+    )
 
 class UserFavorite(Base):
     __tablename__ = "user_favorites"
@@ -214,6 +848,71 @@ class UserFavorite(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     event_id = Column(Integer, ForeignKey("events.id"), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('uq_user_favorites_event_user', 'event_id', 'user_id', unique=True),
+    )
+
+# آمار تجمیعی هر رویداد - به‌صورت افزایشی در همان تراکنش نوشتن به‌روز می‌شود
+class EventStats(Base):
+    __tablename__ = "event_stats"
+    event_id = Column(Integer, ForeignKey("events.id"), primary_key=True)
+    comment_count = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_sum = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_1 = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_2 = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_3 = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_4 = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_5 = Column(Integer, nullable=False, default=0, server_default="0")
+    participant_count = Column(Integer, nullable=False, default=0, server_default="0")
+    favorite_count = Column(Integer, nullable=False, default=0, server_default="0")
+
+# صف انتظار رویدادهای پر - ترتیب FIFO بر اساس شناسه افزایشی
+class EventWaitlist(Base):
+    __tablename__ = "event_waitlist"
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    event_id = Column(Integer, ForeignKey("events.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('uq_event_waitlist_event_user', 'event_id', 'user_id', unique=True),
+        Index('idx_event_waitlist_event_order', 'event_id', 'id'),
+    )
+
+# سری رویدادهای تکراری - قانون تکرار یک بار ذخیره می‌شود
+class EventSeries(Base):
+    __tablename__ = "event_series"
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    creator = Column(Integer, ForeignKey("users.id"), nullable=False)
+    template = Column(TEXT, nullable=False)  # فیلدهای مشترک نوبت‌ها به صورت JSON
+    freq = Column(String(10), nullable=False)  # daily / weekly / monthly / yearly
+    repeat_interval = Column(Integer, default=1)
+    by_weekday = Column(String(20), nullable=True)  # روزهای هفته با کاما (0=دوشنبه مثل weekday پایتون)
+    by_month_day = Column(Integer, nullable=True)
+    dtstart = Column(DateTime, nullable=False)
+    until = Column(DateTime, nullable=True)
+    occurrence_count = Column(Integer, nullable=True)
+    materialized_until = Column(DateTime, nullable=True)  # نوبت‌ها تا این زمان در events ساخته شده‌اند
+    fully_materialized = Column(Boolean, default=False)
+    # جابجایی‌های زمانی به صورت JSON: [[اولین نوبت مشمول طبق قانون اصلی, دقیقه], ...]
+    time_shifts = Column(TEXT, nullable=True)
+    active = Column(Integer, default=1)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+# استثناهای سری - لغو یا تغییر یک نوبت خاص
+class EventSeriesException(Base):
+    __tablename__ = "event_series_exceptions"
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    series_id = Column(Integer, ForeignKey("event_series.id"), nullable=False)
+    occurrence_time = Column(DateTime, nullable=False)
+    cancelled = Column(Boolean, default=False)
+    event_id = Column(Integer, ForeignKey("events.id"), nullable=True)  # ردیف جایگزین در صورت تغییر
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('uq_series_exceptions_series_time', 'series_id', 'occurrence_time', unique=True),
+    )
 
 # تابع برای بررسی و ایجاد فیلدهای جدید - اصلاح شده
 def check_and_create_missing_columns():
@@ -314,7 +1013,7 @@ def check_and_create_missing_columns():
             events_columns = [col['name'] for col in inspector.get_columns('events')]
             events_missing = []
             
-            event_expected = ['type', 'city', 'province', 'country', 'capacity', 'active', 'is_free', 'price']
+            event_expected = ['type', 'city', 'province', 'country', 'capacity', 'active', 'is_free', 'price', 'series_id', 'occurrence_time']
             for col in event_expected:
                 if col not in events_columns:
                     events_missing.append(col)
@@ -338,6 +1037,10 @@ def check_and_create_missing_columns():
                         db.execute(text("ALTER TABLE events ADD COLUMN is_free TINYINT DEFAULT 1"))
                     elif col == 'price':
                         db.execute(text("ALTER TABLE events ADD COLUMN price FLOAT DEFAULT 0.0"))
+                    elif col == 'series_id':
+                        db.execute(text("ALTER TABLE events ADD COLUMN series_id INT NULL"))
+                    elif col == 'occurrence_time':
+                        db.execute(text("ALTER TABLE events ADD COLUMN occurrence_time DATETIME NULL"))
                 db.commit()
                 logger.info("فیلدهای جدید در events ایجاد شدند")
                 
@@ -348,6 +1051,41 @@ def check_and_create_missing_columns():
                 db.execute(text("ALTER TABLE comments ADD COLUMN rating INT DEFAULT 5"))
                 db.commit()
                 logger.info("فیلد rating ایجاد شد")
+            
+            # بررسی فیلد attended_at در event_participants
+            participants_columns = [col['name'] for col in inspector.get_columns('event_participants')]
+            if 'attended_at' not in participants_columns:
+                logger.info("ایجاد فیلد attended_at در event_participants")
+                db.execute(text("ALTER TABLE event_participants ADD COLUMN attended_at DATETIME NULL"))
+                db.commit()
+                logger.info("فیلد attended_at ایجاد شد")
+            
+            # بررسی فیلد time_shifts در event_series
+            series_columns = [col['name'] for col in inspector.get_columns('event_series')]
+            if 'time_shifts' not in series_columns:
+                logger.info("ایجاد فیلد time_shifts در event_series")
+                db.execute(text("ALTER TABLE event_series ADD COLUMN time_shifts TEXT NULL"))
+                db.commit()
+                logger.info("فیلد time_shifts ایجاد شد")
+            
+            # بررسی شمارنده‌های جدید در user_summary
+            summary_columns = [col['name'] for col in inspector.get_columns('user_summary')]
+            for col in USER_SUMMARY_COUNTERS:
+                if col not in summary_columns:
+                    logger.info(f"ایجاد فیلد {col} در user_summary")
+                    db.execute(text(f"ALTER TABLE user_summary ADD COLUMN {col} INT NOT NULL DEFAULT 0"))
+                    db.commit()
+                    resync_tables.add("user_summary")
+                    logger.info(f"فیلد {col} ایجاد شد")
+            
+            # بررسی شمارنده‌های جدید در event_stats
+            stats_columns = [col['name'] for col in inspector.get_columns('event_stats')]
+            for col in ['participant_count', 'favorite_count']:
+                if col not in stats_columns:
+                    logger.info(f"ایجاد فیلد {col} در event_stats")
+                    db.execute(text(f"ALTER TABLE event_stats ADD COLUMN {col} INT NOT NULL DEFAULT 0"))
+                    db.commit()
+                    logger.info(f"فیلد {col} ایجاد شد")
                 
         except Exception as e:
             logger.error(f"خطا در ایجاد فیلدها: {e}")
@@ -359,6 +1097,242 @@ def check_and_create_missing_columns():
     finally:
         db.close()
 
+# ایندکس‌های مورد نیاز جستجوهای پرتکرار: (جدول، نام ایندکس، ستون‌ها، یکتا)
+REQUIRED_INDEXES = [
+    ("event_participants", "uq_event_participants_event_user", ["event_id", "user_id"], True),
+    ("user_favorites", "uq_user_favorites_event_user", ["event_id", "user_id"], True),
+    ("comments", "idx_comments_event_created", ["event_id", "created_at"], False),
+    ("comments", "uq_comments_event_user", ["event_id", "user_id"], True),
+    ("notifications", "idx_notifications_user_read_created", ["user_id", "read", "created_at"], False),
+    ("notifications", "idx_notifications_user_created", ["user_id", "created_at"], False),
+    ("notifications", "idx_notifications_read_created", ["read", "created_at"], False),
+    ("events", "idx_events_active_time", ["active", "time"], False),
+    ("users", "idx_users_province", ["province"], False),
+    ("events", "idx_events_creator", ["creator"], False),
+    ("events", "idx_events_series", ["series_id", "occurrence_time"], False),
+    ("occasions", "uq_occasions_date_title", ["jmonth", "jday", "title"], True),
+]
+
+def duplicate_rows_join(table_name: str, columns: List[str]) -> str:
+    join_condition = " AND ".join(f"t1.`{col}` = t2.`{col}`" for col in columns)
+    return f"{table_name} t1 JOIN {table_name} t2 ON {join_condition} AND t1.id > t2.id"
+
+def has_duplicate_rows(db: Session, table_name: str, columns: List[str]) -> bool:
+    return db.execute(text(f"SELECT 1 FROM {duplicate_rows_join(table_name, columns)} LIMIT 1")).first() is not None
+
+def remove_duplicate_rows(db: Session, table_name: str, columns: List[str]) -> int:
+    """حذف ردیف‌های تکراری قبل از ایجاد ایندکس یکتا - قدیمی‌ترین ردیف باقی می‌ماند (فقط در مایگریشن dedupe)"""
+    result = db.execute(text(f"DELETE t1 FROM {duplicate_rows_join(table_name, columns)}"))
+    return result.rowcount
+
+def create_missing_indexes():
+    """ایجاد ایندکس‌های جدید روی جداول موجود (مایگریشن)"""
+    db = SessionLocal()
+    try:
+        inspector = inspect(engine)
+        existing_tables = inspector.get_table_names()
+        
+        for table_name, index_name, columns, unique in REQUIRED_INDEXES:
+            if table_name not in existing_tables:
+                continue
+            
+            existing_indexes = {index['name'] for index in inspector.get_indexes(table_name)}
+            if index_name in existing_indexes:
+                continue
+            
+            try:
+                # startup هیچ ردیفی حذف نمی‌کند؛ حذف تکراری‌ها و شمارش دوباره شمارنده‌ها با مایگریشن جداگانه
+                if unique and has_duplicate_rows(db, table_name, columns):
+                    logger.warning(
+                        f"ایندکس یکتای {index_name} ساخته نشد چون {table_name} ردیف تکراری دارد؛ "
+                        f"اجرا کنید: python main.py dedupe-unique-indexes"
+                    )
+                    continue
+                
+                unique_sql = "UNIQUE " if unique else ""
+                columns_sql = ", ".join(f"`{col}`" for col in columns)
+                db.execute(text(f"CREATE {unique_sql}INDEX {index_name} ON {table_name} ({columns_sql})"))
+                db.commit()
+                logger.info(f"ایندکس {index_name} روی {table_name} ایجاد شد")
+            except Exception as e:
+                db.rollback()
+                logger.error(f"خطا در ایجاد ایندکس {index_name}: {e}")
+    except Exception as e:
+        logger.error(f"خطا در ایجاد ایندکس‌ها: {e}")
+    finally:
+        db.close()
+
+def sync_participant_counts(db: Session):
+    """مقداردهی participant_count از روی جدول event_participants (commit با فراخواننده)"""
+    db.execute(text("""
+        INSERT IGNORE INTO event_stats (event_id)
+        SELECT DISTINCT event_id FROM event_participants
+    """))
+    db.execute(text("""
+        UPDATE event_stats s
+        JOIN (SELECT event_id, COUNT(*) AS total FROM event_participants GROUP BY event_id) p
+          ON p.event_id = s.event_id
+        SET s.participant_count = p.total
+    """))
+
+def sync_favorite_counts(db: Session, event_ids: Optional[List[int]] = None):
+    """
+    شمارش دوباره favorite_count از روی user_favorites (commit با فراخواننده)
+    بدون event_ids همه رویدادها؛ شمارش روی ایندکس یکتای (event_id, user_id) انجام می‌شود
+    """
+    if event_ids is not None and not event_ids:
+        return
+    
+    events_query = select(Event.id)
+    recount = EventStats.__table__.update().values(
+        favorite_count=select(func.count(UserFavorite.id)).where(
+            UserFavorite.event_id == EventStats.event_id
+        ).scalar_subquery()
+    )
+    if event_ids is not None:
+        events_query = events_query.where(Event.id.in_(event_ids))
+        recount = recount.where(EventStats.event_id.in_(event_ids))
+    
+    db.execute(mysql_insert(EventStats).prefix_with("IGNORE").from_select(["event_id"], events_query))
+    db.execute(recount)
+
+def sync_comment_stats(db: Session):
+    """شمارش دوباره تعداد و امتیاز نظرات event_stats از روی comments (commit با فراخواننده)"""
+    db.execute(text("""
+        INSERT IGNORE INTO event_stats (event_id)
+        SELECT DISTINCT event_id FROM comments
+    """))
+    db.execute(text("""
+        UPDATE event_stats s
+        LEFT JOIN (
+            SELECT event_id, COUNT(*) AS total, COALESCE(SUM(rating), 0) AS rating_sum,
+                   SUM(rating = 1) AS r1, SUM(rating = 2) AS r2, SUM(rating = 3) AS r3, SUM(rating = 4) AS r4, SUM(rating = 5) AS r5
+            FROM comments
+            GROUP BY event_id
+        ) c ON c.event_id = s.event_id
+        SET s.comment_count = COALESCE(c.total, 0), s.rating_sum = COALESCE(c.rating_sum, 0),
+            s.rating_1 = COALESCE(c.r1, 0), s.rating_2 = COALESCE(c.r2, 0), s.rating_3 = COALESCE(c.r3, 0),
+            s.rating_4 = COALESCE(c.r4, 0), s.rating_5 = COALESCE(c.r5, 0)
+    """))
+
+def backfill_event_stats():
+    """ساخت ردیف‌های event_stats از روی داده‌های موجود - فقط برای جدول یا ستون تازه"""
+    db = SessionLocal()
+    try:
+        if db.query(EventStats.event_id).first() is None:
+            result = db.execute(text("""
+                INSERT INTO event_stats (event_id, comment_count, rating_sum, rating_1, rating_2, rating_3, rating_4, rating_5)
+                SELECT event_id, COUNT(*), COALESCE(SUM(rating), 0),
+                       SUM(rating = 1), SUM(rating = 2), SUM(rating = 3), SUM(rating = 4), SUM(rating = 5)
+                FROM comments
+                GROUP BY event_id
+            """))
+            db.commit()
+            logger.info(f"آمار {result.rowcount} رویداد در event_stats ساخته شد")
+        
+        # ستون participant_count تازه اضافه شده و هنوز مقداردهی نشده است
+        counts_missing = db.query(EventStats.event_id).filter(EventStats.participant_count > 0).first() is None
+        if counts_missing and db.query(EventParticipant.id).first() is not None:
+            sync_participant_counts(db)
+            db.commit()
+            logger.info("تعداد شرکت‌کنندگان در event_stats مقداردهی شد")
+        
+        # ستون favorite_count تازه اضافه شده و هنوز مقداردهی نشده است
+        favorites_missing = db.query(EventStats.event_id).filter(EventStats.favorite_count > 0).first() is None
+        if favorites_missing and db.query(UserFavorite.id).first() is not None:
+            sync_favorite_counts(db)
+            db.commit()
+            logger.info("تعداد علاقه‌مندی‌ها در event_stats مقداردهی شد")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"خطا در ساخت event_stats: {e}")
+    finally:
+        db.close()
+
+# شمارنده‌های user_summary و کوئری محاسبه هر کدام از جداول اصلی (برای ساخت اولیه و حالت جایگزین)
+USER_SUMMARY_COUNTERS = ["unread_notifications", "notifications_total", "events_created", "favorites", "registrations"]
+USER_SUMMARY_SOURCES = {
+    "unread_notifications": "SELECT COUNT(*) FROM notifications n WHERE n.user_id = {user} AND n.`read` = 0",
+    "notifications_total": "SELECT COUNT(*) FROM notifications n WHERE n.user_id = {user}",
+    "events_created": "SELECT COUNT(*) FROM events e WHERE e.creator = {user}",
+    "favorites": "SELECT COUNT(*) FROM user_favorites f WHERE f.user_id = {user}",
+    "registrations": "SELECT COUNT(*) FROM event_participants p WHERE p.user_id = {user}",
+}
+
+# جداولی که ستون تازه گرفته‌اند و باید از روی داده‌های موجود دوباره ساخته شوند
+resync_tables = set()
+
+def backfill_user_summary(force: bool = False):
+    """ساخت شمارنده‌های کاربران از روی داده‌های موجود - برای جدول خالی، ستون تازه یا force"""
+    db = SessionLocal()
+    try:
+        if not force and db.query(UserSummary.user_id).first() is not None and "user_summary" not in resync_tables:
+            return
+        
+        db.execute(text("INSERT IGNORE INTO user_summary (user_id) SELECT id FROM users"))
+        assignments = ", ".join(
+            f"{column} = ({query.format(user='s.user_id')})" for column, query in USER_SUMMARY_SOURCES.items()
+        )
+        result = db.execute(text(f"UPDATE user_summary s SET {assignments}"))
+        db.commit()
+        resync_tables.discard("user_summary")
+        logger.info(f"شمارنده‌های {result.rowcount} کاربر ساخته شد")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"خطا در ساخت user_summary: {e}")
+    finally:
+        db.close()
+
+def dedupe_unique_indexes() -> int:
+    """
+    مایگریشن یک‌باره: حذف ردیف‌های تکراری جداولی که ایندکس یکتایشان هنوز ساخته نشده،
+    ساخت ایندکس‌ها و شمارش دوباره شمارنده‌های وابسته (event_stats و user_summary)
+        python main.py dedupe-unique-indexes
+    """
+    db = SessionLocal()
+    removed_total = 0
+    try:
+        inspector = inspect(engine)
+        existing_tables = inspector.get_table_names()
+        for table_name, index_name, columns, unique in REQUIRED_INDEXES:
+            if not unique or table_name not in existing_tables:
+                continue
+            if index_name in {index['name'] for index in inspector.get_indexes(table_name)}:
+                continue
+            removed = remove_duplicate_rows(db, table_name, columns)
+            db.commit()
+            if removed:
+                logger.info(f"{removed} ردیف تکراری از {table_name} حذف شد")
+            removed_total += removed
+        
+        sync_participant_counts(db)
+        sync_favorite_counts(db)
+        sync_comment_stats(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    
+    backfill_user_summary(force=True)
+    create_missing_indexes()
+    return removed_total
+
+# مناسبت‌های پیش‌فرض برای جدول خالی: (ماه، روز، عنوان، توضیحات، تعطیل)
+DEFAULT_OCCASIONS = [
+    (1, 1, "آغاز سال نو", "آغاز سال نو خورشیدی", True),
+    (1, 12, "روز جمهوری اسلامی ایران", "روز جمهوری اسلامی ایران", True),
+    (1, 13, "روز طبیعت", "سیزدهم فروردین، روز طبیعت", True),
+    (11, 22, "پیروزی انقلاب اسلامی", "سالگرد پیروزی انقلاب اسلامی ایران", True),
+    (3, 14, "رحلت امام خمینی (ره)", "چهاردهم خرداد، سالگرد رحلت امام خمینی", True),
+    (12, 29, "روز ملی شدن صنعت نفت", "سالروز ملی شدن صنعت نفت ایران", True),
+    (9, 17, "قبولی اعمال", "شب هایله القدر", True),
+    (12, 13, "تولد حضرت علی (ع)", "سیزدهم رجب، ولادت امام اول شیعیان", True),
+    (7, 27, "مبعث رسول اکرم", "بیست و هفتم رجب، مبعث پیامبر اسلام", True),
+    (6, 15, "ولادت امام مهدی (عج)", "نیمه شعبان، میلاد امام زمان", True)
+]
+
 # ایجاد جداول در دیتابیس
 def create_tables():
     try:
@@ -368,36 +1342,24 @@ def create_tables():
         # بررسی و ایجاد فیلدهای جدید
         check_and_create_missing_columns()
         
+        # ایجاد ایندکس‌های جدید
+        create_missing_indexes()
+        
+        # آمار تجمیعی رویدادها و کاربران
+        backfill_event_stats()
+        backfill_user_summary()
+        
         # ایجاد مناسبت‌های پیش‌فرض در صورت خالی بودن جدول occasions
         db = SessionLocal()
         try:
             count = db.query(Occasion).count()
             if count == 0:
-                default_occasions = [
-                    (1, 1, "آغاز سال نو", "آغاز سال نو خورشیدی", True),
-                    (1, 12, "روز جمهوری اسلامی ایران", "روز جمهوری اسلامی ایران", True),
-                    (1, 13, "روز طبیعت", "سیزدهم فروردین، روز طبیعت", True),
-                    (11, 22, "پیروزی انقلاب اسلامی", "سالگرد پیروزی انقلاب اسلامی ایران", True),
-                    (3, 14, "رحلت امام خمینی (ره)", "چهاردهم خرداد، سالگرد رحلت امام خمینی", True),
-                    (12, 29, "روز ملی شدن صنعت نفت", "سالروز ملی شدن صنعت نفت ایران", True),
-                    (9, 17, "قبولی اعمال", "شب هایله القدر", True),
-                    (12, 13, "تولد حضرت علی (ع)", "سیزدهم رجب، ولادت امام اول شیعیان", True),
-                    (7, 27, "مبعث رسول اکرم", "بیست و هفتم رجب، مبعث پیامبر اسلام", True),
-                    (6, 15, "ولادت امام مهدی (عج)", "نیمه شعبان، میلاد امام زمان", True)
-                ]
-                
-                for jmonth, jday, title, description, is_holiday in default_occasions:
-                    occasion = Occasion(
-                        jmonth=jmonth,
-                        jday=jday,
-                        title=title,
-                        description=description,
-                        is_holiday=is_holiday
-                    )
-                    db.add(occasion)
-                
+                upsert_occasions(db, [
+                    OccasionCreate(jmonth=jmonth, jday=jday, title=title, description=description, is_holiday=is_holiday)
+                    for jmonth, jday, title, description, is_holiday in DEFAULT_OCCASIONS
+                ])
                 db.commit()
-                logger.info(f"{len(default_occasions)} مناسبت پیش‌فرض ایجاد شد")
+                logger.info(f"{len(DEFAULT_OCCASIONS)} مناسبت پیش‌فرض ایجاد شد")
             else:
                 logger.info(f"جدول occasions دارای {count} مناسبت است")
         except Exception as e:
@@ -418,6 +1380,31 @@ class RepeatPattern(BaseModel):
     end_date: Optional[datetime] = None
     occurrences: Optional[int] = None
 
+class SeriesOccurrenceUpdate(BaseModel):
+    occurrence_time: datetime
+    title: Optional[str] = None
+    time: Optional[datetime] = None
+    location: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    host: Optional[str] = None
+    capacity: Optional[int] = None
+
+class SeriesUpdate(BaseModel):
+    title: Optional[str] = None
+    location: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    host: Optional[str] = None
+    category: Optional[str] = None
+    subcategory: Optional[str] = None
+    capacity: Optional[int] = None
+    is_free: Optional[bool] = None
+    price: Optional[float] = None
+
+class SeriesShift(BaseModel):
+    minutes: int
+
 class UserCreate(BaseModel):
     first_name: str
     last_name: str
@@ -489,6 +1476,7 @@ class EventResponse(BaseModel):
     price: Optional[float] = 0.0
     average_rating: Optional[float] = 0.0
     comment_count: Optional[int] = 0
+    favorite_count: Optional[int] = 0
     current_participants: Optional[int] = 0
     is_favorite: Optional[bool] = False
     is_registered: Optional[bool] = False
@@ -514,6 +1502,75 @@ class CommentResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class CommentSummary(BaseModel):
+    comment_count: int
+    average_rating: float
+    rating_histogram: Dict[str, int]
+
+class CommentPageResponse(BaseModel):
+    items: List[CommentResponse]
+    next_cursor: Optional[str] = None
+    summary: Optional[CommentSummary] = None
+
+class RosterEntry(BaseModel):
+    id: int
+    user_id: int
+    user_name: str
+    email: Optional[str] = None
+    phone_number: Optional[str] = None
+    registered_at: Optional[datetime] = None
+    attended: bool
+    attended_at: Optional[datetime] = None
+
+class RosterPageResponse(BaseModel):
+    items: List[RosterEntry]
+    next_cursor: Optional[str] = None
+
+class CheckInBatch(BaseModel):
+    user_ids: List[int] = []
+    registration_ids: List[int] = []
+
+class CheckInSyncEntry(BaseModel):
+    user_id: Optional[int] = None
+    registration_id: Optional[int] = None
+    checked_in_at: datetime
+
+class CheckInSyncBatch(BaseModel):
+    device_id: Optional[str] = None
+    entries: List[CheckInSyncEntry]
+
+class CheckInResult(BaseModel):
+    registration_id: int
+    user_id: int
+    attended_at: Optional[datetime] = None
+
+class CheckInResponse(BaseModel):
+    newly_marked: List[CheckInResult]
+    already_marked: List[CheckInResult]
+    unknown_user_ids: List[int]
+    unknown_registration_ids: List[int]
+
+class NotificationFanOutCreate(BaseModel):
+    audience: str  # event, province
+    event_id: Optional[int] = None
+    province: Optional[str] = None
+    title: str
+    message: str
+    type: str = "info"
+
+class NotificationJobResponse(BaseModel):
+    id: int
+    audience: str
+    audience_key: str
+    status: str
+    total: int
+    sent: int
+    progress: float
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
 class EventParticipantCreate(BaseModel):
     event_id: int
     user_id: int
@@ -575,6 +1632,13 @@ class FavoriteResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class NotificationIdsBatch(BaseModel):
+    ids: List[int]
+
+class FavoriteBatch(BaseModel):
+    add: List[int] = []
+    remove: List[int] = []
+
 # مدل‌های جدید برای OTP
 class OTPSendRequest(BaseModel):
     email: str
@@ -676,7 +1740,8 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
             
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
-        if email is None:
+        # توکن‌های محدود (مثل توکن جریان نوتیفیکیشن) جای توکن ورود را نمی‌گیرند
+        if email is None or payload.get("scope"):
             raise credentials_exception
             
         user = db.query(User).filter(User.email == email).first()
@@ -701,6 +1766,14 @@ async def get_optional_current_user(token: str = Depends(oauth2_scheme), db: Ses
     except HTTPException:
         return None
 
+# ثبت نوشتن‌های موفق برای read-your-writes
+@app.middleware("http")
+async def mark_write_stickiness(request: Request, call_next):
+    response = await call_next(request)
+    if replica_set.replicas and request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        write_stickiness.mark(get_sticky_key(request))
+    return response
+
 # تنظیمات CORS
 app.add_middleware(
     CORSMiddleware,
@@ -719,6 +1792,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # سرویس ارسال پیامک
@@ -1101,6 +2175,79 @@ async def signup_step1(user: SignupStep1Request, db: Session = Depends(get_db)):
         )
 
 # 🎯 API برای ثبت‌نام در رویداد
+# افزایش شمارنده فقط وقتی هنوز جا هست؛ rowcount صفر یعنی ظرفیت پر است یا ردیف آمار وجود ندارد
+SEAT_RESERVE_UPDATE = text("""
+    UPDATE event_stats s
+    JOIN events e ON e.id = s.event_id
+    SET s.participant_count = s.participant_count + 1
+    WHERE s.event_id = :event_id AND s.participant_count < e.capacity
+""")
+
+SEAT_RELEASE_UPDATE = text("""
+    UPDATE event_stats
+    SET participant_count = GREATEST(participant_count - :count, 0)
+    WHERE event_id = :event_id
+""")
+
+def get_waitlist_position(db: Session, event_id: int, user_id: int) -> Optional[int]:
+    """جایگاه کاربر در صف انتظار (از ۱) یا None اگر در صف نیست"""
+    entry_id = db.query(EventWaitlist.id).filter(
+        EventWaitlist.event_id == event_id,
+        EventWaitlist.user_id == user_id
+    ).scalar()
+    if entry_id is None:
+        return None
+    return db.query(func.count(EventWaitlist.id)).filter(
+        EventWaitlist.event_id == event_id,
+        EventWaitlist.id <= entry_id
+    ).scalar()
+
+def promote_waitlist(db: Session, event_id: int, event_title: str) -> List[int]:
+    """
+    انتقال سر صف انتظار به شرکت‌کنندگان تا زمانی که صندلی خالی وجود دارد
+    (commit با فراخواننده؛ ردیف سر صف قفل می‌شود تا دو لغو همزمان یک نفر را دو بار ارتقا ندهند)
+    """
+    promoted = []
+    while True:
+        head = db.query(EventWaitlist).filter(
+            EventWaitlist.event_id == event_id
+        ).order_by(EventWaitlist.id).with_for_update().first()
+        if not head or not reserve_event_seat(db, event_id):
+            break
+        
+        inserted = db.execute(
+            mysql_insert(EventParticipant).prefix_with("IGNORE").values(
+                event_id=event_id,
+                user_id=head.user_id,
+                registered_at=datetime.utcnow()
+            )
+        ).rowcount
+        db.delete(head)
+        if not inserted:
+            # کاربر در این فاصله مستقیم ثبت‌نام کرده است
+            release_event_seats(db, event_id)
+            db.flush()
+            continue
+        
+        adjust_user_summary(db, head.user_id, registrations=1)
+        create_notification(
+            db,
+            user_id=head.user_id,
+            title="ثبت‌نام از لیست انتظار",
+            message=f"یک جای خالی در رویداد '{event_title}' آزاد شد و ثبت‌نام شما انجام شد.",
+            type="success"
+        )
+        db.flush()
+        promoted.append(head.user_id)
+    return promoted
+
+def reserve_event_seat(db: Session, event_id: int) -> bool:
+    return db.execute(SEAT_RESERVE_UPDATE, {"event_id": event_id}).rowcount == 1
+
+def release_event_seats(db: Session, event_id: int, count: int = 1):
+    if count:
+        db.execute(SEAT_RELEASE_UPDATE, {"event_id": event_id, "count": count})
+
 @app.post("/events/{event_id}/register")
 async def register_for_event(
     event_id: int,
@@ -1117,52 +2264,99 @@ async def register_for_event(
                 detail="برای ثبت‌نام در رویداد باید وارد شوید"
             )
         
-        event = db.query(Event).filter(Event.id == event_id).first()
-        if not event:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="رویداد یافت نشد"
-            )
-        
-        existing_registration = db.query(EventParticipant).filter(
-            EventParticipant.event_id == event_id,
-            EventParticipant.user_id == current_user.id
-        ).first()
+        # رزرو صندلی: شرط ظرفیت و افزایش شمارنده در یک UPDATE اتمیک روی ردیف event_stats
+        if not reserve_event_seat(db, event_id):
+            ensure_event_stats_row(db, event_id)
+            if not reserve_event_seat(db, event_id):
+                event_title = db.query(Event.title).filter(Event.id == event_id).scalar()
+                if event_title is None:
+                    db.rollback()
+                    raise HTTPException(
+                        status_code=status.HTTP_404_NOT_FOUND,
+                        detail="رویداد یافت نشد"
+                    )
+                
+                already_registered = db.query(EventParticipant.id).filter(
+                    EventParticipant.event_id == event_id,
+                    EventParticipant.user_id == current_user.id
+                ).first()
+                if already_registered:
+                    db.rollback()
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail="شما قبلاً در این رویداد ثبت‌نام کرده‌اید"
+                    )
+                
+                # ظرفیت پر است: ورود به صف انتظار (تکرار درخواست همان جایگاه را برمی‌گرداند)
+                db.execute(
+                    mysql_insert(EventWaitlist).prefix_with("IGNORE").values(
+                        event_id=event_id,
+                        user_id=current_user.id,
+                        created_at=datetime.utcnow()
+                    )
+                )
+                # لغو همزمانی که بین رزرو ناموفق و ورود به صف commit شده صف را خالی دیده و
+                # صندلی را آزاد گذاشته است؛ صف همین‌جا دوباره بررسی می‌شود
+                promoted = promote_waitlist(db, event_id, event_title)
+                db.commit()
+                if current_user.id in promoted:
+                    registration_id = db.query(EventParticipant.id).filter(
+                        EventParticipant.event_id == event_id,
+                        EventParticipant.user_id == current_user.id
+                    ).scalar()
+                    return {
+                        "message": "ثبت‌نام با موفقیت انجام شد",
+                        "registration_id": registration_id
+                    }
+                position = get_waitlist_position(db, event_id, current_user.id)
+                
+                return JSONResponse(
+                    status_code=status.HTTP_202_ACCEPTED,
+                    content={
+                        "message": "ظرفیت رویداد تکمیل شده است؛ شما در لیست انتظار قرار گرفتید",
+                        "waitlisted": True,
+                        "position": position
+                    }
+                )
         
-        if existing_registration:
+        # ایندکس یکتای (event_id, user_id) مانع ثبت‌نام تکراری است؛ rollback صندلی رزروشده را آزاد می‌کند
+        try:
+            registration_id = db.execute(
+                insert(EventParticipant).values(
+                    event_id=event_id,
+                    user_id=current_user.id,
+                    registered_at=datetime.utcnow()
+                )
+            ).lastrowid
+        except IntegrityError:
+            db.rollback()
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="شما قبلاً در این رویداد ثبت‌نام کرده‌اید"
             )
         
-        current_participants = db.query(EventParticipant).filter(EventParticipant.event_id == event_id).count()
-        if current_participants >= event.capacity:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="ظرفیت رویداد تکمیل شده است"
-            )
+        adjust_user_summary(db, current_user.id, registrations=1)
         
-        registration = EventParticipant(
-            event_id=event_id,
-            user_id=current_user.id
-        )
-        db.add(registration)
-        db.commit()
-        db.refresh(registration)
+        # اگر کاربر در صف انتظار بوده، از صف خارج می‌شود
+        db.query(EventWaitlist).filter(
+            EventWaitlist.event_id == event_id,
+            EventWaitlist.user_id == current_user.id
+        ).delete(synchronize_session=False)
         
-        # ایجاد نوتیفیکیشن
-        notification = Notification(
+        # ایجاد نوتیفیکیشن در همان تراکنش
+        event_title = db.query(Event.title).filter(Event.id == event_id).scalar()
+        create_notification(
+            db,
             user_id=current_user.id,
             title="ثبت‌نام موفق",
-            message=f"شما با موفقیت در رویداد '{event.title}' ثبت‌نام کردید.",
+            message=f"شما با موفقیت در رویداد '{event_title}' ثبت‌نام کردید.",
             type="success"
         )
-        db.add(notification)
         db.commit()
         
         return {
             "message": "ثبت‌نام با موفقیت انجام شد",
-            "registration_id": registration.id
+            "registration_id": registration_id
         }
         
     except HTTPException:
@@ -1208,42 +2402,50 @@ async def create_event(event: EventCreate, current_user: User = Depends(get_curr
         if not event.province:
             event.province = current_user.province if current_user else "تهران"
         
-        # استفاده از تابع موجود برای ایجاد رویدادهای تکراری
-        events_to_create = generate_recurring_events(event, db)
-        created_events = []
-        
-        for event_obj in events_to_create:
-            db.add(event_obj)
-            db.flush()
-            created_events.append(event_obj)
+        if event.repeat_pattern:
+            if event.repeat_pattern.type not in RECURRENCE_FREQUENCIES:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="نوع تکرار نامعتبر است"
+                )
+            # فقط نوبت‌های داخل افق زمانی ساخته می‌شوند، بقیه به مرور
+            series = create_event_series(event, db)
+            created_count = materialize_series(db, series, series_horizon_end(series))
+            first_event = db.query(Event).filter(
+                Event.series_id == series.id
+            ).order_by(Event.occurrence_time).first()
+        else:
+            first_event = build_event_row(event_template(event), event.time)
+            db.add(first_event)
+            adjust_user_summary(db, event.creator, events_created=1)
+            created_count = 1
         
         db.commit()
+        db.refresh(first_event)
+        invalidate_event_caches()
         
-        for event_obj in created_events:
-            db.refresh(event_obj)
-        
-        logger.info(f"{len(created_events)} رویداد با موفقیت ایجاد شد")
+        logger.info(f"{created_count} رویداد با موفقیت ایجاد شد")
         
         return EventResponse(
-            id=created_events[0].id,
-            title=created_events[0].title,
-            time=created_events[0].time,
-            location=created_events[0].location,
-            latitude=created_events[0].latitude,
-            longitude=created_events[0].longitude,
-            host=created_events[0].host,
-            creator=created_events[0].creator,
-            created_at=created_events[0].created_at,
-            type=created_events[0].type,
-            category=created_events[0].category,
-            subcategory=created_events[0].subcategory,
-            city=created_events[0].city,
-            province=created_events[0].province,
-            country=created_events[0].country,
-            capacity=created_events[0].capacity,
-            active=created_events[0].active,
-            is_free=created_events[0].is_free,
-            price=created_events[0].price
+            id=first_event.id,
+            title=first_event.title,
+            time=first_event.time,
+            location=first_event.location,
+            latitude=first_event.latitude,
+            longitude=first_event.longitude,
+            host=first_event.host,
+            creator=first_event.creator,
+            created_at=first_event.created_at,
+            type=first_event.type,
+            category=first_event.category,
+            subcategory=first_event.subcategory,
+            city=first_event.city,
+            province=first_event.province,
+            country=first_event.country,
+            capacity=first_event.capacity,
+            active=first_event.active,
+            is_free=first_event.is_free,
+            price=first_event.price
         )
         
     except HTTPException:
@@ -1303,13 +2505,13 @@ async def make_donation(
         card_number = "6219861918435032"
         
         # ایجاد نوتیفیکیشن
-        notification = Notification(
+        create_notification(
+            db,
             user_id=current_user.id,
             title="درخواست پرداخت نذری",
             message=f"برای پرداخت نذری {donation_data.donation_type}، مبلغ را به شماره کارت {card_number} واریز کنید.",
             type="donation"
         )
-        db.add(notification)
         db.commit()
         
         return {
@@ -1492,138 +2694,635 @@ async def get_categories():
     
     return categories
 
-# تابع ایجاد رویدادهای تکراری
-def generate_recurring_events(base_event: EventCreate, db: Session) -> List[Event]:
-    events = []
-    
-    if not base_event.repeat_pattern:
-        db_event = Event(
-            title=base_event.title,
-            time=base_event.time,
-            location=base_event.location,
-            latitude=base_event.latitude,
-            longitude=base_event.longitude,
-            host=base_event.host,
-            creator=base_event.creator,
-            type=base_event.type,
-            category=base_event.category,
-            subcategory=base_event.subcategory,
-            city=base_event.city,
-            province=base_event.province,
-            country=base_event.country,
-            capacity=base_event.capacity,
-            is_free=base_event.is_free,
-            price=base_event.price
-        )
-        events.append(db_event)
-        return events
-    
-    pattern = base_event.repeat_pattern
-    current_date = base_event.time
-    event_count = 1
-    
-    end_date = pattern.end_date
-    max_occurrences = pattern.occurrences or 365
-    
-    first_event = Event(
-        title=base_event.title,
-        time=current_date,
-        location=base_event.location,
-        latitude=base_event.latitude,
-        longitude=base_event.longitude,
-        host=base_event.host,
-        creator=base_event.creator,
-        type=base_event.type,
-        category=base_event.category,
-        subcategory=base_event.subcategory,
-        city=base_event.city,
-        province=base_event.province,
-        country=base_event.country,
-        capacity=base_event.capacity,
-        is_free=base_event.is_free,
-        price=base_event.price
-    )
-    events.append(first_event)
-    
-    while event_count < max_occurrences:
-        if end_date and current_date > end_date:
-            break
+# ===================== رویدادهای تکراری (سری) =====================
+
+RECURRENCE_FREQUENCIES = ("daily", "weekly", "monthly", "yearly")
+# نوبت‌های یک سری فقط تا این تعداد روز آینده در جدول events ساخته می‌شوند (0 = کل سری)
+RECURRENCE_HORIZON_DAYS = int(os.getenv("MANAREH_RECURRENCE_HORIZON_DAYS", "60"))
+MAX_SERIES_OCCURRENCES = int(os.getenv("MANAREH_MAX_SERIES_OCCURRENCES", "365"))
+SERIES_EXTEND_INTERVAL = float(os.getenv("MANAREH_SERIES_EXTEND_INTERVAL", "3600"))
+SERIES_END_OF_TIME = datetime(9999, 12, 31)
+
+EVENT_TEMPLATE_FIELDS = [
+    "title", "location", "latitude", "longitude", "host", "creator", "type", "category",
+    "subcategory", "city", "province", "country", "capacity", "is_free", "price"
+]
+
+def to_naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """تبدیل زمان دارای timezone به UTC بدون timezone (مثل ستون‌های DATETIME)"""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+def event_template(base_event: EventCreate) -> Dict[str, Any]:
+    return {field: getattr(base_event, field) for field in EVENT_TEMPLATE_FIELDS}
+
+def build_event_values(template: Dict[str, Any], event_time: datetime, series_id: Optional[int] = None) -> Dict[str, Any]:
+    return {
+        **template,
+        "time": event_time,
+        "series_id": series_id,
+        "occurrence_time": event_time if series_id else None,
+        "active": 1,
+        "created_at": datetime.utcnow()
+    }
+
+def build_event_row(template: Dict[str, Any], event_time: datetime, series_id: Optional[int] = None) -> Event:
+    return Event(**build_event_values(template, event_time, series_id))
+
+def add_months(value: datetime, months: int, day: int) -> datetime:
+    month_index = value.month - 1 + months
+    year = value.year + month_index // 12
+    month = month_index % 12 + 1
+    last_day = calendar.monthrange(year, month)[1]
+    return value.replace(year=year, month=month, day=min(day, last_day))
+
+def iter_series_base_occurrences(series: EventSeries):
+    """
+    تولید تنبل زمان نوبت‌ها طبق قانون اصلی سری (بدون جابجایی‌ها) - اولین نوبت همیشه dtstart است
+    """
+    start = series.dtstart
+    interval = max(series.repeat_interval or 1, 1)
+    limit = min(series.occurrence_count or MAX_SERIES_OCCURRENCES, MAX_SERIES_OCCURRENCES)
+    weekdays = sorted({int(day) for day in (series.by_weekday or "").split(",") if day.strip()})
+    
+    yield start
+    produced = 1
+    if series.freq not in RECURRENCE_FREQUENCIES:
+        return
+    
+    step = 0
+    while produced < limit:
+        if series.freq == "daily":
+            candidates = [start + timedelta(days=step * interval)]
+        elif series.freq == "weekly" and weekdays:
+            week_start = start - timedelta(days=start.weekday()) + timedelta(weeks=step * interval)
+            candidates = [week_start + timedelta(days=day) for day in weekdays]
+        elif series.freq == "weekly":
+            candidates = [start + timedelta(weeks=step * interval)]
+        elif series.freq == "monthly":
+            candidates = [add_months(start, step * interval, series.by_month_day or start.day)]
+        else:
+            candidates = [add_months(start, step * interval * 12, start.day)]
         
-        if pattern.type == 'daily':
-            current_date = current_date + timedelta(days=pattern.interval)
-        elif pattern.type == 'weekly':
-            current_date = current_date + timedelta(weeks=pattern.interval)
-            if pattern.days:
-                current_weekday = current_date.weekday()
-                for day in sorted(pattern.days):
-                    if day > current_weekday:
-                        days_to_add = day - current_weekday
-                        current_date = current_date + timedelta(days=days_to_add)
-                        break
-        elif pattern.type == 'monthly':
-            next_month = current_date.month + pattern.interval
-            next_year = current_date.year + (next_month - 1) // 12
-            next_month = (next_month - 1) % 12 + 1
-            
-            if pattern.day_of_month:
-                day_of_month = pattern.day_of_month
-            else:
-                day_of_month = current_date.day
-            
-            try:
-                current_date = current_date.replace(year=next_year, month=next_month, day=day_of_month)
-            except ValueError:
-                import calendar
-                last_day = calendar.monthrange(next_year, next_month)[1]
-                current_date = current_date.replace(year=next_year, month=next_month, day=last_day)
+        for occurrence in candidates:
+            if occurrence <= start:
+                continue
+            if series.until and occurrence > series.until:
+                return
+            yield occurrence
+            produced += 1
+            if produced >= limit:
+                return
+        step += 1
+
+def series_time_shifts(series: EventSeries) -> List[Any]:
+    return [(datetime.fromisoformat(pivot), minutes) for pivot, minutes in json.loads(series.time_shifts or "[]")]
+
+def iter_series_occurrence_pairs(series: EventSeries):
+    """
+    (زمان طبق قانون اصلی، زمان واقعی نوبت) - هر جابجایی فقط نوبت‌های از نقطه خودش به بعد را جابجا می‌کند
+    تا نوبت‌های گذشته با ردیف‌های events و استثناهای ذخیره‌شده یکی بمانند
+    """
+    shifts = series_time_shifts(series)
+    for base in iter_series_base_occurrences(series):
+        minutes = sum(shift_minutes for pivot, shift_minutes in shifts if base >= pivot)
+        yield base, base + timedelta(minutes=minutes) if minutes else base
+
+def iter_series_occurrences(series: EventSeries):
+    """تولید تنبل زمان واقعی نوبت‌های سری (با اعمال جابجایی‌ها)"""
+    for _, occurrence in iter_series_occurrence_pairs(series):
+        yield occurrence
+
+def expand_series(series: EventSeries, window_start: datetime, window_end: datetime) -> List[datetime]:
+    """نوبت‌های سری در بازه زمانی درخواستی، بدون نیاز به ردیف در دیتابیس"""
+    occurrences = []
+    for occurrence in iter_series_occurrences(series):
+        if occurrence > window_end:
+            break
+        if occurrence >= window_start:
+            occurrences.append(occurrence)
+    return occurrences
+
+def series_horizon_end(series: EventSeries) -> datetime:
+    if RECURRENCE_HORIZON_DAYS <= 0:
+        return SERIES_END_OF_TIME
+    return max(datetime.utcnow() + timedelta(days=RECURRENCE_HORIZON_DAYS), series.dtstart)
+
+def create_event_series(base_event: EventCreate, db: Session) -> EventSeries:
+    pattern = base_event.repeat_pattern
+    series = EventSeries(
+        creator=base_event.creator,
+        template=json.dumps(event_template(base_event), ensure_ascii=False),
+        freq=pattern.type,
+        repeat_interval=max(pattern.interval or 1, 1),
+        by_weekday=",".join(str(day) for day in pattern.days) if pattern.days else None,
+        by_month_day=pattern.day_of_month,
+        dtstart=to_naive_utc(base_event.time),
+        until=to_naive_utc(pattern.end_date),
+        occurrence_count=pattern.occurrences
+    )
+    db.add(series)
+    db.flush()
+    return series
+
+def materialize_series(db: Session, series: EventSeries, until: datetime) -> int:
+    """
+    ساخت ردیف events برای نوبت‌های سری تا زمان مشخص با یک INSERT چندردیفی
+    نوبت‌های لغو/تغییر یافته رد می‌شوند - خروجی: تعداد ردیف‌های ساخته شده
+    """
+    if series.fully_materialized or not series.active:
+        return 0
+    
+    template = json.loads(series.template)
+    after = series.materialized_until
+    exceptions_query = db.query(EventSeriesException.occurrence_time).filter(EventSeriesException.series_id == series.id)
+    if after is not None:
+        exceptions_query = exceptions_query.filter(EventSeriesException.occurrence_time > after)
+    skipped = {row.occurrence_time for row in exceptions_query}
+    
+    rows = []
+    exhausted = True
+    for occurrence in iter_series_occurrences(series):
+        if after is not None and occurrence <= after:
+            continue
+        if occurrence > until:
+            exhausted = False
+            break
+        if occurrence in skipped:
+            continue
+        rows.append(build_event_values(template, occurrence, series.id))
+    
+    if rows:
+        # executemany - یک رفت و برگشت به جای add/flush/refresh برای هر نوبت
+        db.execute(insert(Event), rows)
+        adjust_user_summary(db, series.creator, events_created=len(rows))
+    
+    series.materialized_until = until
+    series.fully_materialized = exhausted
+    return len(rows)
+
+def extend_series_horizons() -> int:
+    """ادامه ساخت نوبت‌های سری‌های فعال تا افق زمانی"""
+    if RECURRENCE_HORIZON_DAYS <= 0:
+        return 0
+    
+    horizon_end = datetime.utcnow() + timedelta(days=RECURRENCE_HORIZON_DAYS)
+    created_count = 0
+    db = SessionLocal()
+    try:
+        series_ids = [row.id for row in db.query(EventSeries.id).filter(
+            EventSeries.active == 1,
+            EventSeries.fully_materialized == False,
+            or_(EventSeries.materialized_until == None, EventSeries.materialized_until < horizon_end)
+        )]
+        
+        for series_id in series_ids:
+            # قفل ردیف سری تا چند worker نوبت تکراری نسازند
+            series = db.query(EventSeries).filter(EventSeries.id == series_id).with_for_update().first()
+            if series and (series.materialized_until is None or series.materialized_until < horizon_end):
+                created_count += materialize_series(db, series, horizon_end)
+            db.commit()
         
-        elif pattern.type == 'yearly':
-            current_date = current_date.replace(year=current_date.year + pattern.interval)
+        if created_count:
+            logger.info(f"{created_count} نوبت جدید برای سری‌های تکراری ساخته شد")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"خطا در ادامه ساخت نوبت‌های سری: {e}")
+    finally:
+        db.close()
+        # تعداد رویدادهای روزانه در تقویم و نقشه حرارتی هم تغییر کرده است
+        if created_count:
+            invalidate_event_caches()
+    return created_count
+
+def get_series_for_creator(db: Session, series_id: int, current_user: Optional[User]) -> EventSeries:
+    if not current_user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="برای مدیریت سری رویداد باید وارد شوید"
+        )
+    
+    series = db.query(EventSeries).filter(EventSeries.id == series_id).first()
+    if not series:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="سری رویداد یافت نشد"
+        )
+    
+    if series.creator != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="دسترسی غیرمجاز"
+        )
+    return series
+
+def ensure_series_occurrence(series: EventSeries, occurrence_time: datetime) -> datetime:
+    occurrence_time = to_naive_utc(occurrence_time)
+    if occurrence_time not in expand_series(series, occurrence_time, occurrence_time):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="این زمان جزو نوبت‌های سری نیست"
+        )
+    return occurrence_time
+
+@app.get("/events/series/{series_id}/occurrences")
+async def get_series_occurrences(
+    series_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: Session = Depends(get_read_db)
+):
+    """
+    نوبت‌های یک سری در بازه زمانی - بسط قانون تکرار در زمان درخواست
+    """
+    try:
+        series = db.query(EventSeries).filter(EventSeries.id == series_id).first()
+        if not series:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="سری رویداد یافت نشد"
+            )
         
-        if end_date and current_date > end_date:
-            break
+        window_start = to_naive_utc(start) or datetime.utcnow()
+        window_end = to_naive_utc(end) or window_start + timedelta(days=RECURRENCE_HORIZON_DAYS or 60)
+        if window_end < window_start:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="پایان بازه باید بعد از شروع آن باشد"
+            )
         
-        new_event = Event(
-            title=base_event.title,
-            time=current_date,
-            location=base_event.location,
-            latitude=base_event.latitude,
-            longitude=base_event.longitude,
-            host=base_event.host,
-            creator=base_event.creator,
-            type=base_event.type,
-            category=base_event.category,
-            subcategory=base_event.subcategory,
-            city=base_event.city,
-            province=base_event.province,
-            country=base_event.country,
-            capacity=base_event.capacity,
-            is_free=base_event.is_free,
-            price=base_event.price
-        )
-        events.append(new_event)
-        event_count += 1
-        
-        if event_count >= 365:
-            break
+        occurrences = expand_series(series, window_start, window_end)
+        
+        exceptions = {
+            exc.occurrence_time: exc
+            for exc in db.query(EventSeriesException).filter(
+                EventSeriesException.series_id == series_id,
+                EventSeriesException.occurrence_time >= window_start,
+                EventSeriesException.occurrence_time <= window_end
+            )
+        }
+        rows = {
+            row.occurrence_time: row
+            for row in db.query(Event).filter(
+                Event.series_id == series_id,
+                Event.occurrence_time >= window_start,
+                Event.occurrence_time <= window_end
+            )
+        }
+        
+        items = []
+        for occurrence in occurrences:
+            exc = exceptions.get(occurrence)
+            row = rows.get(occurrence)
+            cancelled = bool(exc and exc.cancelled)
+            items.append({
+                "occurrence_time": occurrence,
+                "time": row.time if row and not cancelled else occurrence,
+                "event_id": row.id if row and not cancelled else None,
+                "cancelled": cancelled,
+                "overridden": bool(exc and not exc.cancelled)
+            })
+        
+        return {
+            "series_id": series.id,
+            "active": series.active,
+            "rule": {
+                "type": series.freq,
+                "interval": series.repeat_interval,
+                "days": [int(day) for day in series.by_weekday.split(",")] if series.by_weekday else None,
+                "day_of_month": series.by_month_day,
+                "start": series.dtstart,
+                "end_date": series.until,
+                "occurrences": series.occurrence_count,
+                "time_shifts": [[pivot, minutes] for pivot, minutes in series_time_shifts(series)]
+            },
+            "template": json.loads(series.template),
+            "occurrences": items
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"خطا در دریافت نوبت‌های سری: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="خطای سرور در دریافت نوبت‌های سری"
+        )
+
+@app.put("/events/series/{series_id}/occurrences")
+async def override_series_occurrence(
+    series_id: int,
+    update: SeriesOccurrenceUpdate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    تغییر یک نوبت خاص از سری - به صورت ردیف استثنا ذخیره می‌شود
+    """
+    try:
+        series = get_series_for_creator(db, series_id, current_user)
+        occurrence_time = ensure_series_occurrence(series, update.occurrence_time)
+        
+        exc = db.query(EventSeriesException).filter(
+            EventSeriesException.series_id == series_id,
+            EventSeriesException.occurrence_time == occurrence_time
+        ).first()
+        if exc and exc.cancelled:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="این نوبت لغو شده است"
+            )
+        
+        event_obj = db.query(Event).filter(
+            Event.series_id == series_id,
+            Event.occurrence_time == occurrence_time
+        ).first()
+        if not event_obj:
+            event_obj = build_event_row(json.loads(series.template), occurrence_time, series.id)
+            db.add(event_obj)
+            adjust_user_summary(db, series.creator, events_created=1)
+        
+        changes = update.model_dump(exclude_unset=True, exclude={"occurrence_time"})
+        for field, value in changes.items():
+            if value is not None:
+                setattr(event_obj, field, to_naive_utc(value) if field == "time" else value)
+        db.flush()
+        
+        if not exc:
+            exc = EventSeriesException(series_id=series_id, occurrence_time=occurrence_time)
+            db.add(exc)
+        exc.event_id = event_obj.id
+        db.commit()
+        invalidate_event_caches()
+        
+        return {"message": "نوبت رویداد با موفقیت تغییر کرد", "event_id": event_obj.id}
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        logger.error(f"خطا در تغییر نوبت سری: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="خطای سرور در تغییر نوبت رویداد"
+        )
+
+@app.delete("/events/series/{series_id}/occurrences")
+async def cancel_series_occurrence(
+    series_id: int,
+    occurrence_time: datetime,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    لغو یک نوبت خاص از سری
+    """
+    try:
+        series = get_series_for_creator(db, series_id, current_user)
+        occurrence_time = ensure_series_occurrence(series, occurrence_time)
+        
+        exc = db.query(EventSeriesException).filter(
+            EventSeriesException.series_id == series_id,
+            EventSeriesException.occurrence_time == occurrence_time
+        ).first()
+        if not exc:
+            exc = EventSeriesException(series_id=series_id, occurrence_time=occurrence_time)
+            db.add(exc)
+        exc.cancelled = True
+        
+        db.query(Event).filter(
+            Event.series_id == series_id,
+            Event.occurrence_time == occurrence_time
+        ).update({"active": 0}, synchronize_session=False)
+        db.commit()
+        invalidate_event_caches()
+        
+        return {"message": "نوبت رویداد لغو شد"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        logger.error(f"خطا در لغو نوبت سری: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="خطای سرور در لغو نوبت رویداد"
+        )
+
+def notify_series_participants(db: Session, series_id: int, since: datetime, title: str, message: str, notification_type: str = "info") -> int:
+    """
+    یک نوتیفیکیشن برای هر شرکت‌کننده نوبت‌های آینده سری با یک INSERT چندردیفی
+    گیرندگان یک بار خوانده می‌شوند و همان لیست برای شمارنده، کش آمار و push پس از commit استفاده می‌شود
+    """
+    recipients = [
+        row.user_id
+        for row in db.query(EventParticipant.user_id).join(
+            Event, Event.id == EventParticipant.event_id
+        ).filter(
+            Event.series_id == series_id,
+            Event.time >= since,
+            Event.active == 1
+        ).distinct()
+    ]
+    if not recipients:
+        return 0
     
-    return events
+    created_at = datetime.utcnow()
+    db.execute(insert(Notification), [
+        {
+            "user_id": user_id,
+            "title": title,
+            "message": message,
+            "type": notification_type,
+            "read": False,
+            "created_at": created_at
+        }
+        for user_id in recipients
+    ])
+    increment_unread_notifications(db, recipients)
+    return len(recipients)
+
+def future_series_events(series_id: int, since: datetime):
+    return [Event.series_id == series_id, Event.time >= since, Event.active == 1]
+
+@app.put("/events/series/{series_id}")
+async def update_event_series(
+    series_id: int,
+    update: SeriesUpdate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    ویرایش همه نوبت‌های آینده سری با یک UPDATE - نوبت‌هایی که جداگانه تغییر کرده‌اند دست نمی‌خورند
+    """
+    try:
+        series = get_series_for_creator(db, series_id, current_user)
+        changes = {field: value for field, value in update.model_dump(exclude_unset=True).items() if value is not None}
+        if not changes:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="هیچ فیلدی برای تغییر ارسال نشده است"
+            )
+        
+        now = datetime.utcnow()
+        overridden_ids = select(EventSeriesException.event_id).where(
+            EventSeriesException.series_id == series_id,
+            EventSeriesException.event_id != None
+        )
+        updated = db.query(Event).filter(
+            *future_series_events(series_id, now),
+            ~Event.id.in_(overridden_ids)
+        ).update(changes, synchronize_session=False)
+        
+        # نوبت‌هایی که بعداً ساخته می‌شوند هم مقادیر جدید را بگیرند
+        template = json.loads(series.template)
+        template.update(changes)
+        series.template = json.dumps(template, ensure_ascii=False)
+        
+        notified = notify_series_participants(
+            db, series_id, now,
+            "تغییر رویداد",
+            f"جزئیات رویداد تکراری '{template['title']}' تغییر کرد.",
+        )
+        db.commit()
+        invalidate_event_caches()
+        
+        logger.info(f"{updated} نوبت از سری {series_id} به‌روزرسانی شد")
+        return {"message": "نوبت‌های آینده سری به‌روزرسانی شدند", "updated": updated, "notified": notified}
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        logger.error(f"خطا در به‌روزرسانی سری: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="خطای سرور در به‌روزرسانی سری رویداد"
+        )
+
+@app.post("/events/series/{series_id}/shift")
+async def shift_event_series(
+    series_id: int,
+    shift: SeriesShift,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    جابجایی زمان همه نوبت‌های آینده سری به اندازه چند دقیقه
+    """
+    try:
+        series = get_series_for_creator(db, series_id, current_user)
+        if shift.minutes == 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="مقدار جابجایی نباید صفر باشد"
+            )
+        
+        now = datetime.utcnow()
+        # نقطه جابجایی: اولین نوبتی که هنوز نرسیده؛ قانون اصلی و نوبت‌های گذشته دست نمی‌خورند
+        pivot = next((base for base, occurrence in iter_series_occurrence_pairs(series) if occurrence >= now), None)
+        if pivot is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="این سری نوبت آینده‌ای ندارد"
+            )
+        
+        # اطلاع‌رسانی قبل از UPDATE تا همان نوبت‌های آینده فعلی انتخاب شوند
+        notified = notify_series_participants(
+            db, series_id, now,
+            "تغییر زمان رویداد",
+            f"زمان نوبت‌های آینده رویداد '{json.loads(series.template)['title']}' تغییر کرد.",
+        )
+        
+        # ردیف‌ها و استثناها هر دو با کلید occurrence_time انتخاب می‌شوند تا نوبت‌های تغییریافته
+        # (که time آن‌ها با occurrence_time فرق دارد) و نوبت‌های لغوشده هم یکسان جابجا شوند
+        updated = db.query(Event).filter(
+            Event.series_id == series_id,
+            Event.occurrence_time >= now
+        ).update({
+            "time": func.timestampadd(text("MINUTE"), shift.minutes, Event.time),
+            "occurrence_time": func.timestampadd(text("MINUTE"), shift.minutes, Event.occurrence_time)
+        }, synchronize_session=False)
+        db.query(EventSeriesException).filter(
+            EventSeriesException.series_id == series_id,
+            EventSeriesException.occurrence_time >= now
+        ).update({
+            "occurrence_time": func.timestampadd(text("MINUTE"), shift.minutes, EventSeriesException.occurrence_time)
+        }, synchronize_session=False)
+        
+        # جابجایی فقط از نقطه pivot به بعد در قانون ثبت می‌شود تا نوبت‌های بعدی با زمان جدید ساخته شوند
+        shifts = json.loads(series.time_shifts or "[]")
+        shifts.append([pivot.isoformat(), shift.minutes])
+        series.time_shifts = json.dumps(shifts)
+        if series.materialized_until and now <= series.materialized_until < SERIES_END_OF_TIME:
+            series.materialized_until = series.materialized_until + timedelta(minutes=shift.minutes)
+        
+        db.commit()
+        invalidate_event_caches()
+        
+        logger.info(f"{updated} نوبت از سری {series_id} به اندازه {shift.minutes} دقیقه جابجا شد")
+        return {"message": "زمان نوبت‌های آینده سری تغییر کرد", "updated": updated, "notified": notified}
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        logger.error(f"خطا در جابجایی سری: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="خطای سرور در جابجایی سری رویداد"
+        )
+
+@app.delete("/events/series/{series_id}")
+async def cancel_event_series(
+    series_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    لغو همه نوبت‌های آینده سری و توقف ساخت نوبت‌های جدید
+    """
+    try:
+        series = get_series_for_creator(db, series_id, current_user)
+        now = datetime.utcnow()
+        
+        notified = notify_series_participants(
+            db, series_id, now,
+            "لغو رویداد",
+            f"نوبت‌های آینده رویداد '{json.loads(series.template)['title']}' لغو شد.",
+            "warning"
+        )
+        updated = db.query(Event).filter(*future_series_events(series_id, now)).update(
+            {"active": 0}, synchronize_session=False
+        )
+        series.active = 0
+        
+        db.commit()
+        invalidate_event_caches()
+        
+        logger.info(f"سری {series_id} لغو شد ({updated} نوبت)")
+        return {"message": "سری رویداد لغو شد", "cancelled": updated, "notified": notified}
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        logger.error(f"خطا در لغو سری: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="خطای سرور در لغو سری رویداد"
+        )
 
 # سایر endpointهای موجود...
 @app.get("/events", response_model=List[EventResponse])
-async def get_events(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_events(current_user: User = Depends(get_current_user), db: Session = Depends(get_read_db)):
     try:
         logger.info(f"دریافت درخواست لیست رویدادها از کاربر: {current_user.email if current_user else 'Anonymous'}")
         events = db.query(Event).filter(Event.active == 1).all()
+        stats_by_event = load_event_stats(db, [event.id for event in events])
         
         events_list = []
         for event in events:
-            avg_rating_result = db.query(func.avg(Comment.rating)).filter(Comment.event_id == event.id).scalar()
-            average_rating = round(float(avg_rating_result or 0), 1)
-            
-            comment_count = db.query(Comment).filter(Comment.event_id == event.id).count()
+            stats = stats_by_event.get(event.id)
+            average_rating = event_average_rating(stats)
+            comment_count = stats.comment_count if stats else 0
             
-            current_participants = db.query(EventParticipant).filter(EventParticipant.event_id == event.id).count()
+            current_participants = stats.participant_count if stats else 0
             
             # بررسی آیا رویداد مورد علاقه کاربر است
             is_favorite = False
@@ -1665,6 +3364,7 @@ async def get_events(current_user: User = Depends(get_current_user), db: Session
                 "price": getattr(event, 'price', 0.0),
                 "average_rating": average_rating,
                 "comment_count": comment_count,
+                "favorite_count": stats.favorite_count if stats else 0,
                 "current_participants": current_participants,
                 "is_favorite": is_favorite,
                 "is_registered": is_registered
@@ -1683,21 +3383,21 @@ async def get_events(current_user: User = Depends(get_current_user), db: Session
 @app.get("/events/optimized", response_model=List[EventResponse])
 async def get_events_optimized(
     current_user: Optional[User] = Depends(get_optional_current_user), 
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Endpoint جدید برای دریافت بهینه‌شده رویدادها"""
     try:
         logger.info("دریافت درخواست لیست رویدادهای بهینه‌شده")
         events = db.query(Event).filter(Event.active == 1).all()
+        stats_by_event = load_event_stats(db, [event.id for event in events])
         
         events_list = []
         for event in events:
-            avg_rating_result = db.query(func.avg(Comment.rating)).filter(Comment.event_id == event.id).scalar()
-            average_rating = round(float(avg_rating_result or 0), 1)
-            
-            comment_count = db.query(Comment).filter(Comment.event_id == event.id).count()
+            stats = stats_by_event.get(event.id)
+            average_rating = event_average_rating(stats)
+            comment_count = stats.comment_count if stats else 0
             
-            current_participants = db.query(EventParticipant).filter(EventParticipant.event_id == event.id).count()
+            current_participants = stats.participant_count if stats else 0
             
             # بررسی آیا رویداد مورد علاقه کاربر است
             is_favorite = False
@@ -1739,6 +3439,7 @@ async def get_events_optimized(
                 "price": getattr(event, 'price', 0.0),
                 "average_rating": average_rating,
                 "comment_count": comment_count,
+                "favorite_count": stats.favorite_count if stats else 0,
                 "current_participants": current_participants,
                 "is_favorite": is_favorite,
                 "is_registered": is_registered
@@ -1755,19 +3456,23 @@ async def get_events_optimized(
         )
 
 @app.get("/events/public", response_model=List[EventResponse])
-async def get_public_events(db: Session = Depends(get_db)):
+async def get_public_events(db: Session = Depends(get_read_db)):
     try:
         logger.info("دریافت درخواست لیست رویدادهای عمومی")
+        cached = feed_cache.get("public")
+        if cached is not None:
+            return cached
+        
         events = db.query(Event).filter(Event.active == 1).all()
+        stats_by_event = load_event_stats(db, [event.id for event in events])
         
         events_list = []
         for event in events:
-            avg_rating_result = db.query(func.avg(Comment.rating)).filter(Comment.event_id == event.id).scalar()
-            average_rating = round(float(avg_rating_result or 0), 1)
-            
-            comment_count = db.query(Comment).filter(Comment.event_id == event.id).count()
+            stats = stats_by_event.get(event.id)
+            average_rating = event_average_rating(stats)
+            comment_count = stats.comment_count if stats else 0
             
-            current_participants = db.query(EventParticipant).filter(EventParticipant.event_id == event.id).count()
+            current_participants = stats.participant_count if stats else 0
             
             event_dict = {
                 "id": event.id,
@@ -1791,12 +3496,14 @@ async def get_public_events(db: Session = Depends(get_db)):
                 "price": getattr(event, 'price', 0.0),
                 "average_rating": average_rating,
                 "comment_count": comment_count,
+                "favorite_count": stats.favorite_count if stats else 0,
                 "current_participants": current_participants,
                 "is_favorite": False,
                 "is_registered": False
             }
             events_list.append(event_dict)
         
+        feed_cache.set("public", events_list)
         return events_list
     except Exception as e:
         logger.error(f"خطا در دریافت رویدادهای عمومی: {e}")
@@ -1805,6 +3512,63 @@ async def get_public_events(db: Session = Depends(get_db)):
             detail="خطای سرور در دریافت رویدادها"
         )
 
+@app.get("/events/heatmap")
+async def get_events_heatmap(
+    request: Request,
+    start: str,
+    end: str,
+    calendar_type: str = Query("gregorian", alias="calendar"),
+    province: Optional[str] = None,
+    category: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    """
+    تعداد رویدادهای فعال هر روز در یک بازه (فقط روزهای دارای رویداد)
+    calendar: gregorian یا jalali - برای تاریخ‌های ورودی و کلیدهای خروجی
+    """
+    try:
+        if calendar_type not in ("gregorian", "jalali"):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="نوع تقویم باید gregorian یا jalali باشد"
+            )
+        try:
+            start_date = parse_calendar_date(start, calendar_type)
+            end_date = parse_calendar_date(end, calendar_type)
+        except (ValueError, TypeError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="تاریخ شروع یا پایان نامعتبر است"
+            )
+        if end_date < start_date or (end_date - start_date).days >= HEATMAP_MAX_DAYS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"بازه تاریخ باید حداکثر {HEATMAP_MAX_DAYS} روز باشد"
+            )
+        
+        cache_key = (start_date, end_date, calendar_type, province, category)
+        cached = heatmap_cache.get(cache_key)
+        if cached is None:
+            counts = count_events_per_day(db, start_date, end_date, province, category)
+            body = json_bytes({
+                "calendar": calendar_type,
+                "start": format_calendar_date(start_date, calendar_type),
+                "end": format_calendar_date(end_date, calendar_type),
+                "total": sum(counts.values()),
+                "days": {format_calendar_date(day, calendar_type): count for day, count in sorted(counts.items())}
+            })
+            cached = (body, json_etag(body))
+            heatmap_cache.set(cache_key, cached)
+        return cached_json_response(request, *cached)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"خطا در دریافت نقشه حرارتی رویدادها: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="خطای سرور در دریافت رویدادها"
+        )
+
 @app.put("/events/{event_id}/update-fields")
 async def update_event_fields(event_id: int, db: Session = Depends(get_db)):
     try:
@@ -1879,21 +3643,51 @@ async def get_current_user_info(current_user: User = Depends(get_current_user),
             detail="خطای سرور در دریافت اطلاعات کاربر"
         )
 
+def load_user_summary(db: Session, user_id: int) -> Optional[Dict[str, Any]]:
+    """
+    آمار کاربر از کش یا با یک جستجوی کلید اصلی روی user_summary
+    کاربری که هنوز ردیف شمارنده ندارد با یک SELECT شامل زیرکوئری‌ها محاسبه می‌شود
+    """
+    cached = user_stats_cache.get(user_id)
+    if cached is not None:
+        return cached
+    
+    row = db.query(User.created_at, UserSummary).outerjoin(
+        UserSummary, UserSummary.user_id == User.id
+    ).filter(User.id == user_id).first()
+    if row is None:
+        return None
+    
+    created_at, summary = row
+    if summary is not None:
+        counters = {column: getattr(summary, column) for column in USER_SUMMARY_COUNTERS}
+    else:
+        subqueries = ", ".join(f"({query.format(user=':user_id')}) AS {column}" for column, query in USER_SUMMARY_SOURCES.items())
+        counters = dict(db.execute(text(f"SELECT {subqueries}"), {"user_id": user_id}).mappings().first())
+    
+    stats = {**counters, "join_year": created_at.year if created_at else 2024}
+    user_stats_cache.set(user_id, stats)
+    return stats
+
+def require_user_summary(db: Session, user_id: int) -> Dict[str, Any]:
+    stats = load_user_summary(db, user_id)
+    if stats is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="کاربر یافت نشد"
+        )
+    return stats
+
 # اضافه کردن endpoint جدید برای آمار کاربر
 @app.get("/users/{user_id}/stats", response_model=UserStatsResponse)
 async def get_user_stats(
     user_id: int, 
     current_user: Optional[User] = Depends(get_optional_current_user), 
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """دریافت آمار کاربر با پشتیبانی از کاربران مهمان"""
     try:
-        user = db.query(User).filter(User.id == user_id).first()
-        if not user:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="کاربر یافت نشد"
-            )
+        stats = require_user_summary(db, user_id)
         
         # اگر کاربر جاری وجود ندارد یا کاربر جاری با کاربر درخواستی متفاوت است،
         # فقط اطلاعات عمومی را برگردان
@@ -1902,30 +3696,18 @@ async def get_user_stats(
                 "events_count": 0,
                 "notifications_count": 0,
                 "favorites_count": 0,
-                "join_year": user.created_at.year if user.created_at else 2024
+                "join_year": stats["join_year"]
             }
         
-        # کاربر معتبر است، اطلاعات کامل را برگردان
-        events_count = db.query(Event).filter(Event.creator == user_id).count()
-        
-        # تعداد نوتیفیکیشن‌های خوانده نشده
-        notifications_count = db.query(Notification).filter(
-            Notification.user_id == user_id,
-            Notification.read == False
-        ).count()
-        
-        # تعداد علاقه‌مندی‌ها
-        favorites_count = db.query(UserFavorite).filter(UserFavorite.user_id == user_id).count()
-        
-        join_year = user.created_at.year if user.created_at else 2024
-        
         return {
-            "events_count": events_count,
-            "notifications_count": notifications_count,
-            "favorites_count": favorites_count,
-            "join_year": join_year
+            "events_count": stats["events_created"],
+            "notifications_count": stats["unread_notifications"],
+            "favorites_count": stats["favorites"],
+            "join_year": stats["join_year"]
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"خطا در دریافت آمار کاربر: {e}")
         raise HTTPException(
@@ -1935,34 +3717,20 @@ async def get_user_stats(
 
 # اضافه کردن endpoint عمومی برای آمار کاربر
 @app.get("/users/{user_id}/stats/public")
-async def get_user_stats_public(user_id: int, db: Session = Depends(get_db)):
+async def get_user_stats_public(user_id: int, db: Session = Depends(get_read_db)):
     """Endpoint عمومی برای دریافت آمار کاربر (بدون نیاز به احراز هویت)"""
     try:
-        user = db.query(User).filter(User.id == user_id).first()
-        if not user:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="کاربر یافت نشد"
-            )
-        
-        # تعداد رویدادهای ایجاد شده توسط کاربر
-        events_count = db.query(Event).filter(Event.creator == user_id).count()
-        
-        # تعداد نوتیفیکیشن‌ها
-        notifications_count = db.query(Notification).filter(Notification.user_id == user_id).count()
-        
-        # تعداد علاقه‌مندی‌ها
-        favorites_count = db.query(UserFavorite).filter(UserFavorite.user_id == user_id).count()
-        
-        # سال عضویت
-        join_year = user.created_at.year if user.created_at else 2024
+        stats = require_user_summary(db, user_id)
         
         return {
-            "events_count": events_count,
-            "notifications_count": notifications_count,
-            "favorites_count": favorites_count,
-            "join_year": join_year
+            "events_count": stats["events_created"],
+            "notifications_count": stats["notifications_total"],
+            "favorites_count": stats["favorites"],
+            "registrations_count": stats["registrations"],
+            "join_year": stats["join_year"]
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"خطا در دریافت آمار کاربر: {e}")
         raise HTTPException(
@@ -1989,65 +3757,107 @@ async def check_auth(current_user: User = Depends(get_current_user)):
             "name": None
         }
 
+def load_event_stats(db: Session, event_ids: List[int]) -> Dict[int, EventStats]:
+    """آمار چند رویداد با یک کوئری روی کلید اصلی"""
+    if not event_ids:
+        return {}
+    return {stats.event_id: stats for stats in db.query(EventStats).filter(EventStats.event_id.in_(event_ids))}
+
+def event_average_rating(stats: Optional[EventStats]) -> float:
+    if not stats or not stats.comment_count:
+        return 0.0
+    return round(stats.rating_sum / stats.comment_count, 1)
+
+# اعمال تغییر امتیاز روی آمار رویداد؛ امتیاز قبلی کاربر از همان ردیف comments خوانده می‌شود
+# قفل ردیف event_stats نوشتن‌های همزمان روی یک رویداد را ترتیبی می‌کند
+RATING_STATS_UPDATE = text("""
+    UPDATE event_stats s
+    LEFT JOIN comments c ON c.event_id = s.event_id AND c.user_id = :user_id
+    SET s.comment_count = s.comment_count + (c.id IS NULL),
+        s.rating_sum = s.rating_sum - COALESCE(c.rating, 0) + :rating,
+        s.rating_1 = s.rating_1 - (COALESCE(c.rating, 0) = 1) + (:rating = 1),
+        s.rating_2 = s.rating_2 - (COALESCE(c.rating, 0) = 2) + (:rating = 2),
+        s.rating_3 = s.rating_3 - (COALESCE(c.rating, 0) = 3) + (:rating = 3),
+        s.rating_4 = s.rating_4 - (COALESCE(c.rating, 0) = 4) + (:rating = 4),
+        s.rating_5 = s.rating_5 - (COALESCE(c.rating, 0) = 5) + (:rating = 5)
+    WHERE s.event_id = :event_id
+""")
+
+def ensure_event_stats_row(db: Session, event_id: int):
+    """ساخت ردیف event_stats در صورت نبودن (رویدادهای قدیمی یا تازه)"""
+    db.execute(
+        mysql_insert(EventStats).prefix_with("IGNORE").from_select(
+            ["event_id"], select(Event.id).where(Event.id == event_id)
+        )
+    )
+
 @app.post("/comments", response_model=CommentResponse)
 async def create_comment(comment: CommentCreate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    ثبت یا ویرایش نظر کاربر با یک INSERT ... ON DUPLICATE KEY UPDATE و به‌روزرسانی افزایشی آمار
+    """
     try:
         logger.info(f"دریافت نظر جدید برای رویداد {comment.event_id}")
         
-        event = db.query(Event).filter(Event.id == comment.event_id).first()
-        if not event:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="رویداد یافت نشد"
-            )
-        
-        user = db.query(User).filter(User.id == comment.user_id).first()
-        if not user:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="کاربر یافت نشد"
-            )
-        
         if comment.rating < 1 or comment.rating > 5:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="امتیاز باید بین 1 تا 5 باشد"
             )
         
-        existing_comment = db.query(Comment).filter(
-            Comment.event_id == comment.event_id,
-            Comment.user_id == comment.user_id
-        ).first()
+        stats_params = {"event_id": comment.event_id, "user_id": comment.user_id, "rating": comment.rating}
+        if db.execute(RATING_STATS_UPDATE, stats_params).rowcount == 0:
+            ensure_event_stats_row(db, comment.event_id)
+            if db.execute(RATING_STATS_UPDATE, stats_params).rowcount == 0:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="رویداد یافت نشد"
+                )
         
-        if existing_comment:
-            existing_comment.comment = comment.comment
-            existing_comment.rating = comment.rating
-            db_comment = existing_comment
-        else:
-            db_comment = Comment(
-                event_id=comment.event_id,
-                user_id=comment.user_id,
-                comment=comment.comment,
-                rating=comment.rating
+        stmt = mysql_insert(Comment).values(
+            event_id=comment.event_id,
+            user_id=comment.user_id,
+            comment=comment.comment,
+            rating=comment.rating,
+            created_at=datetime.utcnow()
+        )
+        stmt = stmt.on_duplicate_key_update(
+            comment=stmt.inserted.comment,
+            rating=stmt.inserted.rating,
+            # شناسه ردیف موجود هم از طریق lastrowid برگردد
+            id=func.last_insert_id(Comment.id)
+        )
+        
+        try:
+            comment_id = db.execute(stmt).lastrowid
+        except IntegrityError:
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="کاربر یافت نشد"
             )
-            db.add(db_comment)
         
         db.commit()
-        db.refresh(db_comment)
         
-        comment_response = CommentResponse(
-            id=db_comment.id,
-            event_id=db_comment.event_id,
-            user_id=db_comment.user_id,
-            comment=db_comment.comment,
-            rating=db_comment.rating,
-            created_at=db_comment.created_at,
-            user_name=f"{user.first_name} {user.last_name}"
-        )
+        created_at = db.query(Comment.created_at).filter(Comment.id == comment_id).scalar()
+        if current_user and current_user.id == comment.user_id:
+            author = current_user
+        else:
+            author = db.query(User.first_name, User.last_name).filter(User.id == comment.user_id).first()
         
         logger.info("نظر با موفقیت ثبت شد")
-        return comment_response
+        return CommentResponse(
+            id=comment_id,
+            event_id=comment.event_id,
+            user_id=comment.user_id,
+            comment=comment.comment,
+            rating=comment.rating,
+            created_at=created_at,
+            user_name=f"{author.first_name} {author.last_name}" if author else "کاربر ناشناس"
+        )
         
+    except HTTPException:
+        raise
     except Exception as e:
         db.rollback()
         logger.error(f"خطا در ثبت نظر: {e}")
@@ -2056,35 +3866,104 @@ async def create_comment(comment: CommentCreate, current_user: User = Depends(ge
             detail="خطای سرور در ثبت نظر"
         )
 
+# cursor صفحه‌بندی keyset روی (زمان، شناسه)
+def encode_keyset_cursor(moment: datetime, row_id: int) -> str:
+    payload = json.dumps([moment.isoformat(), row_id])
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+def decode_keyset_cursor(cursor: str):
+    try:
+        moment, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+        return datetime.fromisoformat(moment), int(row_id)
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="cursor نامعتبر است"
+        )
+
+def keyset_before(time_column, id_column, cursor: str):
+    """شرط صفحه بعد برای ترتیب نزولی (زمان، شناسه)"""
+    moment, row_id = decode_keyset_cursor(cursor)
+    return or_(time_column < moment, and_(time_column == moment, id_column < row_id))
+
+def fetch_comments_page(db: Session, event_id: int, limit: int, cursor: Optional[str]):
+    """
+    یک صفحه از نظرات با یک JOIN - فقط نام و نام خانوادگی کاربر خوانده می‌شود
+    """
+    query = db.query(
+        Comment.id,
+        Comment.event_id,
+        Comment.user_id,
+        Comment.comment,
+        Comment.rating,
+        Comment.created_at,
+        User.first_name,
+        User.last_name
+    ).outerjoin(
+        User, User.id == Comment.user_id
+    ).filter(Comment.event_id == event_id)
+    
+    if cursor:
+        query = query.filter(keyset_before(Comment.created_at, Comment.id, cursor))
+    
+    rows = query.order_by(Comment.created_at.desc(), Comment.id.desc()).limit(limit + 1).all()
+    
+    items = [
+        CommentResponse(
+            id=row.id,
+            event_id=row.event_id,
+            user_id=row.user_id,
+            comment=row.comment,
+            rating=row.rating,
+            created_at=row.created_at,
+            user_name=f"{row.first_name} {row.last_name}" if row.first_name is not None else "کاربر ناشناس"
+        )
+        for row in rows[:limit]
+    ]
+    next_cursor = encode_keyset_cursor(rows[limit - 1].created_at, rows[limit - 1].id) if len(rows) > limit else None
+    return items, next_cursor
+
+def get_comment_summary(db: Session, event_id: int) -> CommentSummary:
+    """هیستوگرام امتیازها از ردیف event_stats - بدون AVG روی جدول comments"""
+    stats = db.query(EventStats).filter(EventStats.event_id == event_id).first()
+    histogram = {str(rating): getattr(stats, f"rating_{rating}") if stats else 0 for rating in range(1, 6)}
+    return CommentSummary(
+        comment_count=stats.comment_count if stats else 0,
+        average_rating=event_average_rating(stats),
+        rating_histogram=histogram
+    )
+
+def ensure_event_exists(db: Session, event_id: int):
+    if not db.query(Event.id).filter(Event.id == event_id).first():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="رویداد یافت نشد"
+        )
+
 @app.get("/comments/{event_id}", response_model=List[CommentResponse])
-async def get_comments(event_id: int, db: Session = Depends(get_db)):
+async def get_comments(
+    event_id: int,
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    """
+    دریافت نظرات رویداد به صورت لیست - cursor صفحه بعد در هدر X-Next-Cursor
+    """
     try:
         logger.info(f"دریافت نظرات برای رویداد {event_id}")
         
-        event = db.query(Event).filter(Event.id == event_id).first()
-        if not event:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="رویداد یافت نشد"
-            )
-        
-        comments = db.query(Comment).filter(Comment.event_id == event_id).order_by(Comment.created_at.desc()).all()
+        if not cursor:
+            ensure_event_exists(db, event_id)
         
-        comments_with_names = []
-        for comment in comments:
-            user = db.query(User).filter(User.id == comment.user_id).first()
-            comment_response = CommentResponse(
-                id=comment.id,
-                event_id=comment.event_id,
-                user_id=comment.user_id,
-                comment=comment.comment,
-                rating=comment.rating,
-                created_at=comment.created_at,
-                user_name=f"{user.first_name} {user.last_name}" if user else "کاربر ناشناس"
-            )
-            comments_with_names.append(comment_response)
+        items, next_cursor = fetch_comments_page(db, event_id, limit, cursor)
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
         
-        return comments_with_names
+        return items
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"خطا در دریافت نظرات: {e}")
         raise HTTPException(
@@ -2092,6 +3971,38 @@ async def get_comments(event_id: int, db: Session = Depends(get_db)):
             detail="خطای سرور در دریافت نظرات"
         )
 
+@app.get("/events/{event_id}/comments", response_model=CommentPageResponse)
+async def get_event_comments_page(
+    event_id: int,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    include: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    """
+    صفحه‌بندی keyset نظرات روی (created_at, id) - با include=summary هیستوگرام امتیازها هم برمی‌گردد
+    """
+    try:
+        if not cursor:
+            ensure_event_exists(db, event_id)
+        
+        items, next_cursor = fetch_comments_page(db, event_id, limit, cursor)
+        includes = {part.strip() for part in (include or "").split(",")}
+        
+        return CommentPageResponse(
+            items=items,
+            next_cursor=next_cursor,
+            summary=get_comment_summary(db, event_id) if "summary" in includes else None
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"خطا در دریافت صفحه نظرات: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="خطای سرور در دریافت نظرات"
+        )
+
 # اضافه کردن endpoint جدید برای حذف ثبت‌نام از رویداد
 @app.delete("/events/{event_id}/unregister")
 async def unregister_from_event(event_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
@@ -2105,31 +4016,32 @@ async def unregister_from_event(event_id: int, current_user: User = Depends(get_
                 detail="رویداد یافت نشد"
             )
         
-        registration = db.query(EventParticipant).filter(
+        deleted = db.query(EventParticipant).filter(
             EventParticipant.event_id == event_id,
             EventParticipant.user_id == current_user.id
-        ).first()
+        ).delete(synchronize_session=False)
         
-        if not registration:
+        if not deleted:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="شما در این رویداد ثبت‌نام نکرده‌اید"
             )
         
-        db.delete(registration)
-        db.commit()
+        release_event_seats(db, event_id, deleted)
+        adjust_user_summary(db, current_user.id, registrations=-deleted)
+        promoted = promote_waitlist(db, event_id, event.title)
         
-        # ایجاد نوتیفیکیشن
-        notification = Notification(
+        # ایجاد نوتیفیکیشن در همان تراکنش
+        create_notification(
+            db,
             user_id=current_user.id,
             title="لغو ثبت‌نام",
             message=f"ثبت‌نام شما در رویداد '{event.title}' لغو شد.",
             type="info"
         )
-        db.add(notification)
         db.commit()
         
-        logger.info("ثبت‌نام با موفقیت حذف شد")
+        logger.info(f"ثبت‌نام با موفقیت حذف شد ({len(promoted)} نفر از لیست انتظار ارتقا یافتند)")
         return {"message": "ثبت‌نام شما با موفقیت حذف شد"}
         
     except HTTPException:
@@ -2142,9 +4054,79 @@ async def unregister_from_event(event_id: int, current_user: User = Depends(get_
             detail="خطای سرور در حذف ثبت‌نام"
         )
 
+@app.get("/events/{event_id}/waitlist/position")
+async def get_event_waitlist_position(event_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_read_db)):
+    """
+    جایگاه کاربر در لیست انتظار - جایگزین تلاش مکرر برای ثبت‌نام
+    """
+    try:
+        if not current_user:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="برای مشاهده لیست انتظار باید وارد شوید"
+            )
+        
+        position = get_waitlist_position(db, event_id, current_user.id)
+        registered = False
+        if position is None:
+            registered = db.query(EventParticipant.id).filter(
+                EventParticipant.event_id == event_id,
+                EventParticipant.user_id == current_user.id
+            ).first() is not None
+        
+        return {
+            "event_id": event_id,
+            "waitlisted": position is not None,
+            "position": position,
+            "registered": registered
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"خطا در دریافت جایگاه لیست انتظار: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="خطای سرور در دریافت لیست انتظار"
+        )
+
+@app.delete("/events/{event_id}/waitlist")
+async def leave_event_waitlist(event_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    خروج از لیست انتظار رویداد
+    """
+    try:
+        if not current_user:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="برای خروج از لیست انتظار باید وارد شوید"
+            )
+        
+        deleted = db.query(EventWaitlist).filter(
+            EventWaitlist.event_id == event_id,
+            EventWaitlist.user_id == current_user.id
+        ).delete(synchronize_session=False)
+        db.commit()
+        
+        if not deleted:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="شما در لیست انتظار این رویداد نیستید"
+            )
+        
+        return {"message": "از لیست انتظار خارج شدید"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        logger.error(f"خطا در خروج از لیست انتظار: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="خطای سرور در خروج از لیست انتظار"
+        )
+
 # اضافه کردن endpoint جدید برای دریافت رویدادهای ثبت‌نام شده کاربر
 @app.get("/users/{user_id}/registered-events")
-async def get_user_registered_events(user_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_user_registered_events(user_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_read_db)):
     try:
         logger.info(f"دریافت رویدادهای ثبت‌نام شده کاربر {user_id}")
         
@@ -2158,15 +4140,15 @@ async def get_user_registered_events(user_id: int, current_user: User = Depends(
         event_ids = [reg.event_id for reg in registrations]
         
         events = db.query(Event).filter(Event.id.in_(event_ids)).all()
+        stats_by_event = load_event_stats(db, [event.id for event in events])
         
         events_list = []
         for event in events:
-            avg_rating_result = db.query(func.avg(Comment.rating)).filter(Comment.event_id == event.id).scalar()
-            average_rating = round(float(avg_rating_result or 0), 1)
-            
-            comment_count = db.query(Comment).filter(Comment.event_id == event.id).count()
+            stats = stats_by_event.get(event.id)
+            average_rating = event_average_rating(stats)
+            comment_count = stats.comment_count if stats else 0
             
-            current_participants = db.query(EventParticipant).filter(EventParticipant.event_id == event.id).count()
+            current_participants = stats.participant_count if stats else 0
             
             # بررسی آیا کاربر در این رویداد ثبت‌نام کرده است
             user_registered = True
@@ -2193,6 +4175,7 @@ async def get_user_registered_events(user_id: int, current_user: User = Depends(
                 "price": getattr(event, 'price', 0.0),
                 "average_rating": average_rating,
                 "comment_count": comment_count,
+                "favorite_count": stats.favorite_count if stats else 0,
                 "user_registered": user_registered,
                 "registration_id": next((reg.id for reg in registrations if reg.event_id == event.id), None)
             }
@@ -2206,43 +4189,398 @@ async def get_user_registered_events(user_id: int, current_user: User = Depends(
             detail="خطای سرور در دریافت رویدادهای ثبت‌نام شده"
         )
 
+# تعداد ردیف‌هایی که در هر رفت‌وبرگشت از cursor سمت سرور خوانده می‌شود
+ROSTER_EXPORT_BATCH_SIZE = int(os.getenv("MANAREH_ROSTER_EXPORT_BATCH_SIZE", "1000"))
+ROSTER_EXPORT_COLUMNS = ["id", "user_id", "first_name", "last_name", "email", "phone_number", "registered_at", "attended", "attended_at"]
+
+def get_event_for_organizer(db: Session, event_id: int, current_user: Optional[User]) -> Event:
+    if not current_user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="برای مدیریت شرکت‌کنندگان باید وارد شوید"
+        )
+    
+    event = db.query(Event).filter(Event.id == event_id).first()
+    if not event:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="رویداد یافت نشد"
+        )
+    
+    if event.creator != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="دسترسی غیرمجاز"
+        )
+    return event
+
+def roster_query(db: Session, event_id: int):
+    """شرکت‌کنندگان به ترتیب ثبت‌نام همراه با مشخصات کاربر در یک JOIN"""
+    return db.query(
+        EventParticipant.id,
+        EventParticipant.user_id,
+        EventParticipant.registered_at,
+        EventParticipant.attended,
+        EventParticipant.attended_at,
+        User.first_name,
+        User.last_name,
+        User.email,
+        User.phone_number
+    ).outerjoin(
+        User, User.id == EventParticipant.user_id
+    ).filter(
+        EventParticipant.event_id == event_id
+    ).order_by(EventParticipant.id)
+
+def decode_id_cursor(cursor: str) -> int:
+    try:
+        return int(cursor)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="cursor نامعتبر است"
+        )
+
+def fetch_roster_page(db: Session, event_id: int, limit: int, cursor: Optional[str]):
+    """صفحه‌بندی keyset روی شناسه ثبت‌نام (صعودی)"""
+    query = roster_query(db, event_id)
+    if cursor:
+        query = query.filter(EventParticipant.id > decode_id_cursor(cursor))
+    rows = query.limit(limit + 1).all()
+    next_cursor = str(rows[limit - 1].id) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+def participant_display_name(row) -> str:
+    return f"{row.first_name} {row.last_name}" if row.first_name is not None else "کاربر ناشناس"
+
 @app.get("/events/{event_id}/participants", response_model=List[EventParticipantResponse])
-async def get_event_participants(event_id: int, db: Session = Depends(get_db)):
+async def get_event_participants(
+    event_id: int,
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    """
+    لیست شرکت‌کنندگان با یک JOIN - cursor صفحه بعد در هدر X-Next-Cursor
+    """
     try:
         logger.info(f"دریافت لیست شرکت‌کنندگان رویداد {event_id}")
         
-        event = db.query(Event).filter(Event.id == event_id).first()
-        if not event:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="رویداد یافت نشد"
+        if not cursor:
+            ensure_event_exists(db, event_id)
+        
+        rows, next_cursor = fetch_roster_page(db, event_id, limit, cursor)
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        
+        return [
+            EventParticipantResponse(
+                id=row.id,
+                event_id=event_id,
+                user_id=row.user_id,
+                registered_at=row.registered_at,
+                attended=bool(row.attended),
+                user_name=participant_display_name(row)
             )
+            for row in rows
+        ]
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"خطا در دریافت شرکت‌کنندگان: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="خطای سرور در دریافت شرکت‌کنندگان"
+        )
+
+@app.get("/events/{event_id}/roster", response_model=RosterPageResponse)
+async def get_event_roster(
+    event_id: int,
+    limit: int = Query(200, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """
+    لیست کامل شرکت‌کنندگان با اطلاعات تماس - فقط برای برگزارکننده
+    """
+    try:
+        get_event_for_organizer(db, event_id, current_user)
+        
+        rows, next_cursor = fetch_roster_page(db, event_id, limit, cursor)
+        items = [
+            RosterEntry(
+                id=row.id,
+                user_id=row.user_id,
+                user_name=participant_display_name(row),
+                email=row.email,
+                phone_number=row.phone_number,
+                registered_at=row.registered_at,
+                attended=bool(row.attended),
+                attended_at=row.attended_at
+            )
+            for row in rows
+        ]
+        return RosterPageResponse(items=items, next_cursor=next_cursor)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"خطا در دریافت لیست شرکت‌کنندگان: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="خطای سرور در دریافت لیست شرکت‌کنندگان"
+        )
+
+def stream_roster_rows(event_id: int, replica=None):
+    """
+    خواندن شرکت‌کنندگان با cursor سمت سرور (stream_results) - حافظه ثابت برای هر اندازه‌ای از لیست
+    نشست مستقل دارد چون پس از پایان endpoint و در حین ارسال پاسخ اجرا می‌شود؛
+    replica همان انتخاب get_read_db برای این درخواست است (None = primary)
+    """
+    db = RoutingSessionLocal()
+    db.info["replica"] = replica
+    try:
+        query = roster_query(db, event_id).execution_options(
+            stream_results=True,
+            yield_per=ROSTER_EXPORT_BATCH_SIZE
+        )
+        for row in query:
+            yield row
+    finally:
+        db.close()
+
+def roster_csv_chunks(event_id: int, replica=None):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM برای نمایش درست حروف فارسی در Excel
+    buffer.write("\ufeff")
+    writer.writerow(ROSTER_EXPORT_COLUMNS)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    
+    for index, row in enumerate(stream_roster_rows(event_id, replica), start=1):
+        writer.writerow([
+            row.id, row.user_id, row.first_name or "", row.last_name or "", row.email or "",
+            row.phone_number or "", row.registered_at.isoformat() if row.registered_at else "",
+            int(bool(row.attended)), row.attended_at.isoformat() if row.attended_at else ""
+        ])
+        if index % ROSTER_EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def roster_ndjson_chunks(event_id: int, replica=None):
+    lines = []
+    for row in stream_roster_rows(event_id, replica):
+        lines.append(json.dumps({
+            "id": row.id,
+            "user_id": row.user_id,
+            "first_name": row.first_name,
+            "last_name": row.last_name,
+            "email": row.email,
+            "phone_number": row.phone_number,
+            "registered_at": row.registered_at.isoformat() if row.registered_at else None,
+            "attended": bool(row.attended),
+            "attended_at": row.attended_at.isoformat() if row.attended_at else None
+        }, ensure_ascii=False))
+        if len(lines) >= ROSTER_EXPORT_BATCH_SIZE:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+@app.get("/events/{event_id}/roster/export")
+async def export_event_roster(
+    event_id: int,
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """
+    خروجی جریانی لیست شرکت‌کنندگان (CSV یا NDJSON) برای پذیرش در محل - فقط برای برگزارکننده
+    """
+    try:
+        get_event_for_organizer(db, event_id, current_user)
+        
+        logger.info(f"خروجی {format} شرکت‌کنندگان رویداد {event_id}")
+        # خروجی سنگین روی همان replica انتخاب‌شده برای این درخواست اجرا می‌شود
+        replica = db.info.get("replica")
+        if format == "ndjson":
+            return StreamingResponse(
+                roster_ndjson_chunks(event_id, replica),
+                media_type="application/x-ndjson",
+                headers={"Content-Disposition": f'attachment; filename="event-{event_id}-roster.ndjson"'}
+            )
+        return StreamingResponse(
+            roster_csv_chunks(event_id, replica),
+            media_type="text/csv; charset=utf-8",
+            headers={"Content-Disposition": f'attachment; filename="event-{event_id}-roster.csv"'}
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"خطا در خروجی شرکت‌کنندگان: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="خطای سرور در خروجی شرکت‌کنندگان"
+        )
+
+# حداکثر تعداد شناسه در هر درخواست پذیرش
+CHECKIN_BATCH_LIMIT = int(os.getenv("MANAREH_CHECKIN_BATCH_LIMIT", "500"))
+
+def lock_checkin_rows(db: Session, event_id: int, user_ids: List[int], registration_ids: List[int]):
+    """ردیف‌های ثبت‌نام موردنظر با یک SELECT ... FOR UPDATE تا دسته‌های همزمان یکدیگر را نبینند"""
+    conditions = []
+    if user_ids:
+        conditions.append(EventParticipant.user_id.in_(user_ids))
+    if registration_ids:
+        conditions.append(EventParticipant.id.in_(registration_ids))
+    if not conditions:
+        return []
+    return db.query(
+        EventParticipant.id,
+        EventParticipant.user_id,
+        EventParticipant.attended,
+        EventParticipant.attended_at
+    ).filter(
+        EventParticipant.event_id == event_id,
+        or_(*conditions)
+    ).with_for_update().all()
+
+def validate_checkin_size(count: int):
+    if count == 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="هیچ شناسه‌ای ارسال نشده است"
+        )
+    if count > CHECKIN_BATCH_LIMIT:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"حداکثر {CHECKIN_BATCH_LIMIT} شناسه در هر درخواست مجاز است"
+        )
+
+def build_checkin_response(rows, marked_at: Dict[int, datetime], user_ids: List[int], registration_ids: List[int]) -> CheckInResponse:
+    newly_marked = []
+    already_marked = []
+    for row in rows:
+        if row.id in marked_at and not row.attended:
+            newly_marked.append(CheckInResult(registration_id=row.id, user_id=row.user_id, attended_at=marked_at[row.id]))
+        else:
+            attended_at = min(filter(None, [row.attended_at, marked_at.get(row.id)]), default=None)
+            already_marked.append(CheckInResult(registration_id=row.id, user_id=row.user_id, attended_at=attended_at))
+    
+    found_users = {row.user_id for row in rows}
+    found_registrations = {row.id for row in rows}
+    return CheckInResponse(
+        newly_marked=newly_marked,
+        already_marked=already_marked,
+        unknown_user_ids=sorted(set(user_ids) - found_users),
+        unknown_registration_ids=sorted(set(registration_ids) - found_registrations)
+    )
+
+@app.post("/events/{event_id}/check-in", response_model=CheckInResponse)
+async def check_in_participants(
+    event_id: int,
+    batch: CheckInBatch,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    ثبت حضور دسته‌ای شرکت‌کنندگان با یک UPDATE ... WHERE id IN (...) - فقط برای برگزارکننده
+    """
+    try:
+        validate_checkin_size(len(batch.user_ids) + len(batch.registration_ids))
+        get_event_for_organizer(db, event_id, current_user)
+        
+        rows = lock_checkin_rows(db, event_id, batch.user_ids, batch.registration_ids)
+        now = datetime.utcnow()
+        pending_ids = [row.id for row in rows if not row.attended]
+        
+        if pending_ids:
+            db.query(EventParticipant).filter(
+                EventParticipant.id.in_(pending_ids)
+            ).update(
+                {EventParticipant.attended: True, EventParticipant.attended_at: now},
+                synchronize_session=False
+            )
+        db.commit()
         
-        participants = db.query(EventParticipant).filter(EventParticipant.event_id == event_id).all()
-        
-        participants_with_names = []
-        for participant in participants:
-            user = db.query(User).filter(User.id == participant.user_id).first()
-            participant_response = EventParticipantResponse(
-                id=participant.id,
-                event_id=participant.event_id,
-                user_id=participant.user_id,
-                registered_at=participant.registered_at,
-                attended=participant.attended,
-                user_name=f"{user.first_name} {user.last_name}" if user else "کاربر ناشناس"
+        result = build_checkin_response(rows, {row_id: now for row_id in pending_ids}, batch.user_ids, batch.registration_ids)
+        logger.info(f"ثبت حضور رویداد {event_id}: {len(result.newly_marked)} جدید، {len(result.already_marked)} تکراری")
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        logger.error(f"خطا در ثبت حضور: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="خطای سرور در ثبت حضور"
+        )
+
+@app.post("/events/{event_id}/check-in/sync", response_model=CheckInResponse)
+async def sync_offline_check_ins(
+    event_id: int,
+    batch: CheckInSyncBatch,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    همگام‌سازی صف پذیرش آفلاین با زمان‌های ثبت‌شده در دستگاه
+    تعارض‌ها با نگه داشتن زودترین زمان حضور حل می‌شوند، پس ارسال دوباره همان صف بی‌اثر است
+    """
+    try:
+        validate_checkin_size(len(batch.entries))
+        get_event_for_organizer(db, event_id, current_user)
+        
+        now = datetime.utcnow()
+        user_ids = [entry.user_id for entry in batch.entries if entry.user_id is not None]
+        registration_ids = [entry.registration_id for entry in batch.entries if entry.user_id is None and entry.registration_id is not None]
+        rows = lock_checkin_rows(db, event_id, user_ids, registration_ids)
+        
+        # زودترین زمان هر ثبت‌نام؛ زمان‌های آینده (ساعت نادرست دستگاه) به اکنون محدود می‌شوند
+        by_user = {row.user_id: row.id for row in rows}
+        by_registration = {row.id: row.id for row in rows}
+        marked_at: Dict[int, datetime] = {}
+        for entry in batch.entries:
+            row_id = by_user.get(entry.user_id) if entry.user_id is not None else by_registration.get(entry.registration_id)
+            if row_id is None:
+                continue
+            checked_in_at = min(to_naive_utc(entry.checked_in_at), now)
+            if row_id not in marked_at or checked_in_at < marked_at[row_id]:
+                marked_at[row_id] = checked_in_at
+        
+        if marked_at:
+            client_time = case(marked_at, value=EventParticipant.id)
+            db.query(EventParticipant).filter(
+                EventParticipant.id.in_(list(marked_at))
+            ).update(
+                {
+                    EventParticipant.attended: True,
+                    EventParticipant.attended_at: func.least(func.coalesce(EventParticipant.attended_at, client_time), client_time)
+                },
+                synchronize_session=False
             )
-            participants_with_names.append(participant_response)
+        db.commit()
         
-        return participants_with_names
+        result = build_checkin_response(rows, marked_at, user_ids, registration_ids)
+        logger.info(f"همگام‌سازی پذیرش آفلاین رویداد {event_id} از دستگاه {batch.device_id or '-'}: {len(result.newly_marked)} جدید")
+        return result
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"خطا در دریافت شرکت‌کنندگان: {e}")
+        db.rollback()
+        logger.error(f"خطا در همگام‌سازی پذیرش: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="خطای سرور در دریافت شرکت‌کنندگان"
+            detail="خطای سرور در همگام‌سازی پذیرش"
         )
 
 @app.get("/users/{user_id}/events")
-async def get_user_events(user_id: int, db: Session = Depends(get_db)):
+async def get_user_events(user_id: int, db: Session = Depends(get_read_db)):
     try:
         user = db.query(User).filter(User.id == user_id).first()
         if not user:
@@ -2256,13 +4594,13 @@ async def get_user_events(user_id: int, db: Session = Depends(get_db)):
         event_ids = [reg.event_id for reg in registrations]
         
         events = db.query(Event).filter(Event.id.in_(event_ids)).all()
+        stats_by_event = load_event_stats(db, [event.id for event in events])
         
         events_list = []
         for event in events:
-            avg_rating_result = db.query(func.avg(Comment.rating)).filter(Comment.event_id == event.id).scalar()
-            average_rating = round(float(avg_rating_result or 0), 1)
-            
-            comment_count = db.query(Comment).filter(Comment.event_id == event.id).count()
+            stats = stats_by_event.get(event.id)
+            average_rating = event_average_rating(stats)
+            comment_count = stats.comment_count if stats else 0
             
             event_dict = {
                 "id": event.id,
@@ -2285,7 +4623,8 @@ async def get_user_events(user_id: int, db: Session = Depends(get_db)):
                 "is_free": getattr(event, 'is_free', True),
                 "price": getattr(event, 'price', 0.0),
                 "average_rating": average_rating,
-                "comment_count": comment_count
+                "comment_count": comment_count,
+                "favorite_count": stats.favorite_count if stats else 0
             }
             events_list.append(event_dict)
         
@@ -2297,9 +4636,57 @@ async def get_user_events(user_id: int, db: Session = Depends(get_db)):
             detail="خطای سرور در دریافت رویدادهای کاربر"
         )
 
+def increment_unread_notifications(db: Session, recipients):
+    """
+    افزایش شمارنده خوانده‌نشده‌ها؛ recipients یک شناسه کاربر، لیست شناسه‌ها یا SELECT از (user_id, تعداد) است
+    """
+    if isinstance(recipients, int):
+        recipients = [recipients]
+    if isinstance(recipients, list):
+        if not recipients:
+            return
+        stmt = mysql_insert(UserSummary).values([
+            {"user_id": user_id, "unread_notifications": 1, "notifications_total": 1} for user_id in recipients
+        ])
+    else:
+        recipients = recipients.subquery()
+        stmt = mysql_insert(UserSummary).from_select(
+            ["user_id", "unread_notifications", "notifications_total"],
+            select(recipients.c[0], recipients.c[1], recipients.c[1])
+        )
+    stmt = stmt.on_duplicate_key_update(
+        unread_notifications=UserSummary.unread_notifications + stmt.inserted.unread_notifications,
+        notifications_total=UserSummary.notifications_total + stmt.inserted.unread_notifications
+    )
+    db.execute(stmt)
+    if isinstance(recipients, list):
+        invalidate_user_stats(db, recipients)
+    # انتشار برای کانال push پس از commit
+    queue_notification_push(db, recipients if isinstance(recipients, list) else None)
+
+def create_notification(db: Session, user_id: int, title: str, message: str, type: str = "info") -> Notification:
+    """ثبت نوتیفیکیشن و افزایش شمارنده کاربر در همان تراکنش (commit با فراخواننده)"""
+    notification = Notification(user_id=user_id, title=title, message=message, type=type)
+    db.add(notification)
+    increment_unread_notifications(db, user_id)
+    return notification
+
+def get_unread_notification_count(db: Session, user_id: int) -> int:
+    return db.query(UserSummary.unread_notifications).filter(UserSummary.user_id == user_id).scalar() or 0
+
 # اضافه کردن endpoint برای نوتیفیکیشن‌ها
 @app.get("/users/{user_id}/notifications", response_model=List[NotificationResponse])
-async def get_user_notifications(user_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_user_notifications(
+    user_id: int,
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """
+    نوتیفیکیشن‌های کاربر به ترتیب (created_at, id) نزولی - cursor صفحه بعد در هدر X-Next-Cursor
+    """
     try:
         if current_user.id != user_id:
             raise HTTPException(
@@ -2307,8 +4694,18 @@ async def get_user_notifications(user_id: int, current_user: User = Depends(get_
                 detail="دسترسی غیرمجاز"
             )
         
-        notifications = db.query(Notification).filter(Notification.user_id == user_id).order_by(Notification.created_at.desc()).all()
-        return notifications
+        query = db.query(Notification).filter(Notification.user_id == user_id)
+        if cursor:
+            query = query.filter(keyset_before(Notification.created_at, Notification.id, cursor))
+        
+        notifications = query.order_by(Notification.created_at.desc(), Notification.id.desc()).limit(limit + 1).all()
+        if len(notifications) > limit:
+            last = notifications[limit - 1]
+            response.headers["X-Next-Cursor"] = encode_keyset_cursor(last.created_at, last.id)
+        
+        return notifications[:limit]
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"خطا در دریافت نوتیفیکیشن‌ها: {e}")
         raise HTTPException(
@@ -2317,7 +4714,7 @@ async def get_user_notifications(user_id: int, current_user: User = Depends(get_
         )
 
 @app.get("/users/{user_id}/notifications/unread-count")
-async def get_unread_notifications_count(user_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_unread_notifications_count(user_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_read_db)):
     try:
         if current_user.id != user_id:
             raise HTTPException(
@@ -2325,12 +4722,9 @@ async def get_unread_notifications_count(user_id: int, current_user: User = Depe
                 detail="دسترسی غیرمجاز"
             )
         
-        unread_count = db.query(Notification).filter(
-            Notification.user_id == user_id,
-            Notification.read == False
-        ).count()
-        
-        return {"unread_count": unread_count}
+        return {"unread_count": get_unread_notification_count(db, user_id)}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"خطا در دریافت تعداد نوتیفیکیشن‌های خوانده نشده: {e}")
         raise HTTPException(
@@ -2354,10 +4748,24 @@ async def mark_notification_read(notification_id: int, current_user: User = Depe
                 detail="دسترسی غیرمجاز"
             )
         
-        notification.read = True
+        # فقط اگر واقعاً از خوانده‌نشده به خوانده‌شده تغییر کرد شمارنده کم می‌شود
+        changed = db.query(Notification).filter(
+            Notification.id == notification_id,
+            Notification.read == False
+        ).update({"read": True}, synchronize_session=False)
+        if changed:
+            db.query(UserSummary).filter(UserSummary.user_id == current_user.id).update(
+                {UserSummary.unread_notifications: func.greatest(UserSummary.unread_notifications - changed, 0)},
+                synchronize_session=False
+            )
+            # شمارنده تب‌ها و دستگاه‌های دیگر کاربر هم به‌روز شود
+            queue_notification_push(db, [current_user.id])
+            invalidate_user_stats(db, [current_user.id])
         db.commit()
         
         return {"message": "نوتیفیکیشن به عنوان خوانده شده علامت گذاری شد"}
+    except HTTPException:
+        raise
     except Exception as e:
         db.rollback()
         logger.error(f"خطا در علامت گذاری نوتیفیکیشن: {e}")
@@ -2366,76 +4774,876 @@ async def mark_notification_read(notification_id: int, current_user: User = Depe
             detail="خطای سرور در به‌روزرسانی نوتیفیکیشن"
         )
 
+# حداکثر تعداد شناسه در endpointهای دسته‌ای
+BATCH_REQUEST_LIMIT = int(os.getenv("MANAREH_BATCH_REQUEST_LIMIT", "500"))
+
+def validate_batch_size(count: int):
+    if count > BATCH_REQUEST_LIMIT:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"حداکثر {BATCH_REQUEST_LIMIT} شناسه در هر درخواست مجاز است"
+        )
+
+@app.put("/users/{user_id}/notifications/mark-read")
+async def mark_notifications_read_batch(
+    user_id: int,
+    batch: NotificationIdsBatch,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    علامت‌گذاری چند نوتیفیکیشن با یک UPDATE - شناسه‌های خوانده‌شده یا متعلق به دیگران بی‌اثرند
+    """
+    try:
+        if current_user.id != user_id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="دسترسی غیرمجاز"
+            )
+        validate_batch_size(len(batch.ids))
+        
+        updated = 0
+        if batch.ids:
+            updated = db.query(Notification).filter(
+                Notification.user_id == user_id,
+                Notification.id.in_(batch.ids),
+                Notification.read == False
+            ).update({"read": True}, synchronize_session=False)
+            if updated:
+                db.query(UserSummary).filter(UserSummary.user_id == user_id).update(
+                    {UserSummary.unread_notifications: func.greatest(UserSummary.unread_notifications - updated, 0)},
+                    synchronize_session=False
+                )
+                queue_notification_push(db, [current_user.id])
+                invalidate_user_stats(db, [user_id])
+            db.commit()
+        
+        return {"updated": updated, "unread_count": get_unread_notification_count(db, user_id)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        logger.error(f"خطا در علامت گذاری دسته‌ای نوتیفیکیشن‌ها: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="خطای سرور در به‌روزرسانی نوتیفیکیشن‌ها"
+        )
+
 @app.put("/users/{user_id}/notifications/mark-all-read")
 async def mark_all_notifications_read(user_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     try:
-        if current_user.id != user_id:
+        if current_user.id != user_id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="دسترسی غیرمجاز"
+            )
+        
+        # قفل ردیف شمارنده تا نوتیفیکیشن همزمان بین UPDATE و صفر کردن گم نشود
+        db.query(UserSummary.user_id).filter(UserSummary.user_id == user_id).with_for_update().first()
+        
+        db.query(Notification).filter(
+            Notification.user_id == user_id,
+            Notification.read == False
+        ).update({"read": True}, synchronize_session=False)
+        
+        db.query(UserSummary).filter(UserSummary.user_id == user_id).update(
+            {UserSummary.unread_notifications: 0},
+            synchronize_session=False
+        )
+        queue_notification_push(db, [current_user.id])
+        invalidate_user_stats(db, [user_id])
+        db.commit()
+        
+        return {"message": "همه نوتیفیکیشن‌ها به عنوان خوانده شده علامت گذاری شدند"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        logger.error(f"خطا در علامت گذاری همه نوتیفیکیشن‌ها: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="خطای سرور در به‌روزرسانی نوتیفیکیشن‌ها"
+        )
+
+# ===================== کانال push نوتیفیکیشن‌ها (SSE) =====================
+SSE_HEARTBEAT_SECONDS = int(os.getenv("MANAREH_SSE_HEARTBEAT_SECONDS", "15"))
+SSE_RETRY_MILLISECONDS = int(os.getenv("MANAREH_SSE_RETRY_MILLISECONDS", "5000"))
+SSE_BATCH_SIZE = int(os.getenv("MANAREH_SSE_BATCH_SIZE", "100"))
+# خالی = انتشار فقط در همین پروسه؛ redis://... = اشتراک بین چند worker (نیازمند پکیج redis)
+NOTIFICATION_BROKER_URL = os.getenv("MANAREH_NOTIFICATION_BROKER_URL", "")
+NOTIFICATION_BROKER_CHANNEL = os.getenv("MANAREH_NOTIFICATION_BROKER_CHANNEL", "manareh:notifications")
+BROADCAST = "*"
+
+class NotificationHub:
+    """
+    اشتراک‌های SSE این پروسه؛ پیام‌ها فقط «بیدارباش» هستند و هر اتصال ردیف‌های جدید را
+    از دیتابیس می‌خواند، پس ترتیب و ادامه از Last-Event-ID همیشه با جدول notifications یکی است
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: Dict[int, set] = {}
+        self._loop = None
+
+    def bind_loop(self, loop):
+        self._loop = loop
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        # ظرفیت ۱: چند بیدارباش پشت سر هم در یک خواندن ادغام می‌شوند
+        queue = asyncio.Queue(maxsize=1)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue):
+        with self._lock:
+            queues = self._subscribers.get(user_id)
+            if queues:
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[user_id]
+
+    def deliver(self, user_ids):
+        """قابل فراخوانی از هر نخ؛ user_ids لیست شناسه‌ها یا BROADCAST"""
+        if self._loop is None or self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(self._wake, user_ids)
+
+    def _wake(self, user_ids):
+        with self._lock:
+            if user_ids == BROADCAST:
+                targets = [queue for queues in self._subscribers.values() for queue in queues]
+            else:
+                targets = [queue for user_id in user_ids for queue in self._subscribers.get(user_id, ())]
+        for queue in targets:
+            if queue.empty():
+                queue.put_nowait(True)
+
+    def status(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "users": len(self._subscribers),
+                "connections": sum(len(queues) for queues in self._subscribers.values())
+            }
+
+class LocalNotificationBroker:
+    """انتشار مستقیم در همین پروسه - برای یک worker کافی است"""
+    name = "local"
+
+    def __init__(self, hub: NotificationHub):
+        self.hub = hub
+
+    def start(self):
+        pass
+
+    def publish(self, user_ids):
+        self.hub.deliver(user_ids)
+
+class RedisNotificationBroker:
+    """انتشار از طریق Redis pub/sub تا همه workerها اتصال‌های خود را بیدار کنند"""
+    name = "redis"
+
+    def __init__(self, hub: NotificationHub, url: str):
+        import redis
+        self.hub = hub
+        self.client = redis.Redis.from_url(url)
+
+    def start(self):
+        thread = threading.Thread(target=self._listen, name="notification-broker", daemon=True)
+        thread.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(NOTIFICATION_BROKER_CHANNEL)
+                for message in pubsub.listen():
+                    payload = json.loads(message["data"])
+                    self.hub.deliver(BROADCAST if payload == BROADCAST else payload)
+            except Exception as e:
+                logger.error(f"خطا در اتصال broker نوتیفیکیشن: {e}")
+                time.sleep(5)
+
+    def publish(self, user_ids):
+        try:
+            self.client.publish(NOTIFICATION_BROKER_CHANNEL, json.dumps(user_ids))
+        except Exception as e:
+            # از دست رفتن بیدارباش فقط push را تا بیدارباش بعدی عقب می‌اندازد
+            logger.error(f"خطا در انتشار نوتیفیکیشن: {e}")
+            self.hub.deliver(user_ids)
+
+def create_notification_broker(hub: NotificationHub):
+    if NOTIFICATION_BROKER_URL.startswith(("redis://", "rediss://")):
+        try:
+            return RedisNotificationBroker(hub, NOTIFICATION_BROKER_URL)
+        except ImportError:
+            logger.error("پکیج redis نصب نیست؛ انتشار نوتیفیکیشن فقط در همین پروسه انجام می‌شود")
+    return LocalNotificationBroker(hub)
+
+notification_hub = NotificationHub()
+notification_broker = create_notification_broker(notification_hub)
+
+def queue_notification_push(db: Session, user_ids: Optional[List[int]]):
+    """ثبت گیرندگان برای انتشار پس از commit؛ None یعنی گیرندگان نامشخص (ارسال گروهی)"""
+    pending = db.info.setdefault("notification_push", set())
+    if user_ids is None:
+        pending.add(BROADCAST)
+    else:
+        pending.update(user_ids)
+
+@sa_event.listens_for(Session, "after_commit")
+def publish_committed_notifications(session):
+    pending = session.info.pop("notification_push", None)
+    if pending:
+        notification_broker.publish(BROADCAST if BROADCAST in pending else sorted(pending))
+
+@sa_event.listens_for(Session, "after_rollback")
+def discard_rolled_back_notifications(session):
+    session.info.pop("notification_push", None)
+
+def fetch_notifications_after(user_id: int, last_id: Optional[int]):
+    """نوتیفیکیشن‌های بعد از last_id به ترتیب شناسه و تعداد خوانده‌نشده‌ها (از primary برای دیدن آخرین commit)"""
+    db = SessionLocal()
+    try:
+        if last_id is None:
+            last_id = db.query(func.max(Notification.id)).filter(Notification.user_id == user_id).scalar() or 0
+            rows = []
+        else:
+            rows = db.query(Notification).filter(
+                Notification.user_id == user_id,
+                Notification.id > last_id
+            ).order_by(Notification.id).limit(SSE_BATCH_SIZE).all()
+        items = [NotificationResponse.model_validate(row).model_dump(mode="json") for row in rows]
+        return items, get_unread_notification_count(db, user_id), last_id
+    finally:
+        db.close()
+
+def sse_message(data: Dict[str, Any], event_name: str, event_id: Optional[int] = None) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_name}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+async def notification_event_stream(request: Request, user_id: int, last_id: Optional[int]):
+    queue = notification_hub.subscribe(user_id)
+    try:
+        yield f"retry: {SSE_RETRY_MILLISECONDS}\n\n"
+        pending = True
+        sent_unread_count = None
+        while not await request.is_disconnected():
+            if pending:
+                items, unread_count, last_id = await asyncio.to_thread(fetch_notifications_after, user_id, last_id)
+                for item in items:
+                    last_id = item["id"]
+                    yield sse_message(item, "notification", last_id)
+                # خوانده شدن نوتیفیکیشن در تب یا دستگاه دیگر هم فقط شمارنده را تغییر می‌دهد
+                if items or unread_count != sent_unread_count:
+                    yield sse_message({"unread_count": unread_count}, "unread")
+                    sent_unread_count = unread_count
+                # اگر عقب‌افتادگی بیش از یک دسته بود، بدون انتظار ادامه بده
+                pending = len(items) >= SSE_BATCH_SIZE
+                if pending:
+                    continue
+            
+            try:
+                await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_SECONDS)
+                pending = True
+            except asyncio.TimeoutError:
+                yield ": heartbeat\n\n"
+    finally:
+        notification_hub.unsubscribe(user_id, queue)
+
+def create_stream_token(user: User) -> str:
+    expire = datetime.utcnow() + timedelta(seconds=STREAM_TOKEN_EXPIRE_SECONDS)
+    return jwt.encode(
+        {"sub": user.email, "uid": user.id, "scope": NOTIFICATION_STREAM_SCOPE, "exp": expire},
+        SECRET_KEY,
+        algorithm=ALGORITHM
+    )
+
+def get_stream_token_user(token: Optional[str], db: Session) -> Optional[User]:
+    """کاربر توکن جریان؛ توکن ورود معمولی در query string پذیرفته نمی‌شود"""
+    if not token:
+        return None
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    if payload.get("scope") != NOTIFICATION_STREAM_SCOPE:
+        return None
+    user = db.query(User).filter(User.id == payload.get("uid"), User.email == payload.get("sub")).first()
+    if user is None or not user.is_verified:
+        return None
+    return user
+
+@app.post("/users/{user_id}/notifications/stream-token")
+async def create_notification_stream_token(user_id: int, current_user: User = Depends(get_current_user)):
+    """
+    توکن یک‌منظوره و کوتاه‌مدت برای باز کردن کانال SSE (EventSource هدر Authorization نمی‌فرستد)
+    """
+    if not current_user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="برای دریافت نوتیفیکیشن‌ها باید وارد شوید"
+        )
+    if current_user.id != user_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="دسترسی غیرمجاز"
+        )
+    return {"stream_token": create_stream_token(current_user), "expires_in": STREAM_TOKEN_EXPIRE_SECONDS}
+
+@app.get("/users/{user_id}/notifications/stream")
+async def stream_user_notifications(
+    user_id: int,
+    request: Request,
+    token: Optional[str] = None,
+    last_event_id: Optional[int] = None
+):
+    """
+    کانال SSE نوتیفیکیشن‌ها با heartbeat و ادامه از Last-Event-ID
+    احراز هویت با هدر Authorization یا توکن جریان (stream-token) در query string
+    """
+    # نشست فقط برای احراز هویت؛ در طول جریان هیچ اتصالی نگه داشته نمی‌شود
+    db = SessionLocal()
+    try:
+        authorization = request.headers.get("authorization", "")
+        if authorization.lower().startswith("bearer "):
+            current_user = await get_current_user(authorization[7:], db)
+        else:
+            current_user = get_stream_token_user(token, db)
+    finally:
+        db.close()
+    
+    if not current_user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="برای دریافت نوتیفیکیشن‌ها باید وارد شوید"
+        )
+    if current_user.id != user_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="دسترسی غیرمجاز"
+        )
+    
+    header_last_id = request.headers.get("last-event-id")
+    if header_last_id and header_last_id.isdigit():
+        last_event_id = int(header_last_id)
+    
+    return StreamingResponse(
+        notification_event_stream(request, user_id, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# ===================== ارسال گروهی نوتیفیکیشن =====================
+FANOUT_CHUNK_SIZE = int(os.getenv("MANAREH_FANOUT_CHUNK_SIZE", "1000"))
+FANOUT_CHUNK_PAUSE = float(os.getenv("MANAREH_FANOUT_CHUNK_PAUSE", "0.05"))
+FANOUT_POLL_SECONDS = int(os.getenv("MANAREH_FANOUT_POLL_SECONDS", "5"))
+# کار running بدون heartbeat در این مدت رها شده فرض می‌شود (worker متوقف شده)
+FANOUT_LEASE_SECONDS = int(os.getenv("MANAREH_FANOUT_LEASE_SECONDS", "300"))
+FANOUT_AUDIENCES = {"event", "province"}
+ADMIN_EMAILS = {email.strip().lower() for email in os.getenv("MANAREH_ADMIN_EMAILS", "").split(",") if email.strip()}
+
+fanout_wakeup: Optional[asyncio.Event] = None
+
+def is_admin(user: Optional[User]) -> bool:
+    return bool(user and user.email and user.email.lower() in ADMIN_EMAILS)
+
+def fanout_audience_ids(job: NotificationJob):
+    """ستون شناسه کاربر و شرط مخاطبان؛ هر دو روی ایندکس با ترتیب user_id پیمایش می‌شوند"""
+    if job.audience == "event":
+        return EventParticipant.user_id, EventParticipant.event_id == int(job.audience_key)
+    return User.id, User.province == job.audience_key
+
+def claim_fanout_job(db: Session) -> Optional[int]:
+    """برداشتن یک کار pending یا رهاشده با UPDATE شرطی - چند worker یک کار را دو بار برنمی‌دارند"""
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=FANOUT_LEASE_SECONDS)
+    candidate = db.query(NotificationJob.id).filter(
+        or_(
+            NotificationJob.status == "pending",
+            and_(NotificationJob.status == "running", NotificationJob.heartbeat_at < stale)
+        )
+    ).order_by(NotificationJob.id).first()
+    if not candidate:
+        return None
+    
+    claimed = db.query(NotificationJob).filter(
+        NotificationJob.id == candidate.id,
+        or_(
+            NotificationJob.status == "pending",
+            and_(NotificationJob.status == "running", NotificationJob.heartbeat_at < stale)
+        )
+    ).update({
+        NotificationJob.status: "running",
+        NotificationJob.started_at: func.coalesce(NotificationJob.started_at, now),
+        NotificationJob.heartbeat_at: now
+    }, synchronize_session=False)
+    db.commit()
+    return candidate.id if claimed else None
+
+def run_fanout_job(job_id: int):
+    """
+    درج نوتیفیکیشن‌ها در دسته‌های چندردیفی؛ هر دسته همراه با پیشرفت کار در یک تراکنش commit می‌شود
+    پس ادامه پس از توقف هیچ کاربری را دو بار یا جا افتاده نمی‌کند
+    """
+    db = SessionLocal()
+    try:
+        job = db.query(NotificationJob).filter(NotificationJob.id == job_id).first()
+        user_column, audience_filter = fanout_audience_ids(job)
+        
+        if not job.total:
+            job.total = db.query(func.count(user_column)).filter(audience_filter).scalar() or 0
+            db.commit()
+        
+        while True:
+            user_ids = [row[0] for row in db.query(user_column).filter(
+                audience_filter,
+                user_column > job.last_user_id
+            ).order_by(user_column).limit(FANOUT_CHUNK_SIZE)]
+            if not user_ids:
+                break
+            
+            now = datetime.utcnow()
+            db.execute(insert(Notification), [
+                {"user_id": user_id, "title": job.title, "message": job.message, "type": job.type, "read": False, "created_at": now}
+                for user_id in user_ids
+            ])
+            increment_unread_notifications(db, user_ids)
+            job.sent += len(user_ids)
+            job.last_user_id = user_ids[-1]
+            job.heartbeat_at = now
+            db.commit()
+            
+            if FANOUT_CHUNK_PAUSE:
+                time.sleep(FANOUT_CHUNK_PAUSE)
+        
+        job.status = "completed"
+        job.finished_at = datetime.utcnow()
+        db.commit()
+        logger.info(f"ارسال گروهی {job_id} کامل شد ({job.sent} نوتیفیکیشن)")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"خطا در ارسال گروهی {job_id}: {e}")
+        db.query(NotificationJob).filter(NotificationJob.id == job_id).update({
+            NotificationJob.status: "failed",
+            NotificationJob.error: str(e)[:500],
+            NotificationJob.finished_at: datetime.utcnow()
+        }, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+def process_fanout_jobs() -> int:
+    processed = 0
+    while True:
+        db = SessionLocal()
+        try:
+            job_id = claim_fanout_job(db)
+        finally:
+            db.close()
+        if job_id is None:
+            return processed
+        run_fanout_job(job_id)
+        processed += 1
+
+def notification_job_response(job: NotificationJob) -> NotificationJobResponse:
+    return NotificationJobResponse(
+        id=job.id,
+        audience=job.audience,
+        audience_key=job.audience_key,
+        status=job.status,
+        total=job.total,
+        sent=job.sent,
+        progress=round(job.sent * 100 / job.total, 1) if job.total else (100.0 if job.status == "completed" else 0.0),
+        error=job.error,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at
+    )
+
+@app.post("/notifications/fan-out", response_model=NotificationJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_notification_fanout(
+    fanout: NotificationFanOutCreate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    ثبت ارسال گروهی - درج نوتیفیکیشن‌ها در پس‌زمینه انجام می‌شود و پاسخ بلافاصله برمی‌گردد
+    برگزارکننده به شرکت‌کنندگان رویداد خود و مدیران به کاربران یک استان ارسال می‌کنند
+    """
+    try:
+        if fanout.audience not in FANOUT_AUDIENCES:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="نوع مخاطبان نامعتبر است"
+            )
+        
+        if fanout.audience == "event":
+            if fanout.event_id is None:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="شناسه رویداد الزامی است"
+                )
+            get_event_for_organizer(db, fanout.event_id, current_user)
+            audience_key = str(fanout.event_id)
+        else:
+            if not current_user:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="برای ارسال نوتیفیکیشن باید وارد شوید"
+                )
+            if not is_admin(current_user):
+                raise HTTPException(
+                    status_code=status.HTTP_403_FORBIDDEN,
+                    detail="دسترسی غیرمجاز"
+                )
+            if not fanout.province:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="نام استان الزامی است"
+                )
+            audience_key = fanout.province
+        
+        job = NotificationJob(
+            created_by=current_user.id,
+            audience=fanout.audience,
+            audience_key=audience_key,
+            title=fanout.title,
+            message=fanout.message,
+            type=fanout.type,
+            status="pending"
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        
+        if fanout_wakeup is not None:
+            fanout_wakeup.set()
+        
+        logger.info(f"ارسال گروهی {job.id} برای {fanout.audience}={audience_key} ثبت شد")
+        return notification_job_response(job)
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        logger.error(f"خطا در ثبت ارسال گروهی: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="خطای سرور در ثبت ارسال گروهی"
+        )
+
+@app.get("/notifications/fan-out/{job_id}", response_model=NotificationJobResponse)
+async def get_notification_fanout(job_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    وضعیت و پیشرفت ارسال گروهی
+    """
+    try:
+        job = db.query(NotificationJob).filter(NotificationJob.id == job_id).first()
+        if not job:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="ارسال گروهی یافت نشد"
+            )
+        
+        if not current_user or (job.created_by != current_user.id and not is_admin(current_user)):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="دسترسی غیرمجاز"
+            )
+        
+        return notification_job_response(job)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"خطا در دریافت وضعیت ارسال گروهی: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="خطای سرور در دریافت وضعیت ارسال گروهی"
+        )
+
+# ===================== نگهداری و بایگانی نوتیفیکیشن‌ها =====================
+# صفر = بایگانی غیرفعال
+NOTIFICATION_RETENTION_DAYS = int(os.getenv("MANAREH_NOTIFICATION_RETENTION_DAYS", "90"))
+NOTIFICATION_ARCHIVE_BATCH_SIZE = int(os.getenv("MANAREH_NOTIFICATION_ARCHIVE_BATCH_SIZE", "500"))
+# مکث بین دسته‌ها تا replica ها عقب نیفتند و قفل‌ها کوتاه بمانند
+NOTIFICATION_ARCHIVE_PAUSE = float(os.getenv("MANAREH_NOTIFICATION_ARCHIVE_PAUSE", "0.5"))
+NOTIFICATION_ARCHIVE_MAX_BATCHES = int(os.getenv("MANAREH_NOTIFICATION_ARCHIVE_MAX_BATCHES", "200"))
+NOTIFICATION_ARCHIVE_INTERVAL = int(os.getenv("MANAREH_NOTIFICATION_ARCHIVE_INTERVAL", "3600"))
+
+ARCHIVE_COLUMNS = ["id", "user_id", "title", "message", "type", "read", "created_at"]
+archive_status = {"last_run": None, "last_archived": 0, "total_archived": 0}
+
+def archive_notification_batch(db: Session, cutoff: datetime) -> int:
+    """انتقال یک دسته از نوتیفیکیشن‌های خوانده‌شده قدیمی به بایگانی در یک تراکنش کوتاه"""
+    ids = [row.id for row in db.query(Notification.id).filter(
+        Notification.read == True,
+        Notification.created_at < cutoff
+    ).order_by(Notification.created_at).limit(NOTIFICATION_ARCHIVE_BATCH_SIZE)]
+    if not ids:
+        return 0
+    
+    source = select(*[getattr(Notification, column) for column in ARCHIVE_COLUMNS]).where(Notification.id.in_(ids))
+    db.execute(mysql_insert(NotificationArchive).prefix_with("IGNORE").from_select(ARCHIVE_COLUMNS, source))
+    # فقط ردیف‌هایی که هنوز خوانده‌شده‌اند حذف می‌شوند
+    deleted = db.query(Notification).filter(
+        Notification.id.in_(ids),
+        Notification.read == True
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+def archive_old_notifications() -> int:
+    if NOTIFICATION_RETENTION_DAYS <= 0:
+        return 0
+    
+    cutoff = datetime.utcnow() - timedelta(days=NOTIFICATION_RETENTION_DAYS)
+    archived = 0
+    db = SessionLocal()
+    try:
+        for _ in range(NOTIFICATION_ARCHIVE_MAX_BATCHES):
+            # وقتی replica ناسالم است حذف‌های بیشتر فقط عقب‌افتادگی را بدتر می‌کند
+            if replica_set.replicas and not all(replica["healthy"] for replica in replica_set.replicas):
+                logger.info("بایگانی نوتیفیکیشن‌ها تا سالم شدن replica ها متوقف شد")
+                break
+            
+            count = archive_notification_batch(db, cutoff)
+            archived += count
+            if count < NOTIFICATION_ARCHIVE_BATCH_SIZE:
+                break
+            time.sleep(NOTIFICATION_ARCHIVE_PAUSE)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+        archive_status["last_run"] = datetime.utcnow().isoformat()
+        archive_status["last_archived"] = archived
+        archive_status["total_archived"] += archived
+    
+    if archived:
+        logger.info(f"{archived} نوتیفیکیشن قدیمی بایگانی شد")
+    return archived
+
+# ===================== آمار تجمیعی روزانه =====================
+# صفر = غیرفعال
+ANALYTICS_ROLLUP_INTERVAL = int(os.getenv("MANAREH_ANALYTICS_ROLLUP_INTERVAL", "600"))
+ANALYTICS_ROLLUP_BATCH_IDS = int(os.getenv("MANAREH_ANALYTICS_ROLLUP_BATCH_IDS", "50000"))
+# شناسه auto-increment قبل از commit گرفته می‌شود؛ ردیف‌های جوان‌تر از این مقدار هنوز ممکن است
+# کنار شناسه‌های کوچک‌ترِ commit‌نشده باشند و watermark از آن‌ها عبور نمی‌کند
+ANALYTICS_ROLLUP_SETTLE_SECONDS = int(os.getenv("MANAREH_ANALYTICS_ROLLUP_SETTLE_SECONDS", "300"))
+ROLLUP_DIMENSIONS = ["province", "city", "category", "type"]
+
+# منبع -> (جدول، ستون زمان، ستون شناسه رویداد، ستون‌های مقصد و عبارت تجمیع هر کدام)
+ROLLUP_SOURCES = {
+    "events": ("events", "created_at", "id", {"events_created": "COUNT(*)"}),
+    "event_participants": ("event_participants", "registered_at", "event_id", {"registrations": "COUNT(*)"}),
+    "comments": ("comments", "created_at", "event_id", {"comments": "COUNT(*)", "rating_sum": "COALESCE(SUM(x.rating), 0)"}),
+}
+
+def rollup_source(db: Session, source: str) -> int:
+    """
+    افزودن ردیف‌های جدید یک منبع به daily_event_rollups در بازه‌های شناسه
+    هر بازه همراه با watermark در یک تراکنش commit می‌شود، پس هیچ ردیفی دو بار شمرده نمی‌شود
+    """
+    table, time_column, event_column, metrics = ROLLUP_SOURCES[source]
+    db.execute(mysql_insert(RollupWatermark).prefix_with("IGNORE").values(source=source, last_id=0, updated_at=datetime.utcnow()))
+    db.commit()
+    
+    dimensions = ", ".join(f"COALESCE(e.{column}, '')" for column in ROLLUP_DIMENSIONS)
+    columns = ", ".join(metrics)
+    aggregates = ", ".join(metrics.values())
+    updates = ", ".join(f"{column} = {column} + VALUES({column})" for column in metrics)
+    rollup = text(f"""
+        INSERT INTO daily_event_rollups (day, {", ".join(ROLLUP_DIMENSIONS)}, {columns})
+        SELECT DATE(x.{time_column}), {dimensions}, {aggregates}
+        FROM {table} x
+        JOIN events e ON e.id = x.{event_column}
+        WHERE x.id > :lower AND x.id <= :upper AND x.{time_column} IS NOT NULL
+        GROUP BY DATE(x.{time_column}), {dimensions}
+        ON DUPLICATE KEY UPDATE {updates}
+    """)
+    
+    # نقطه امن: فقط تا پیش از اولین ردیفی که هنوز به اندازه settle قدیمی نشده
+    # (تراکنش‌های بازِ طولانی‌تر از settle همچنان ممکن است جا بمانند)
+    safe_point = text(f"""
+        SELECT MIN(CASE WHEN {time_column} >= :settled THEN id END), MAX(id)
+        FROM {table}
+        WHERE id > :lower
+    """)
+    
+    processed = 0
+    safe_id = None
+    while True:
+        # قفل watermark تا دو worker یک بازه را همزمان پردازش نکنند
+        watermark = db.query(RollupWatermark).filter(RollupWatermark.source == source).with_for_update().one()
+        if safe_id is None:
+            first_unsettled, max_id = db.execute(safe_point, {
+                "lower": watermark.last_id,
+                "settled": datetime.utcnow() - timedelta(seconds=ANALYTICS_ROLLUP_SETTLE_SECONDS)
+            }).one()
+            safe_id = first_unsettled - 1 if first_unsettled is not None else (max_id or 0)
+        if safe_id <= watermark.last_id:
+            db.rollback()
+            return processed
+        
+        upper = min(safe_id, watermark.last_id + ANALYTICS_ROLLUP_BATCH_IDS)
+        db.execute(rollup, {"lower": watermark.last_id, "upper": upper})
+        processed += upper - watermark.last_id
+        
+        watermark.last_id = upper
+        watermark.updated_at = datetime.utcnow()
+        db.commit()
+
+def run_analytics_rollups() -> int:
+    db = SessionLocal()
+    try:
+        return sum(rollup_source(db, source) for source in ROLLUP_SOURCES)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+@app.get("/analytics/daily")
+async def get_daily_analytics(
+    start: date,
+    end: date,
+    group_by: str = "province,category",
+    province: Optional[str] = None,
+    category: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """
+    گزارش فعالیت از جدول تجمیعی روزانه - بدون پیمایش events، event_participants و comments
+    group_by: ترکیبی از day, province, city, category, type
+    """
+    try:
+        if not is_admin(current_user):
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="دسترسی غیرمجاز"
             )
         
-        db.query(Notification).filter(
-            Notification.user_id == user_id,
-            Notification.read == False
-        ).update({"read": True})
+        groups = [column.strip() for column in group_by.split(",") if column.strip()]
+        if not groups or any(column not in ["day"] + ROLLUP_DIMENSIONS for column in groups):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="ستون گروه‌بندی نامعتبر است"
+            )
         
-        db.commit()
+        group_columns = [getattr(DailyEventRollup, column) for column in groups]
+        query = db.query(
+            *group_columns,
+            func.sum(DailyEventRollup.events_created).label("events_created"),
+            func.sum(DailyEventRollup.registrations).label("registrations"),
+            func.sum(DailyEventRollup.comments).label("comments"),
+            func.sum(DailyEventRollup.rating_sum).label("rating_sum")
+        ).filter(
+            DailyEventRollup.day >= start,
+            DailyEventRollup.day <= end
+        )
+        if province:
+            query = query.filter(DailyEventRollup.province == province)
+        if category:
+            query = query.filter(DailyEventRollup.category == category)
         
-        return {"message": "همه نوتیفیکیشن‌ها به عنوان خوانده شده علامت گذاری شدند"}
+        rows = query.group_by(*group_columns).order_by(*group_columns).all()
+        return {
+            "start": start,
+            "end": end,
+            "group_by": groups,
+            "rows": [
+                {
+                    **{column: getattr(row, column) for column in groups},
+                    "events_created": int(row.events_created or 0),
+                    "registrations": int(row.registrations or 0),
+                    "comments": int(row.comments or 0),
+                    "average_rating": round(int(row.rating_sum or 0) / int(row.comments), 1) if row.comments else 0.0
+                }
+                for row in rows
+            ]
+        }
+    except HTTPException:
+        raise
     except Exception as e:
-        db.rollback()
-        logger.error(f"خطا در علامت گذاری همه نوتیفیکیشن‌ها: {e}")
+        logger.error(f"خطا در دریافت گزارش روزانه: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="خطای سرور در به‌روزرسانی نوتیفیکیشن‌ها"
+            detail="خطای سرور در دریافت گزارش"
         )
 
+# کدهای خطای MySQL برای تشخیص علت IntegrityError
+MYSQL_DUPLICATE_ENTRY = 1062
+MYSQL_FOREIGN_KEY_FAILED = 1452
+
+def mysql_error_code(error: IntegrityError) -> Optional[int]:
+    args = getattr(error.orig, "args", ())
+    return args[0] if args else None
+
+def recount_user_favorites(db: Session, user_id: int):
+    favorites = db.query(func.count(UserFavorite.id)).filter(UserFavorite.user_id == user_id).scalar_subquery()
+    stmt = mysql_insert(UserSummary).values(user_id=user_id, favorites=favorites)
+    db.execute(stmt.on_duplicate_key_update(favorites=stmt.inserted.favorites))
+    invalidate_user_stats(db, [user_id])
+
+def adjust_favorite_count(db: Session, event_id: int, delta: int):
+    stmt = mysql_insert(EventStats).values(event_id=event_id, favorite_count=max(delta, 0))
+    db.execute(stmt.on_duplicate_key_update(
+        favorite_count=func.greatest(EventStats.favorite_count + delta, 0)
+    ))
+
 # اضافه کردن endpoint برای علاقه‌مندی‌ها
 @app.post("/favorites", response_model=FavoriteResponse)
 async def add_to_favorites(favorite: FavoriteCreate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    افزودن به علاقه‌مندی‌ها - یک INSERT که کلید یکتا و کلیدهای خارجی آن را اعتبارسنجی می‌کنند
+    درخواست تکراری (دو بار لمس) همان علاقه‌مندی موجود را برمی‌گرداند
+    """
     try:
         logger.info(f"افزودن رویداد {favorite.event_id} به علاقه‌مندی‌های کاربر {favorite.user_id}")
         
-        # بررسی وجود رویداد
-        event = db.query(Event).filter(Event.id == favorite.event_id).first()
-        if not event:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="رویداد یافت نشد"
-            )
-        
-        # بررسی وجود کاربر
-        user = db.query(User).filter(User.id == favorite.user_id).first()
-        if not user:
+        if not current_user or current_user.id != favorite.user_id:
             raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="کاربر یافت نشد"
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="دسترسی غیرمجاز"
             )
         
-        # بررسی آیا قبلاً به علاقه‌مندی اضافه شده
-        existing_favorite = db.query(UserFavorite).filter(
-            UserFavorite.user_id == favorite.user_id,
-            UserFavorite.event_id == favorite.event_id
-        ).first()
-        
-        if existing_favorite:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="این رویداد قبلاً به علاقه‌مندی‌ها اضافه شده است"
-            )
+        created_at = datetime.utcnow()
+        try:
+            favorite_id = db.execute(
+                insert(UserFavorite).values(
+                    user_id=favorite.user_id,
+                    event_id=favorite.event_id,
+                    created_at=created_at
+                )
+            ).lastrowid
+            adjust_favorite_count(db, favorite.event_id, 1)
+            adjust_user_summary(db, favorite.user_id, favorites=1)
+            db.commit()
+        except IntegrityError as e:
+            db.rollback()
+            if mysql_error_code(e) != MYSQL_DUPLICATE_ENTRY:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="رویداد یافت نشد"
+                )
+            existing = db.query(UserFavorite).filter(
+                UserFavorite.user_id == favorite.user_id,
+                UserFavorite.event_id == favorite.event_id
+            ).first()
+            return existing
         
-        # ایجاد علاقه‌مندی جدید
-        db_favorite = UserFavorite(
+        logger.info("رویداد به علاقه‌مندی‌ها اضافه شد")
+        return FavoriteResponse(
+            id=favorite_id,
             user_id=favorite.user_id,
-            event_id=favorite.event_id
+            event_id=favorite.event_id,
+            created_at=created_at
         )
-        db.add(db_favorite)
-        db.commit()
-        db.refresh(db_favorite)
-        
-        logger.info("رویداد به علاقه‌مندی‌ها اضافه شد")
-        return db_favorite
         
     except HTTPException:
         raise
@@ -2449,6 +5657,9 @@ async def add_to_favorites(favorite: FavoriteCreate, current_user: User = Depend
 
 @app.delete("/favorites/{user_id}/{event_id}")
 async def remove_from_favorites(user_id: int, event_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    حذف از علاقه‌مندی‌ها با یک DELETE - حذف تکراری خطا نمی‌دهد
+    """
     try:
         logger.info(f"حذف رویداد {event_id} از علاقه‌مندی‌های کاربر {user_id}")
         
@@ -2458,22 +5669,17 @@ async def remove_from_favorites(user_id: int, event_id: int, current_user: User
                 detail="دسترسی غیرمجاز"
             )
         
-        favorite = db.query(UserFavorite).filter(
+        deleted = db.query(UserFavorite).filter(
             UserFavorite.user_id == user_id,
             UserFavorite.event_id == event_id
-        ).first()
-        
-        if not favorite:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="این رویداد در علاقه‌مندی‌ها یافت نشد"
-            )
-        
-        db.delete(favorite)
+        ).delete(synchronize_session=False)
+        if deleted:
+            adjust_favorite_count(db, event_id, -deleted)
+            adjust_user_summary(db, user_id, favorites=-deleted)
         db.commit()
         
         logger.info("رویداد از علاقه‌مندی‌ها حذف شد")
-        return {"message": "رویداد از علاقه‌مندی‌ها حذف شد"}
+        return {"message": "رویداد از علاقه‌مندی‌ها حذف شد", "removed": bool(deleted)}
         
     except HTTPException:
         raise
@@ -2485,8 +5691,73 @@ async def remove_from_favorites(user_id: int, event_id: int, current_user: User
             detail="خطای سرور در حذف از علاقه‌مندی‌ها"
         )
 
+@app.post("/users/{user_id}/favorites/batch")
+async def update_favorites_batch(
+    user_id: int,
+    batch: FavoriteBatch,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    افزودن و حذف چند علاقه‌مندی در یک درخواست - تکرار همان درخواست نتیجه را تغییر نمی‌دهد
+    """
+    try:
+        if current_user.id != user_id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="دسترسی غیرمجاز"
+            )
+        validate_batch_size(len(batch.add) + len(batch.remove))
+        
+        add_ids = set(batch.add) - set(batch.remove)
+        remove_ids = set(batch.remove)
+        
+        # وضعیت فعلی همه رویدادهای درخواستی با یک LEFT JOIN
+        current = {}
+        if add_ids or remove_ids:
+            current = {
+                row.id: row.favorite_id is not None
+                for row in db.query(Event.id, UserFavorite.id.label("favorite_id")).outerjoin(
+                    UserFavorite,
+                    and_(UserFavorite.event_id == Event.id, UserFavorite.user_id == user_id)
+                ).filter(Event.id.in_(add_ids | remove_ids))
+            }
+        
+        to_add = sorted(event_id for event_id in add_ids if current.get(event_id) is False)
+        to_remove = sorted(event_id for event_id in remove_ids if current.get(event_id))
+        
+        if to_add:
+            # INSERT ... SELECT از events: کلید خارجی از پیش برقرار است و IGNORE فقط درج همزمان تکراری را کنار می‌گذارد
+            source = select(literal(user_id), Event.id, literal(datetime.utcnow())).where(Event.id.in_(to_add))
+            db.execute(mysql_insert(UserFavorite).prefix_with("IGNORE").from_select(["user_id", "event_id", "created_at"], source))
+        if to_remove:
+            db.query(UserFavorite).filter(
+                UserFavorite.user_id == user_id,
+                UserFavorite.event_id.in_(to_remove)
+            ).delete(synchronize_session=False)
+        sync_favorite_counts(db, to_add + to_remove)
+        if to_add or to_remove:
+            recount_user_favorites(db, user_id)
+        db.commit()
+        
+        return {
+            "added": to_add,
+            "removed": to_remove,
+            "unchanged": sorted(set(current) - set(to_add) - set(to_remove)),
+            "unknown": sorted((add_ids | remove_ids) - set(current))
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        logger.error(f"خطا در به‌روزرسانی دسته‌ای علاقه‌مندی‌ها: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="خطای سرور در به‌روزرسانی علاقه‌مندی‌ها"
+        )
+
 @app.get("/users/{user_id}/favorites", response_model=List[EventResponse])
-async def get_user_favorites(user_id: int, db: Session = Depends(get_db)):
+async def get_user_favorites(user_id: int, db: Session = Depends(get_read_db)):
     try:
         logger.info(f"دریافت علاقه‌مندی‌های کاربر {user_id}")
         
@@ -2501,15 +5772,15 @@ async def get_user_favorites(user_id: int, db: Session = Depends(get_db)):
         event_ids = [fav.event_id for fav in favorites]
         
         events = db.query(Event).filter(Event.id.in_(event_ids)).all()
+        stats_by_event = load_event_stats(db, [event.id for event in events])
         
         events_list = []
         for event in events:
-            avg_rating_result = db.query(func.avg(Comment.rating)).filter(Comment.event_id == event.id).scalar()
-            average_rating = round(float(avg_rating_result or 0), 1)
+            stats = stats_by_event.get(event.id)
+            average_rating = event_average_rating(stats)
+            comment_count = stats.comment_count if stats else 0
             
-            comment_count = db.query(Comment).filter(Comment.event_id == event.id).count()
-            
-            current_participants = db.query(EventParticipant).filter(EventParticipant.event_id == event.id).count()
+            current_participants = stats.participant_count if stats else 0
             
             # بررسی آیا رویداد مورد علاقه کاربر است
             is_favorite = True
@@ -2536,6 +5807,7 @@ async def get_user_favorites(user_id: int, db: Session = Depends(get_db)):
                 "price": getattr(event, 'price', 0.0),
                 "average_rating": average_rating,
                 "comment_count": comment_count,
+                "favorite_count": stats.favorite_count if stats else 0,
                 "current_participants": current_participants,
                 "is_favorite": is_favorite,
                 "is_registered": False
@@ -2643,9 +5915,105 @@ async def test_db(db: Session = Depends(get_db)):
     except Exception as e:
         return {"error": str(e), "status": "خطا در اتصال به دیتابیس"}
 
+# کوئری‌های پرتکرار و ایندکسی که باید برای هر کدام قابل استفاده باشد
+INDEX_PROBES = [
+    ("participant_lookup", "SELECT id FROM event_participants WHERE event_id = 1 AND user_id = 1", "uq_event_participants_event_user"),
+    ("favorite_lookup", "SELECT id FROM user_favorites WHERE event_id = 1 AND user_id = 1", "uq_user_favorites_event_user"),
+    ("event_comments", "SELECT id FROM comments WHERE event_id = 1 ORDER BY created_at DESC LIMIT 20", "idx_comments_event_created"),
+    ("unread_notifications", "SELECT id FROM notifications WHERE user_id = 1 AND `read` = 0 ORDER BY created_at DESC LIMIT 20", "idx_notifications_user_read_created"),
+    ("notification_page", "SELECT id FROM notifications WHERE user_id = 1 ORDER BY created_at DESC, id DESC LIMIT 51", "idx_notifications_user_created"),
+    ("notification_archive", "SELECT id FROM notifications WHERE `read` = 1 AND created_at < NOW() ORDER BY created_at LIMIT 500", "idx_notifications_read_created"),
+    ("active_events_feed", "SELECT id FROM events WHERE active = 1 AND time >= '2024-01-01' ORDER BY time", "idx_events_active_time"),
+    ("creator_events", "SELECT id FROM events WHERE creator = 1", "idx_events_creator"),
+]
+
+def explain_index_probe(db: Session, query: str) -> dict:
+    """پلن EXPLAIN یک کوئری؛ ok فقط وقتی MySQL واقعاً ایندکس مورد انتظار را انتخاب کرده و اسکن کامل نیست"""
+    plan = db.execute(text(f"EXPLAIN {query}")).mappings().first()
+    return {
+        "key": plan.get("key"),
+        "possible_keys": (plan.get("possible_keys") or "").split(","),
+        "access_type": plan.get("type"),
+        "estimated_rows": plan.get("rows")
+    }
+
+@app.get("/test-db/indexes")
+async def test_db_indexes(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    بررسی پلن اجرای کوئری‌های پرتکرار با EXPLAIN (فقط مدیر)
+    """
+    if not is_admin(current_user):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="دسترسی غیرمجاز"
+        )
+    
+    results = []
+    for name, query, expected_index in INDEX_PROBES:
+        try:
+            plan = explain_index_probe(db, query)
+            results.append({
+                "query": name,
+                "expected_index": expected_index,
+                **plan,
+                "ok": plan["key"] == expected_index and plan["access_type"] != "ALL"
+            })
+        except Exception as e:
+            results.append({"query": name, "expected_index": expected_index, "ok": False, "error": str(e)})
+    
+    return {
+        "ok": all(result["ok"] for result in results),
+        "probes": results
+    }
+
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "timestamp": datetime.utcnow()}
+    return {
+        "status": "healthy",
+        "timestamp": datetime.utcnow(),
+        "database_pools": [stats.snapshot() for stats in POOL_STATS.values()],
+        "replicas": replica_set.status(),
+        "notification_stream": notification_hub.status(),
+        "notification_archive": archive_status
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    متریک‌ها به فرمت متنی Prometheus
+    """
+    lines = []
+    gauges = [
+        ("manareh_db_pool_size", "size"),
+        ("manareh_db_pool_checked_out", "checked_out"),
+        ("manareh_db_pool_overflow", "overflow"),
+    ]
+    counters = [
+        ("manareh_db_pool_checkouts_total", "checkouts"),
+        ("manareh_db_pool_timeouts_total", "timeouts"),
+        ("manareh_db_pool_pings_total", "pings"),
+        ("manareh_db_pool_ping_failures_total", "ping_failures"),
+        ("manareh_db_pool_wait_seconds_total", "wait_seconds_total"),
+    ]
+    snapshots = [stats.snapshot() for stats in POOL_STATS.values()]
+    for metric, key in gauges:
+        lines.append(f"# TYPE {metric} gauge")
+        lines.extend(f'{metric}{{pool="{snap["name"]}"}} {snap[key]}' for snap in snapshots)
+    for metric, key in counters:
+        lines.append(f"# TYPE {metric} counter")
+        lines.extend(f'{metric}{{pool="{snap["name"]}"}} {snap[key]}' for snap in snapshots)
+    lines.append("# TYPE manareh_db_pool_checkout_seconds histogram")
+    for snap in snapshots:
+        histogram = snap["checkout_latency_histogram"]
+        for bucket, count in histogram.items():
+            le = "+Inf" if bucket == "le_inf" else bucket[3:]
+            lines.append(f'manareh_db_pool_checkout_seconds_bucket{{pool="{snap["name"]}",le="{le}"}} {count}')
+        lines.append(f'manareh_db_pool_checkout_seconds_sum{{pool="{snap["name"]}"}} {snap["wait_seconds_total"]}')
+        lines.append(f'manareh_db_pool_checkout_seconds_count{{pool="{snap["name"]}"}} {histogram["le_inf"]}')
+    return PlainTextResponse("\n".join(lines) + "\n")
 
 # 🎯 اضافه کردن endpoint برای پرداخت نذورات (ورژن ساده)
 @app.post("/donations/pay")
@@ -2665,13 +6033,13 @@ async def pay_donation(
         card_number = "6219861918435032"
         
         # ثبت درخواست پرداخت
-        notification = Notification(
+        create_notification(
+            db,
             user_id=current_user.id,
             title="درخواست پرداخت نذری",
             message=f"برای پرداخت نذری {donation_data.donation_type}، لطفاً مبلغ را به شماره کارت {card_number} واریز کنید.",
             type="donation"
         )
-        db.add(notification)
         db.commit()
         
         return {
@@ -2689,24 +6057,216 @@ async def pay_donation(
             detail="خطای سرور در پرداخت نذری"
         )
 
+# ===================== تقویم جلالی =====================
+# الگوریتم jalaali (همان jalaali-js): سال‌های کبیسه از روی نقاط شکست چرخه ۳۳ ساله محاسبه می‌شوند
+JALALI_BREAKS = [-61, 9, 38, 199, 426, 686, 756, 818, 1111, 1181, 1210, 1635, 2060, 2097, 2192, 2262, 2324, 2394, 2456, 3178]
+JALALI_MONTH_NAMES = [
+    "فروردین", "اردیبهشت", "خرداد", "تیر", "مرداد", "شهریور",
+    "مهر", "آبان", "آذر", "دی", "بهمن", "اسفند"
+]
+# ایران از ۱۴۰۱ ساعت تابستانی ندارد
+IRAN_TZ = timezone(timedelta(hours=3, minutes=30))
+
+def _tdiv(a: int, b: int) -> int:
+    """تقسیم صحیح با گرد کردن به سمت صفر (مثل ~~(a / b) در جاوااسکریپت)"""
+    q = abs(a) // abs(b)
+    return q if (a >= 0) == (b >= 0) else -q
+
+def _tmod(a: int, b: int) -> int:
+    return a - _tdiv(a, b) * b
+
+def jalali_year_start(jy: int):
+    """ordinal میلادی اول فروردین و کبیسه بودن سال jy"""
+    if jy < JALALI_BREAKS[0] or jy >= JALALI_BREAKS[-1]:
+        raise ValueError(f"سال {jy} خارج از بازه پشتیبانی تقویم جلالی است")
+    gy = jy + 621
+    leap_j = -14
+    jp = JALALI_BREAKS[0]
+    jump = 0
+    for jm in JALALI_BREAKS[1:]:
+        jump = jm - jp
+        if jy < jm:
+            break
+        leap_j += _tdiv(jump, 33) * 8 + _tdiv(_tmod(jump, 33), 4)
+        jp = jm
+    n = jy - jp
+    leap_j += _tdiv(n, 33) * 8 + _tdiv(_tmod(n, 33) + 3, 4)
+    if _tmod(jump, 33) == 4 and jump - n == 4:
+        leap_j += 1
+    leap_g = _tdiv(gy, 4) - _tdiv((_tdiv(gy, 100) + 1) * 3, 4) - 150
+    march = 20 + leap_j - leap_g
+    if jump - n < 6:
+        n = n - jump + _tdiv(jump + 4, 33) * 33
+    leap = _tmod(_tmod(n + 1, 33) - 1, 4)
+    return date(gy, 3, march).toordinal(), leap == 0
+
+# جدول از پیش محاسبه‌شده سال‌های پرکاربرد: سال -> (ordinal اول فروردین، کبیسه)
+JALALI_TABLE_FIRST_YEAR = 1300
+JALALI_TABLE_LAST_YEAR = 1500
+JALALI_YEAR_TABLE = {jy: jalali_year_start(jy) for jy in range(JALALI_TABLE_FIRST_YEAR, JALALI_TABLE_LAST_YEAR + 1)}
+
+def jalali_year_info(jy: int):
+    return JALALI_YEAR_TABLE.get(jy) or jalali_year_start(jy)
+
+def is_jalali_leap(jy: int) -> bool:
+    return jalali_year_info(jy)[1]
+
+def jalali_month_length(jy: int, jm: int) -> int:
+    if jm <= 6:
+        return 31
+    if jm <= 11:
+        return 30
+    return 30 if is_jalali_leap(jy) else 29
+
+def jalali_to_gregorian(jy: int, jm: int, jd: int) -> date:
+    if jm < 1 or jm > 12 or jd < 1 or jd > jalali_month_length(jy, jm):
+        raise ValueError(f"تاریخ جلالی نامعتبر: {jy}/{jm}/{jd}")
+    day_of_year = (jm - 1) * 31 - max(jm - 7, 0) + jd - 1
+    return date.fromordinal(jalali_year_info(jy)[0] + day_of_year)
+
+def gregorian_to_jalali(value: date):
+    """تبدیل تاریخ میلادی به (سال، ماه، روز) جلالی"""
+    ordinal = value.toordinal()
+    jy = value.year - 621
+    start = jalali_year_info(jy)[0]
+    if ordinal < start:
+        jy -= 1
+        start = jalali_year_info(jy)[0]
+    day_of_year = ordinal - start
+    if day_of_year < 186:
+        return jy, day_of_year // 31 + 1, day_of_year % 31 + 1
+    day_of_year -= 186
+    return jy, day_of_year // 30 + 7, day_of_year % 30 + 1
+
+def jalali_today():
+    return gregorian_to_jalali(datetime.now(IRAN_TZ).date())
+
+def count_events_per_day(
+    db: Session,
+    start: date,
+    end: date,
+    province: Optional[str] = None,
+    category: Optional[str] = None
+) -> Dict[date, int]:
+    """تعداد رویدادهای فعال هر روز در بازه [start, end] با یک کوئری گروه‌بندی روی ایندکس (active, time)"""
+    day = func.date(Event.time)
+    query = db.query(day.label("day"), func.count(Event.id)).filter(
+        Event.active == 1,
+        Event.time >= datetime.combine(start, datetime.min.time()),
+        Event.time < datetime.combine(end + timedelta(days=1), datetime.min.time())
+    )
+    if province:
+        query = query.filter(Event.province == province)
+    if category:
+        query = query.filter(Event.category == category)
+    return {row[0]: row[1] for row in query.group_by(day).all()}
+
+def parse_calendar_date(value: str, calendar_type: str) -> date:
+    """خواندن تاریخ YYYY-MM-DD میلادی یا جلالی (جداکننده - یا /)"""
+    parts = [int(part) for part in value.replace("/", "-").split("-")]
+    if len(parts) != 3:
+        raise ValueError(f"تاریخ نامعتبر: {value}")
+    if calendar_type == "jalali":
+        return jalali_to_gregorian(*parts)
+    return date(*parts)
+
+def format_calendar_date(value: date, calendar_type: str) -> str:
+    if calendar_type == "jalali":
+        jy, jm, jd = gregorian_to_jalali(value)
+        return f"{jy:04d}-{jm:02d}-{jd:02d}"
+    return value.isoformat()
+
 # ===================== API های جدید برای تقویم =====================
 
+# مناسبت‌ها به ندرت تغییر می‌کنند؛ کل جدول در حافظه نگه داشته می‌شود و درخواست‌های تقویم به MySQL نمی‌روند
+# هر worker پس از ایجاد مناسبت فهرست خودش را فوراً و بقیه worker ها در بازخوانی دوره‌ای به‌روز می‌کنند (صفر = غیرفعال)
+OCCASION_INDEX_REFRESH_INTERVAL = int(os.getenv("MANAREH_OCCASION_INDEX_REFRESH", "300"))
+
+def json_etag(body: bytes) -> str:
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+def json_bytes(payload) -> bytes:
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+class OccasionIndex:
+    """snapshot تغییرناپذیر مناسبت‌ها با کلید (jmonth, jday) همراه با بدنه‌های JSON و ETag آماده"""
+
+    def __init__(self, occasions: List[Occasion]):
+        by_date: Dict[Any, list] = {}
+        for occasion in sorted(occasions, key=lambda o: (o.jmonth, o.jday, o.id)):
+            by_date.setdefault((occasion.jmonth, occasion.jday), []).append(
+                OccasionResponse.model_validate(occasion).model_dump(mode="json")
+            )
+        self.by_date = {key: tuple(items) for key, items in by_date.items()}
+        self.grouped_body = json_bytes({
+            f"{jmonth}-{jday}": [item["title"] for item in items]
+            for (jmonth, jday), items in self.by_date.items()
+        })
+        self.etag = json_etag(self.grouped_body)
+        self._date_bodies = {
+            key: (body, json_etag(body))
+            for key, body in ((key, json_bytes(list(items))) for key, items in self.by_date.items())
+        }
+        self.count = len(occasions)
+
+    def for_date(self, jmonth: int, jday: int):
+        return self.by_date.get((jmonth, jday), ())
+
+    def date_body(self, jmonth: int, jday: int):
+        """بدنه JSON و ETag مناسبت‌های یک روز"""
+        return self._date_bodies.get((jmonth, jday)) or (b"[]", json_etag(b"[]"))
+
+occasion_index: Optional[OccasionIndex] = None
+occasion_index_lock = threading.Lock()
+
+def refresh_occasion_index(db: Optional[Session] = None) -> OccasionIndex:
+    """بازخوانی کامل مناسبت‌ها و جایگزینی اتمیک snapshot"""
+    global occasion_index
+    own_session = db is None
+    if own_session:
+        db = SessionLocal()
+    try:
+        index = OccasionIndex(db.query(Occasion).all())
+    finally:
+        if own_session:
+            db.close()
+    with occasion_index_lock:
+        occasion_index = index
+    return index
+
+def get_occasion_index() -> OccasionIndex:
+    index = occasion_index
+    if index is None:
+        # فقط اگر بارگذاری startup انجام نشده باشد
+        index = refresh_occasion_index()
+    return index
+
+async def occasion_index_refresh_loop():
+    """بازخوانی دوره‌ای مناسبت‌ها برای دیدن تغییرات سایر worker ها"""
+    while True:
+        await asyncio.sleep(OCCASION_INDEX_REFRESH_INTERVAL)
+        try:
+            await asyncio.to_thread(refresh_occasion_index)
+        except Exception as e:
+            logger.error(f"خطا در بازخوانی مناسبت‌ها: {e}")
+
+def occasion_date_error(jmonth: int, jday: int) -> Optional[str]:
+    """پیام خطا برای ماه/روز نامعتبر - اسفند در سال کبیسه ۳۰ روز دارد"""
+    if jmonth < 1 or jmonth > 12:
+        return "ماه باید بین ۱ تا ۱۲ باشد"
+    max_day = 31 if jmonth <= 6 else 30
+    if jday < 1 or jday > max_day:
+        return f"روز ماه {JALALI_MONTH_NAMES[jmonth - 1]} باید بین ۱ تا {max_day} باشد"
+    return None
+
 @app.get("/occasions", response_model=Dict[str, List[str]])
-async def get_occasions(db: Session = Depends(get_db)):
+async def get_occasions(request: Request):
     """
     دریافت لیست مناسبت‌ها به فرمت مورد نیاز تقویم
     """
     try:
-        occasions = db.query(Occasion).all()
-        result = {}
-        
-        for occasion in occasions:
-            key = f"{occasion.jmonth}-{occasion.jday}"
-            if key not in result:
-                result[key] = []
-            result[key].append(occasion.title)
-        
-        return result
+        index = get_occasion_index()
+        return cached_json_response(request, index.grouped_body, index.etag)
     except Exception as e:
         logger.error(f"خطا در دریافت مناسبت‌ها: {e}")
         raise HTTPException(
@@ -2715,17 +6275,13 @@ async def get_occasions(db: Session = Depends(get_db)):
         )
 
 @app.get("/occasions/{jmonth}/{jday}", response_model=List[OccasionResponse])
-async def get_occasions_by_date(jmonth: int, jday: int, db: Session = Depends(get_db)):
+async def get_occasions_by_date(jmonth: int, jday: int, request: Request):
     """
     دریافت مناسبت‌های یک تاریخ خاص
     """
     try:
-        occasions = db.query(Occasion).filter(
-            Occasion.jmonth == jmonth,
-            Occasion.jday == jday
-        ).all()
-        
-        return occasions
+        body, etag = get_occasion_index().date_body(jmonth, jday)
+        return cached_json_response(request, body, etag)
     except Exception as e:
         logger.error(f"خطا در دریافت مناسبت‌ها برای تاریخ {jmonth}-{jday}: {e}")
         raise HTTPException(
@@ -2750,16 +6306,11 @@ async def create_occasion(
             )
         
         # اعتبارسنجی تاریخ
-        if occasion.jmonth < 1 or occasion.jmonth > 12:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="ماه باید بین ۱ تا ۱۲ باشد"
-            )
-        
-        if occasion.jday < 1 or occasion.jday > 31:
+        date_error = occasion_date_error(occasion.jmonth, occasion.jday)
+        if date_error:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="روز باید بین ۱ تا ۳۱ باشد"
+                detail=date_error
             )
         
         # بررسی تکراری بودن
@@ -2786,6 +6337,7 @@ async def create_occasion(
         db.add(new_occasion)
         db.commit()
         db.refresh(new_occasion)
+        refresh_occasion_index(db)
         
         logger.info(f"مناسبت جدید ایجاد شد: {occasion.title} در {occasion.jmonth}/{occasion.jday}")
         
@@ -2801,12 +6353,246 @@ async def create_occasion(
             detail="خطای سرور در ایجاد مناسبت"
         )
 
-@app.get("/calendar")
-async def get_calendar_page():
+def build_calendar_month(db: Session, jy: int, jm: int, today) -> dict:
+    """جدول یک ماه جلالی به همراه تعطیلات، مناسبت‌ها و تعداد رویدادهای هر روز"""
+    days_count = jalali_month_length(jy, jm)
+    first_day = jalali_to_gregorian(jy, jm, 1)
+    last_day = first_day + timedelta(days=days_count - 1)
+    event_counts = count_events_per_day(db, first_day, last_day)
+    index = get_occasion_index()
+    
+    days = []
+    for jd in range(1, days_count + 1):
+        gregorian = first_day + timedelta(days=jd - 1)
+        # شنبه = 0 ... جمعه = 6
+        weekday = (gregorian.weekday() + 2) % 7
+        occasions = index.for_date(jm, jd)
+        days.append({
+            "day": jd,
+            "gregorian": gregorian.isoformat(),
+            "weekday": weekday,
+            "is_holiday": weekday == 6 or any(item["is_holiday"] for item in occasions),
+            "occasions": [item["title"] for item in occasions],
+            "event_count": event_counts.get(gregorian, 0)
+        })
+    
+    return {
+        "year": jy,
+        "month": jm,
+        "month_name": JALALI_MONTH_NAMES[jm - 1],
+        "is_leap_year": is_jalali_leap(jy),
+        "first_weekday": days[0]["weekday"],
+        "gregorian_start": first_day.isoformat(),
+        "gregorian_end": last_day.isoformat(),
+        "today": {"year": today[0], "month": today[1], "day": today[2]},
+        "days": days
+    }
+
+def calendar_month_response(request: Request, db: Session, jy: int, jm: int) -> Response:
+    if jm < 1 or jm > 12 or jy < JALALI_BREAKS[0] or jy >= JALALI_BREAKS[-1]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="سال یا ماه نامعتبر است"
+        )
+    
+    today = jalali_today()
+    # ETag مناسبت‌ها در کلید است تا تغییر مناسبت‌ها بدون پاک کردن کش دیده شود
+    cache_key = (jy, jm, today, get_occasion_index().etag)
+    cached = calendar_cache.get(cache_key)
+    if cached is None:
+        body = json_bytes(build_calendar_month(db, jy, jm, today))
+        cached = (body, json_etag(body))
+        calendar_cache.set(cache_key, cached)
+    return cached_json_response(request, *cached)
+
+# ===================== ورود گروهی مناسبت‌ها =====================
+OCCASION_IMPORT_LIMIT = int(os.getenv("MANAREH_OCCASION_IMPORT_LIMIT", "5000"))
+OCCASION_IMPORT_FIELDS = ["jmonth", "jday", "title", "description", "is_holiday"]
+
+def parse_occasion_rows(content: str, file_format: str) -> List[dict]:
+    """خواندن فهرست مناسبت‌ها از CSV (با سطر عنوان) یا آرایه JSON"""
+    if file_format == "csv":
+        reader = csv.DictReader(io.StringIO(content.lstrip("\ufeff")))
+        rows = []
+        for row in reader:
+            item = {field: (row.get(field) or "").strip() for field in OCCASION_IMPORT_FIELDS}
+            item["description"] = item["description"] or None
+            # خالی = تعطیل (مثل مقدار پیش‌فرض مدل)
+            item["is_holiday"] = item["is_holiday"].lower() not in ("0", "false", "no", "خیر")
+            rows.append(item)
+        return rows
+    
+    data = json.loads(content)
+    if not isinstance(data, list):
+        raise ValueError("فایل JSON باید آرایه‌ای از مناسبت‌ها باشد")
+    return data
+
+def validate_occasion_rows(rows: List[dict]) -> List[OccasionCreate]:
+    """اعتبارسنجی همه ردیف‌ها؛ در صورت خطا هیچ ردیفی وارد نمی‌شود"""
+    if not rows:
+        raise ValueError("فهرست مناسبت‌ها خالی است")
+    if len(rows) > OCCASION_IMPORT_LIMIT:
+        raise ValueError(f"حداکثر {OCCASION_IMPORT_LIMIT} مناسبت در هر بار مجاز است")
+    
+    occasions = []
+    errors = []
+    for number, row in enumerate(rows, start=1):
+        try:
+            occasion = OccasionCreate.model_validate(row)
+        except Exception:
+            errors.append(f"ردیف {number}: فرمت نامعتبر")
+            continue
+        occasion.title = occasion.title.strip()
+        date_error = occasion_date_error(occasion.jmonth, occasion.jday)
+        if date_error:
+            errors.append(f"ردیف {number}: {date_error}")
+        elif not occasion.title or len(occasion.title) > 200:
+            errors.append(f"ردیف {number}: عنوان باید بین ۱ تا ۲۰۰ کاراکتر باشد")
+        else:
+            occasions.append(occasion)
+    
+    if errors:
+        raise ValueError("؛ ".join(errors[:10]))
+    return occasions
+
+def upsert_occasions(db: Session, occasions: List[OccasionCreate]) -> int:
     """
-    صفحه HTML تقویم
+    درج/به‌روزرسانی مناسبت‌ها با یک INSERT چندردیفی روی کلید یکتای (jmonth, jday, title)
+    (commit با فراخواننده)
+    """
+    # تکرار در خود فایل: آخرین ردیف معتبر است
+    rows = {}
+    for occasion in occasions:
+        rows[(occasion.jmonth, occasion.jday, occasion.title)] = {
+            "jmonth": occasion.jmonth,
+            "jday": occasion.jday,
+            "title": occasion.title,
+            "description": occasion.description,
+            "is_holiday": True if occasion.is_holiday is None else occasion.is_holiday,
+            "created_at": datetime.utcnow(),
+            "updated_at": datetime.utcnow()
+        }
+    if not rows:
+        return 0
+    
+    stmt = mysql_insert(Occasion).values(list(rows.values()))
+    db.execute(stmt.on_duplicate_key_update(
+        description=stmt.inserted.description,
+        is_holiday=stmt.inserted.is_holiday,
+        updated_at=stmt.inserted.updated_at
+    ))
+    return len(rows)
+
+@app.post("/occasions/import")
+async def import_occasions(
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    ورود گروهی مناسبت‌ها (فقط مدیر)
+    بدنه: آرایه JSON یا CSV (Content-Type: text/csv) با ستون‌های jmonth, jday, title, description, is_holiday
+    """
+    try:
+        if not is_admin(current_user):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="دسترسی غیرمجاز"
+            )
+        
+        file_format = "csv" if "csv" in request.headers.get("content-type", "") else "json"
+        try:
+            content = (await request.body()).decode("utf-8")
+            occasions = validate_occasion_rows(parse_occasion_rows(content, file_format))
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="فایل مناسبت‌ها قابل خواندن نیست"
+            )
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        
+        imported = upsert_occasions(db, occasions)
+        db.commit()
+        index = refresh_occasion_index(db)
+        
+        logger.info(f"{imported} مناسبت وارد شد (کاربر {current_user.id})")
+        return {"received": len(occasions), "imported": imported, "total": index.count}
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        logger.error(f"خطا در ورود گروهی مناسبت‌ها: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="خطای سرور در ورود مناسبت‌ها"
+        )
+
+def import_occasions_cli(path: str) -> int:
+    """
+    ورود مناسبت‌ها از فایل CSV یا JSON:
+        python main.py import-occasions occasions.csv
     """
-    html_content = """
+    file_format = "csv" if path.lower().endswith(".csv") else "json"
+    with open(path, encoding="utf-8") as f:
+        occasions = validate_occasion_rows(parse_occasion_rows(f.read(), file_format))
+    
+    # کلید یکتای (jmonth, jday, title) برای upsert لازم است
+    Base.metadata.create_all(bind=engine)
+    create_missing_indexes()
+    
+    db = SessionLocal()
+    try:
+        imported = upsert_occasions(db, occasions)
+        db.commit()
+        # worker های در حال اجرا در بازخوانی دوره‌ای بعدی تغییرات را می‌بینند
+        index = refresh_occasion_index(db)
+        logger.info(f"{imported} مناسبت از {path} وارد شد (مجموع: {index.count})")
+        return imported
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+@app.get("/calendar/current")
+async def get_current_calendar_month(request: Request, db: Session = Depends(get_read_db)):
+    """
+    جدول ماه جاری تقویم جلالی
+    """
+    try:
+        jy, jm, _ = jalali_today()
+        return calendar_month_response(request, db, jy, jm)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"خطا در ساخت تقویم ماه جاری: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="خطای سرور در دریافت تقویم"
+        )
+
+@app.get("/calendar/{jy}/{jm}")
+async def get_calendar_month(jy: int, jm: int, request: Request, db: Session = Depends(get_read_db)):
+    """
+    جدول یک ماه تقویم جلالی: روزها، تعطیلات، مناسبت‌ها و تعداد رویدادها در یک پاسخ
+    """
+    try:
+        return calendar_month_response(request, db, jy, jm)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"خطا در ساخت تقویم {jy}/{jm}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="خطای سرور در دریافت تقویم"
+        )
+
+# صفحه تقویم سند ثابتی است و مثل فایل‌های static یک بار فشرده می‌شود
+CALENDAR_PAGE_HTML = """
     <!DOCTYPE html>
     <html lang="fa" dir="rtl">
     <head>
@@ -3020,89 +6806,72 @@ async def get_calendar_page():
             <a href="/" class="back-button">بازگشت به سایت</a>
         </div>
         
-        <script src="https://cdn.jsdelivr.net/npm/jalaali-js/dist/jalaali.min.js"></script>
         <script>
-            // دریافت تاریخ امروز
-            let today = new Date();
-            // تبدیل به تاریخ شمسی
-            let jToday = jalaali.toJalaali(today.getFullYear(), today.getMonth() + 1, today.getDate());
-            
-            let year = jToday.jy;
-            let month = jToday.jm;
-            
-            let occasions = {};
-            
-            // بارگذاری مناسبت‌ها از دیتابیس
-            fetch("/occasions")
-                .then(res => res.json())
-                .then(data => {
-                    occasions = data;
-                    render();
-                })
-                .catch(error => {
-                    console.error("خطا در دریافت مناسبت‌ها:", error);
-                    // استفاده از مناسبت‌های پیش‌فرض در صورت خطا
-                    occasions = {
-                        "1-1": ["آغاز سال نو"],
-                        "1-12": ["روز جمهوری اسلامی ایران"],
-                        "1-13": ["روز طبیعت"],
-                        "11-22": ["پیروزی انقلاب اسلامی"],
-                        "3-14": ["رحلت امام خمینی (ره)"],
-                        "12-29": ["روز ملی شدن صنعت نفت"],
-                        "9-17": ["قبولی اعمال (شب هایله القدر)"],
-                        "12-13": ["تولد حضرت علی (ع)"],
-                        "7-27": ["مبعث رسول اکرم"],
-                        "6-15": ["ولادت امام مهدی (عج)"]
-                    };
-                    render();
-                });
+            // جدول ماه (روزها، تعطیلات، مناسبت‌ها و تعداد رویدادها) از سرور دریافت می‌شود
+            let year = null;
+            let month = null;
+            let jToday = null;
             
-            const monthNames = [
-                "فروردین", "اردیبهشت", "خرداد", "تیر", "مرداد", "شهریور",
-                "مهر", "آبان", "آذر", "دی", "بهمن", "اسفند"
-            ];
+            function loadMonth(url) {
+                fetch(url)
+                    .then(res => {
+                        if (!res.ok) throw new Error(res.status);
+                        return res.json();
+                    })
+                    .then(data => {
+                        year = data.year;
+                        month = data.month;
+                        jToday = data.today;
+                        render(data);
+                    })
+                    .catch(error => {
+                        console.error("خطا در دریافت تقویم:", error);
+                        document.getElementById("occasionList").innerHTML =
+                            '<div class="no-occasion">خطا در دریافت تقویم</div>';
+                    });
+            }
             
-            function render() {
+            function render(data) {
                 document.getElementById("monthTitle").innerText =
-                    monthNames[month - 1] + " " + year;
+                    data.month_name + " " + data.year;
                 
                 const daysEl = document.getElementById("days");
                 daysEl.innerHTML = "";
                 
-                const daysCount = jalaali.jalaaliMonthLength(year, month);
-                const firstDay = jalaali.jalaaliToGregorian(year, month, 1);
-                const startDay = new Date(firstDay.gy, firstDay.gm - 1, firstDay.gd).getDay();
-                
                 // روزهای خالی قبل از اول ماه
-                for (let i = 0; i < (startDay + 1) % 7; i++) {
+                for (let i = 0; i < data.first_weekday; i++) {
                     const emptyDiv = document.createElement("div");
                     emptyDiv.className = "day";
                     emptyDiv.style.visibility = "hidden";
                     daysEl.appendChild(emptyDiv);
                 }
                 
-                for (let d = 1; d <= daysCount; d++) {
+                data.days.forEach(dayInfo => {
                     const div = document.createElement("div");
                     div.className = "day";
-                    div.innerText = d;
+                    div.innerText = dayInfo.day;
                     
-                    if (d === jToday.jd && month === jToday.jm && year === jToday.jy) {
+                    if (dayInfo.day === jToday.day && data.month === jToday.month && data.year === jToday.year) {
                         div.classList.add("today");
                     }
                     
-                    const key = `${month}-${d}`;
-                    if (occasions[key]) {
+                    if (dayInfo.is_holiday || dayInfo.occasions.length) {
                         div.classList.add("holiday");
-                        div.title = occasions[key].join("، ");
                     }
                     
+                    const hints = dayInfo.occasions.slice();
+                    if (dayInfo.event_count) {
+                        hints.push(dayInfo.event_count + " رویداد");
+                    }
+                    div.title = hints.join("، ");
+                    
                     div.onclick = () => {
                         document.querySelectorAll(".day").forEach(x => x.classList.remove("selected"));
                         div.classList.add("selected");
                         
                         const occasionListEl = document.getElementById("occasionList");
-                        if (occasions[key]) {
-                            occasionListEl.innerHTML = occasions[key].map(occasion => 
+                        if (dayInfo.occasions.length) {
+                            occasionListEl.innerHTML = dayInfo.occasions.map(occasion => 
                                 `<div class="occasion-item">${occasion}</div>`
                             ).join("");
                         } else {
@@ -3111,7 +6880,7 @@ async def get_calendar_page():
                     };
                     
                     daysEl.appendChild(div);
-                }
+                });
                 
                 // انتخاب امروز به صورت خودکار
                 setTimeout(() => {
@@ -3123,27 +6892,89 @@ async def get_calendar_page():
             }
             
             function nextMonth() {
-                month++;
-                if (month > 12) { 
-                    month = 1; 
-                    year++; 
+                if (year === null) return;
+                let y = year, m = month + 1;
+                if (m > 12) { 
+                    m = 1; 
+                    y++; 
                 }
-                render();
+                loadMonth(`/calendar/${y}/${m}`);
             }
             
             function prevMonth() {
-                month--;
-                if (month < 1) { 
-                    month = 12; 
-                    year--; 
+                if (year === null) return;
+                let y = year, m = month - 1;
+                if (m < 1) { 
+                    m = 12; 
+                    y--; 
                 }
-                render();
+                loadMonth(`/calendar/${y}/${m}`);
             }
+            
+            loadMonth("/calendar/current");
         </script>
     </body>
     </html>
     """
-    return HTMLResponse(content=html_content)
+calendar_page_asset = StaticAsset("calendar.html", CALENDAR_PAGE_HTML.encode("utf-8"), "text/html")
+
+@app.get("/calendar")
+async def get_calendar_page(request: Request):
+    """
+    صفحه HTML تقویم
+    """
+    return static_asset_response(request, calendar_page_asset)
+
+async def series_extension_loop():
+    """ادامه ساخت نوبت‌های سری‌های تکراری در پس‌زمینه"""
+    while True:
+        try:
+            await asyncio.to_thread(extend_series_horizons)
+        except Exception as e:
+            logger.error(f"خطا در ادامه ساخت نوبت‌های سری: {e}")
+        await asyncio.sleep(SERIES_EXTEND_INTERVAL)
+
+async def notification_fanout_loop():
+    """اجرای کارهای ارسال گروهی در پس‌زمینه - با ثبت کار جدید فوراً بیدار می‌شود"""
+    while True:
+        try:
+            await asyncio.to_thread(process_fanout_jobs)
+        except Exception as e:
+            logger.error(f"خطا در اجرای ارسال گروهی: {e}")
+        try:
+            await asyncio.wait_for(fanout_wakeup.wait(), timeout=FANOUT_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        fanout_wakeup.clear()
+
+async def notification_archive_loop():
+    """بایگانی دوره‌ای نوتیفیکیشن‌های خوانده‌شده قدیمی در پس‌زمینه"""
+    while True:
+        try:
+            await asyncio.to_thread(archive_old_notifications)
+        except Exception as e:
+            logger.error(f"خطا در بایگانی نوتیفیکیشن‌ها: {e}")
+        await asyncio.sleep(NOTIFICATION_ARCHIVE_INTERVAL)
+
+async def analytics_rollup_loop():
+    """به‌روزرسانی دوره‌ای جدول آمار روزانه در پس‌زمینه"""
+    while True:
+        try:
+            processed = await asyncio.to_thread(run_analytics_rollups)
+            if processed:
+                logger.info(f"آمار روزانه به‌روز شد (بازه {processed} شناسه)")
+        except Exception as e:
+            logger.error(f"خطا در به‌روزرسانی آمار روزانه: {e}")
+        await asyncio.sleep(ANALYTICS_ROLLUP_INTERVAL)
+
+async def replica_health_loop():
+    """بررسی دوره‌ای سلامت replica ها در پس‌زمینه"""
+    while True:
+        try:
+            await asyncio.to_thread(replica_set.check_health)
+        except Exception as e:
+            logger.error(f"خطا در بررسی سلامت replica ها: {e}")
+        await asyncio.sleep(DB_REPLICA_CHECK_INTERVAL)
 
 @app.on_event("startup")
 async def startup_event():
@@ -3156,6 +6987,50 @@ async def startup_event():
         # ایجاد جداول دیتابیس
         create_tables()
         
+        # گرم کردن connection pool
+        warmed = warm_up_pool(engine, DB_POOL_WARMUP)
+        logger.info(f"🔌 {warmed} اتصال دیتابیس از پیش باز شد")
+        
+        # health check دوره‌ای replica ها
+        if replica_set.replicas:
+            for replica in replica_set.replicas:
+                warm_up_pool(replica["engine"], DB_POOL_WARMUP)
+            asyncio.create_task(replica_health_loop())
+            logger.info(f"📚 {len(replica_set.replicas)} replica برای خواندن فعال است")
+        
+        # کانال push نوتیفیکیشن‌ها
+        notification_hub.bind_loop(asyncio.get_running_loop())
+        notification_broker.start()
+        logger.info(f"📣 broker نوتیفیکیشن: {notification_broker.name}")
+        
+        # worker ارسال گروهی نوتیفیکیشن
+        global fanout_wakeup
+        fanout_wakeup = asyncio.Event()
+        asyncio.create_task(notification_fanout_loop())
+        
+        # فایل‌های static از پیش فشرده
+        assets = await asyncio.to_thread(get_static_assets)
+        encodings = ", ".join(STATIC_ENCODERS)
+        logger.info(f"🗜️ {len(assets)} فایل static بارگذاری شد ({encodings})")
+        
+        # فهرست مناسبت‌ها در حافظه
+        index = await asyncio.to_thread(refresh_occasion_index)
+        logger.info(f"📅 {index.count} مناسبت در حافظه بارگذاری شد")
+        if OCCASION_INDEX_REFRESH_INTERVAL > 0:
+            asyncio.create_task(occasion_index_refresh_loop())
+        
+        # آمار تجمیعی روزانه
+        if ANALYTICS_ROLLUP_INTERVAL > 0:
+            asyncio.create_task(analytics_rollup_loop())
+        
+        # بایگانی نوتیفیکیشن‌های قدیمی
+        if NOTIFICATION_RETENTION_DAYS > 0:
+            asyncio.create_task(notification_archive_loop())
+        
+        # ساخت تدریجی نوبت‌های رویدادهای تکراری
+        if RECURRENCE_HORIZON_DAYS > 0:
+            asyncio.create_task(series_extension_loop())
+        
         # بررسی اتصال دیتابیس
         db = SessionLocal()
         users_count = db.query(User).count()
@@ -3191,6 +7066,7 @@ async def startup_event():
                 price=0.0
             )
             db.add(test_event)
+            adjust_user_summary(db, test_user.id, events_created=1)
             db.commit()
             logger.info("رویداد تستی ایجاد شد")
         
@@ -3261,5 +7137,24 @@ async def startup_event():
         db.close()
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "build-static":
+        print(f"{build_static_cli()} فایل فشرده در {STATIC_DIR} ساخته شد")
+        sys.exit(0)
+    
+    if len(sys.argv) > 1 and sys.argv[1] == "dedupe-unique-indexes":
+        print(f"{dedupe_unique_indexes()} ردیف تکراری حذف و شمارنده‌ها دوباره شمرده شدند")
+        sys.exit(0)
+    
+    if len(sys.argv) > 1 and sys.argv[1] == "import-occasions":
+        if len(sys.argv) != 3:
+            print("استفاده: python main.py import-occasions <file.csv|file.json>")
+            sys.exit(2)
+        try:
+            import_occasions_cli(sys.argv[2])
+        except (ValueError, OSError) as e:
+            print(f"خطا: {e}")
+            sys.exit(1)
+        sys.exit(0)
+    
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,40 @@
+"""
+بررسی پلن کوئری‌های پرتکرار روی MySQL واقعی: MySQL باید ایندکس مورد انتظار را انتخاب کند و اسکن کامل نکند
+
+اجرا (بدون دسترسی به MySQL رد می‌شود):
+    python -m pytest -q tests/test_index_plans.py
+"""
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("pymysql")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+
+@pytest.fixture(scope="module")
+def db():
+    session = main.SessionLocal()
+    try:
+        session.execute(text("SELECT 1"))
+    except Exception as e:
+        session.close()
+        pytest.skip(f"MySQL در دسترس نیست: {e}")
+    yield session
+    session.close()
+
+@pytest.mark.parametrize(
+    "query,expected_index",
+    [(query, expected_index) for _, query, expected_index in main.INDEX_PROBES],
+    ids=[name for name, _, _ in main.INDEX_PROBES]
+)
+def test_query_uses_expected_index(db, query, expected_index):
+    plan = main.explain_index_probe(db, query)
+    assert plan["key"] == expected_index, plan
+    assert plan["access_type"] != "ALL", plan